@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from storage import DATA_FOLDER, data_version
+
+# NASA POWER solar data has a resolution of about 0.5 degree, a coarser start rarely misses any variation
+DEFAULT_COARSE_INTERVAL = 0.5
+# Relative mean absolute difference of irradiance below which two cells are considered the same
+DEFAULT_TOLERANCE = 0.02
+
+
+def aliases_path(start_date, end_date, data_folder=None):
+    return os.path.join(data_folder or DATA_FOLDER, f"grid_aliases_{data_version(start_date, end_date)}.json")
+
+
+def load_aliases(start_date, end_date, data_folder=None):
+    """
+    Loads the cells of a date range that are stored as a reference to another cell.
+    :return: Dictionary {(latitude, longitude): (source latitude, source longitude)}
+    """
+    path = aliases_path(start_date, end_date, data_folder)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return {(lat, lon): (source_lat, source_lon) for lat, lon, source_lat, source_lon in json.load(file)}
+
+
+def save_aliases(aliases, start_date, end_date, data_folder=None, stored=()):
+    """
+    Merges aliases into the ones saved for a date range, a list of [latitude, longitude, source latitude,
+    source longitude], so a run over part of the grid keeps the aliases of the other cells.
+    :param stored: Cells that now hold data of their own, their previous aliases are dropped
+    """
+    merged = load_aliases(start_date, end_date, data_folder)
+    for cell in stored:
+        merged.pop(cell, None)
+    merged.update(aliases)
+
+    path = aliases_path(start_date, end_date, data_folder)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump([[lat, lon, source[0], source[1]] for (lat, lon), source in merged.items()], file)
+    return path
+
+
+def expand_aliases(df, aliases):
+    """
+    Adds the rows of the aliased cells to a combined DataFrame by copying the rows of their source cell,
+    so the result has every cell of the uniform grid.
+    """
+    if not aliases:
+        return df
+    table = pd.DataFrame([(lat, lon, source_lat, source_lon) for (lat, lon), (source_lat, source_lon) in aliases.items()],
+                         columns=['Latitude', 'Longitude', 'Source_latitude', 'Source_longitude']).round(6)
+    sources = df.assign(Source_latitude=df['Latitude'].round(6), Source_longitude=df['Longitude'].round(6))
+    sources = sources.drop(columns=['Latitude', 'Longitude'])
+    copies = sources.merge(table, on=['Source_latitude', 'Source_longitude'])
+    copies = copies.drop(columns=['Source_latitude', 'Source_longitude'])[df.columns]
+
+    # A cell that is now an alias may still have stale or empty rows of its own
+    own = pd.MultiIndex.from_arrays([df['Latitude'].round(6), df['Longitude'].round(6)])
+    aliased = own.isin(pd.MultiIndex.from_frame(table[['Latitude', 'Longitude']]))
+    return pd.concat([df[~aliased], copies], ignore_index=True)
+
+
+def series_difference(a, b):
+    """
+    Relative mean absolute difference between two irradiance series over their common hours.
+    :return: 0 for identical series, inf when they share no hour
+    """
+    a, b = a.align(b, join='inner')
+    valid = a.notna().to_numpy() & b.notna().to_numpy()
+    if not valid.any():
+        return np.inf
+    x = a.to_numpy(dtype=np.float64)[valid]
+    y = b.to_numpy(dtype=np.float64)[valid]
+    scale = np.mean(np.abs(x) + np.abs(y)) / 2
+    return float(np.mean(np.abs(x - y)) / scale) if scale > 0 else 0.0
+
+
+def refine_grid(latitudes, longitudes, fetch_cells, coarse_step, tolerance=DEFAULT_TOLERANCE):
+    """
+    Quadtree refinement over a lattice. The corners of coarse squares are fetched first; a square whose corners
+    agree within tolerance is not refined and its inner cells become aliases of the nearest corner, the others are
+    split in four. The midpoint of an edge whose two ends agree is not fetched either but taken from one end, and
+    so is the centre of a split square when two opposite edge midpoints agree. This assumes cells with the same
+    data form convex areas, which holds for the rectangular pixels NASA POWER data comes in.
+    :param latitudes: Sorted lattice latitudes
+    :param longitudes: Sorted lattice longitudes
+    :param fetch_cells: Function taking a list of (latitude, longitude) cells and returning
+                        {cell: irradiance Series} for the cells it could get
+    :param coarse_step: Number of lattice steps between two coarse lines
+    :return: (signatures of the fetched cells, aliases {cell: source cell})
+    """
+    def lines(n):
+        return sorted(set(range(0, n, coarse_step)) | {n - 1})
+
+    def cell(i, j):
+        return latitudes[i], longitudes[j]
+
+    lat_lines, lon_lines = lines(len(latitudes)), lines(len(longitudes))
+    squares = [(i0, i1, j0, j1) for i0, i1 in zip(lat_lines, lat_lines[1:] or lat_lines)
+               for j0, j1 in zip(lon_lines, lon_lines[1:] or lon_lines)]
+    # Signatures of the fetched cells and of the inferred ones, which point at a fetched source cell
+    known = {}
+    sources = {}
+    requested = set()
+    assigned = {}
+
+    def fetch(cells):
+        new = sorted(set(cells) - requested)
+        requested.update(new)
+        known.update(fetch_cells(new))
+        return len(new)
+
+    def same(a, b):
+        return a in known and b in known and series_difference(known[a], known[b]) <= tolerance
+
+    def infer(target, ends):
+        # Takes the data of a cell from the first pair of ends that agree, otherwise asks for a fetch
+        if target in known or target in requested:
+            return None
+        for a, b in ends:
+            if same(a, b):
+                known[target] = known[a]
+                sources[target] = sources.get(a, a)
+                return None
+        return target
+
+    fetched = fetch(cell(i, j) for i0, i1, j0, j1 in squares for i in (i0, i1) for j in (j0, j1))
+    level = 0
+    while squares:
+        print(f"Refinement level {level}: {len(squares)} squares, {fetched} new cells fetched")
+        splits = []
+        for i0, i1, j0, j1 in squares:
+            if i1 - i0 <= 1 and j1 - j0 <= 1:
+                continue
+            corners = [cell(i, j) for i in (i0, i1) for j in (j0, j1)]
+            if all(same(corners[0], corner) for corner in corners[1:]):
+                for i in range(i0, i1 + 1):
+                    for j in range(j0, j1 + 1):
+                        corner = cell(i1 if i - i0 > i1 - i else i0, j1 if j - j0 > j1 - j else j0)
+                        assigned.setdefault(cell(i, j), sources.get(corner, corner))
+                continue
+            splits.append((i0, i1, j0, j1, (i0 + i1) // 2, (j0 + j1) // 2))
+
+        # Edge midpoints first, the centres can then be inferred from them
+        missing = []
+        for i0, i1, j0, j1, im, jm in splits:
+            if j1 - j0 > 1:
+                missing += [infer(cell(i, jm), [(cell(i, j0), cell(i, j1))]) for i in (i0, i1)]
+            if i1 - i0 > 1:
+                missing += [infer(cell(im, j), [(cell(i0, j), cell(i1, j))]) for j in (j0, j1)]
+        fetched = fetch(target for target in missing if target is not None)
+
+        missing = [infer(cell(im, jm), [(cell(im, j0), cell(im, j1)), (cell(i0, jm), cell(i1, jm))])
+                   for i0, i1, j0, j1, im, jm in splits if i1 - i0 > 1 and j1 - j0 > 1]
+        fetched += fetch(target for target in missing if target is not None)
+
+        squares = []
+        for i0, i1, j0, j1, im, jm in splits:
+            for a0, a1 in ((i0, im), (im, i1)) if i1 - i0 > 1 else ((i0, i1),):
+                for b0, b1 in ((j0, jm), (jm, j1)) if j1 - j0 > 1 else ((j0, j1),):
+                    squares.append((a0, a1, b0, b1))
+        level += 1
+
+    # A fetched cell keeps its own data, even when a neighbouring square was found uniform
+    signatures = {target: known[target] for target in requested if target in known}
+    aliases = {target: source for target, source in {**assigned, **sources}.items()
+               if target not in signatures and source in signatures}
+    return signatures, aliases
+
+
+def frame_fingerprint(df):
+    """
+    SHA-1 of the column names, dtypes and values of a DataFrame, in row order; the index is left out.
+    """
+    digest = hashlib.sha1()
+    for column in df.columns:
+        values = np.ascontiguousarray(df[column].to_numpy())
+        digest.update(f"{column}:{values.dtype}:{len(values)};".encode('utf-8'))
+        digest.update(values.tobytes() if values.dtype != object else repr(values.tolist()).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DeduplicatingSink:
+    """
+    Sink wrapper that stores each distinct cleaned series once: a cell whose data is identical to a cell
+    persisted before becomes an alias of it instead of a new file. Frames are matched by fingerprint and then
+    compared value by value, so only true copies are aliased. It also keeps the irradiance series of
+    every cell it sees for the refinement decisions.
+    """
+
+    def __init__(self, sink, value_column='Solar_Irradiance'):
+        self.sink = sink
+        self.value_column = value_column
+        self.signatures = {}
+        self.aliases = {}
+        self.stored = []
+        # Fingerprint -> [(cell, frame)] of the frames persisted so far
+        self._fingerprints = {}
+
+    def __call__(self, latitude, longitude, df):
+        self.signatures[(latitude, longitude)] = df.set_index('DateTime')[self.value_column].astype(np.float32)
+        frame = df.reset_index(drop=True)
+        candidates = self._fingerprints.setdefault(frame_fingerprint(frame), [])
+        for source, source_frame in candidates:
+            if frame.equals(source_frame):
+                self.aliases[(latitude, longitude)] = source
+                return
+        candidates.append(((latitude, longitude), frame))
+        self.stored.append((latitude, longitude))
+        self.sink(latitude, longitude, df)
+
+
+def adaptive_download(cells, start_date, end_date, sink, run, load_existing=None,
+                      coarse_interval=DEFAULT_COARSE_INTERVAL, interval=None, tolerance=DEFAULT_TOLERANCE,
+                      data_folder=None):
+    """
+    Downloads a grid adaptively: see refine_grid for the sampling and DeduplicatingSink for the storage.
+    The aliases of both are saved next to the data, load_cleaned_solar_data expands them.
+    :param cells: Full lattice, as build_grid returns it
+    :param sink: Function (latitude, longitude, df) persisting one cleaned cell
+    :param run: Function (cells, sink) fetching, cleaning and persisting cells, e.g. a partial of run_pipeline
+    :param load_existing: Optional function (latitude, longitude) returning the irradiance Series of a cell already
+                          stored, or None, so stored cells are not fetched again
+    :param interval: Lattice step (degree), used to turn coarse_interval into a number of steps
+    :return: Dictionary with the numbers of lattice cells, fetched cells and aliases
+    """
+    latitudes = sorted({lat for lat, _ in cells})
+    longitudes = sorted({lon for _, lon in cells})
+    interval = interval or (latitudes[1] - latitudes[0] if len(latitudes) > 1 else coarse_interval)
+    # Halving a power of two step always lands on lattice lines
+    coarse_step = 2 ** max(int(np.floor(np.log2(max(coarse_interval / interval, 1)))), 0)
+
+    deduplicating = DeduplicatingSink(sink)
+    previous_aliases = load_aliases(start_date, end_date, data_folder)
+    fetched = 0
+
+    def fetch_cells(new_cells):
+        nonlocal fetched
+        signatures = {}
+        to_fetch = []
+        for lat, lon in new_cells:
+            source = previous_aliases.get((lat, lon))
+            series = load_existing(*(source or (lat, lon))) if load_existing is not None else None
+            if series is None:
+                to_fetch.append((lat, lon))
+            else:
+                signatures[(lat, lon)] = series
+                if source is not None:
+                    deduplicating.aliases[(lat, lon)] = source
+        if to_fetch:
+            run(to_fetch, deduplicating)
+            fetched += len(to_fetch)
+        signatures.update({cell: deduplicating.signatures[cell] for cell in to_fetch
+                           if cell in deduplicating.signatures})
+        return signatures
+
+    _, refined = refine_grid(latitudes, longitudes, fetch_cells, coarse_step, tolerance)
+    # Identical cells point at the copy that was stored, so aliases of aliases are resolved here
+    aliases = dict(deduplicating.aliases)
+    for target, source in refined.items():
+        aliases[target] = aliases.get(source, source)
+    save_aliases(aliases, start_date, end_date, data_folder, stored=deduplicating.stored)
+
+    counts = {'cells': len(cells), 'fetched': fetched, 'aliases': len(aliases)}
+    print(f"Adaptive grid: {counts['fetched']} of {counts['cells']} cells fetched, "
+          f"{counts['aliases']} stored as aliases")
+    return counts
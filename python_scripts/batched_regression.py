@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from model import assign_season, RESULT_COLUMNS, MIN_ROWS_PER_MODEL
+from instrumentation import timed, count
+
+FEATURES = ['Temperature', 'Solar_zenith_angle']
+TARGET = 'Solar_Irradiance'
+GROUP_COLUMNS = ['Latitude', 'Longitude', 'Season_Encoded']
+
+
+def design_matrix(x):
+    """
+    Prepends the intercept column to the feature matrix.
+    :param x: Array of shape (rows, features)
+    :return: Array of shape (rows, features + 1)
+    """
+    return np.column_stack([np.ones(len(x)), x])
+
+
+def grouped_sufficient_statistics(codes, x, y, n_groups, weights=None):
+    """
+    Accumulates the normal-equation terms of every group in one pass over the rows.
+    :param codes: Group index of each row (0 .. n_groups - 1)
+    :param x: Feature matrix of shape (rows, features), without the intercept column
+    :param y: Target values
+    :param weights: Optional row weights
+    :return: Tuple (XtX of shape (groups, p, p), Xty of shape (groups, p), yty of shape (groups,), n of shape (groups,))
+             with p = features + 1
+    """
+    a = design_matrix(x)
+    p = a.shape[1]
+    w = np.ones(len(y)) if weights is None else weights
+
+    xtx = np.empty((n_groups, p, p))
+    for i in range(p):
+        for j in range(i, p):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(codes, weights=w * a[:, i] * a[:, j], minlength=n_groups)
+    xty = np.stack([np.bincount(codes, weights=w * a[:, i] * y, minlength=n_groups) for i in range(p)], axis=1)
+    yty = np.bincount(codes, weights=w * y * y, minlength=n_groups)
+    n = np.bincount(codes, weights=w, minlength=n_groups)
+
+    return xtx, xty, yty, n
+
+
+def solve_normal_equations(xtx, xty):
+    """
+    Solves every group's normal equations at once. The features are centred on their group means and scaled
+    to unit spread first, so raw magnitudes (angles in degrees next to the intercept column) do not make the
+    systems ill-conditioned; the intercept is recovered from the means afterwards. Only the groups whose
+    system is singular (for instance a constant feature) fall back to the pseudo-inverse, which gives the
+    minimum-norm least-squares solution.
+    :param xtx: Sums of shape (groups, p, p) from grouped_sufficient_statistics, intercept column first
+    :param xty: Sums of shape (groups, p)
+    :return: Coefficients of shape (groups, p), intercept first
+    """
+    n = xtx[:, 0, 0]
+    means = xtx[:, 0, 1:] / n[:, None]
+    y_mean = xty[:, 0] / n
+    scatter = xtx[:, 1:, 1:] - n[:, None, None] * means[:, :, None] * means[:, None, :]
+    cross = xty[:, 1:] - n[:, None] * means * y_mean[:, None]
+
+    # A feature whose spread is rounding noise of its sums is constant in the group, it is left out of the fit
+    variance = np.diagonal(scatter, axis1=1, axis2=2)
+    varying = variance > 1e-12 * np.diagonal(xtx, axis1=1, axis2=2)[:, 1:]
+    spread = np.where(varying, np.sqrt(np.where(varying, variance, 1.0)), 1.0)
+    scaled = scatter / (spread[:, :, None] * spread[:, None, :]) * (varying[:, :, None] & varying[:, None, :])
+    scaled_cross = cross / spread * varying
+
+    slopes = np.zeros_like(cross)
+    singular = np.linalg.matrix_rank(scaled) < scaled.shape[1] if len(scaled) else np.zeros(0, dtype=bool)
+    if (~singular).any():
+        slopes[~singular] = np.linalg.solve(scaled[~singular], scaled_cross[~singular][..., None])[..., 0]
+    if singular.any():
+        slopes[singular] = np.einsum('gij,gj->gi', np.linalg.pinv(scaled[singular]), scaled_cross[singular])
+    slopes /= spread
+
+    intercept = y_mean - np.einsum('gi,gi->g', means, slopes)
+    return np.column_stack([intercept, slopes])
+
+
+def grouped_test_mask(codes, n_groups, test_size=0.2, random_state=4):
+    """
+    Splits every group at once: rows are shuffled with a seeded permutation, ranked within their group in that
+    order, and the first ceil(test_size * group rows) of each group go to the test set.
+    :param codes: Group index of each row (0 .. n_groups - 1)
+    :return: Boolean array, True for the test rows
+    """
+    shuffled = np.random.default_rng(random_state).permutation(len(codes))
+    order = shuffled[np.argsort(codes[shuffled], kind='stable')]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - starts[codes[order]]
+    return ranks < np.ceil(test_size * sizes)[codes]
+
+
+@timed('fit_grouped_least_squares')
+def fit_grouped_least_squares(df, test_size=0.2, random_state=4):
+    """
+    Fits one linear regression of Solar_Irradiance on Temperature and Solar_zenith_angle per (site, season)
+    with the closed-form normal equations, for all groups in a single vectorised pass.
+    Rows are filtered as in feature_engineering and each group is split like train_test_split: exactly
+    ceil(test_size * group rows) rows, drawn at random, go to the test set. The coefficients equal those of
+    LinearRegression fitted on the same training rows, and R², MAE and MSE are computed on the test rows as in
+    evaluate_model.
+    :param df: Multi-site DataFrame, see model.train_by_site_and_season
+    :return: DataFrame with the columns of model.RESULT_COLUMNS
+    """
+    if 'Season_Encoded' not in df.columns:
+        df = assign_season(df)
+
+    # Same row filter as feature_engineering, applied as a single mask
+    values = df[FEATURES + [TARGET, 'Season_Encoded']]
+    mask = values.notna().all(axis=1).to_numpy() & (df[TARGET].to_numpy() != 0.0)
+    rows = df.loc[mask, GROUP_COLUMNS + FEATURES + [TARGET]]
+    count('rows_trained', len(rows))
+
+    grouper = rows.groupby(GROUP_COLUMNS, sort=True)
+    codes = grouper.ngroup().to_numpy()
+    keys = grouper.size().index.to_frame(index=False)
+    n_groups = len(keys)
+
+    x = rows[FEATURES].to_numpy(dtype=np.float64)
+    y = rows[TARGET].to_numpy(dtype=np.float64)
+    test = grouped_test_mask(codes, n_groups, test_size, random_state)
+    train = ~test
+
+    # Features are centred on the training means of their group before the sums are taken, so large offsets do
+    # not cost precision; the intercept is moved back to the raw features once solved
+    n_train = np.bincount(codes[train], minlength=n_groups).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centres = np.stack([np.bincount(codes[train], weights=x[train, i], minlength=n_groups)
+                            for i in range(len(FEATURES))], axis=1) / n_train[:, None]
+    x_centred = x - np.nan_to_num(centres)[codes]
+    xtx, xty, _, _ = grouped_sufficient_statistics(codes[train], x_centred[train], y[train], n_groups)
+    valid = n_train >= len(FEATURES) + 1
+    coefficients = np.full((n_groups, len(FEATURES) + 1), np.nan)
+    coefficients[valid] = solve_normal_equations(xtx[valid], xty[valid])
+    coefficients[:, 0] -= np.einsum('gi,gi->g', np.nan_to_num(centres), coefficients[:, 1:])
+
+    # Test metrics, accumulated per group from the residuals of the test rows
+    test_codes = codes[test]
+    y_test = y[test]
+    y_pred = np.einsum('ij,ij->i', design_matrix(x[test]), coefficients[test_codes])
+    residuals = y_test - y_pred
+    n_test = np.bincount(test_codes, minlength=n_groups).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mae = np.bincount(test_codes, weights=np.abs(residuals), minlength=n_groups) / n_test
+        sse = np.bincount(test_codes, weights=residuals ** 2, minlength=n_groups)
+        mse = sse / n_test
+        mean_test = np.bincount(test_codes, weights=y_test, minlength=n_groups) / n_test
+        sst = np.bincount(test_codes, weights=y_test ** 2, minlength=n_groups) - n_test * mean_test ** 2
+        r2 = 1 - sse / sst
+
+    results = keys.assign(
+        Intercept=coefficients[:, 0],
+        Coef_Temperature=coefficients[:, 1],
+        Coef_Solar_zenith_angle=coefficients[:, 2],
+        R2=r2,
+        MAE=mae,
+        MSE=mse,
+        N_train=n_train.astype(np.int64),
+        N_test=n_test.astype(np.int64),
+    )
+    keep = valid & (n_test > 0) & (n_train + n_test >= MIN_ROWS_PER_MODEL)
+    results = results[keep].reset_index(drop=True)
+    results['Season_Encoded'] = results['Season_Encoded'].astype(int)
+
+    return results[RESULT_COLUMNS]
@@ -0,0 +1,301 @@
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_cleaner import clean_solar_data, clean_solar_data_fast, clean_solar_data_all, clean_solar_data_map
+from model import train_by_site_and_season, assign_season, train_and_evaluate_by_season
+from features import add_calendar_features, season_codes
+from solar_geometry import solar_zenith_angle
+from batched_regression import fit_grouped_least_squares
+from heatmap_frames import aggregate_frames, build_heatmap_figure
+from compact_dataset import CompactDataset
+from synthetic_data import generate_payload, generate_grid, write_cleaned_grid
+
+BASELINE_PATH = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'benchmarks',
+                             'baseline.json')
+
+
+def time_function(function, *args, repeat=3, **kwargs):
+    """
+    Runs a function several times and returns the best wall-clock time in seconds together with its last result.
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def peak_memory(function, *args, **kwargs):
+    """
+    Runs a function once under tracemalloc and returns the peak traced memory in bytes together with its result.
+    Tracing slows the code down, so it is kept out of the timed runs.
+    """
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def benchmark_cleaning(years_list=(1, 10, 30), repeat=3):
+    """
+    Compares clean_solar_data with clean_solar_data_fast on synthetic hourly data and checks both give the same frame.
+    :return: DataFrame with one row per data size
+    """
+    rows = []
+    for years in years_list:
+        payload = generate_payload(years)
+        current, expected = time_function(clean_solar_data, payload, repeat=repeat)
+        fast, result = time_function(clean_solar_data_fast, payload, repeat=repeat)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        rows.append({'years': years, 'rows': len(result), 'clean_solar_data_s': current,
+                     'clean_solar_data_fast_s': fast, 'speedup': current / fast})
+        print(f"{years} year(s): {current:.3f}s -> {fast:.3f}s ({current / fast:.1f}x)")
+
+    return pd.DataFrame(rows)
+
+
+def multi_site_frame(sites, years=1):
+    """
+    Builds a cleaned multi-site frame, as load_cleaned_solar_data returns it, from synthetic payloads.
+    """
+    frames = []
+    for site in range(sites):
+        frame = clean_solar_data_all(generate_payload(years, seed=site))
+        frame['Latitude'] = 50.0 + (site // 100) * 0.5
+        frame['Longitude'] = (site % 100) * 0.5
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def benchmark_batched_fit(sites=200, repeat=1):
+    """
+    Compares the process-pool scikit-learn training with the batched normal-equation fit.
+    """
+    df = multi_site_frame(sites)
+    pool, _ = time_function(train_by_site_and_season, df, repeat=repeat)
+    batched, results = time_function(fit_grouped_least_squares, df, repeat=repeat)
+    print(f"{sites} sites, {len(results)} models: {pool:.3f}s -> {batched:.3f}s ({pool / batched:.1f}x)")
+
+    return pd.DataFrame([{'sites': sites, 'models': len(results), 'train_by_site_and_season_s': pool,
+                          'fit_grouped_least_squares_s': batched, 'speedup': pool / batched}])
+
+
+def _season_by_apply(df):
+    # Per-row season mapping as model.assign_season used to do it, kept as the reference for benchmark_calendar_features
+    def get_season(month):
+        if month in [12, 1, 2]:
+            return 1
+        elif month in [3, 4, 5]:
+            return 2
+        elif month in [6, 7, 8]:
+            return 3
+        elif month in [9, 10, 11]:
+            return 4
+    return df['DateTime'].dt.month.apply(get_season)
+
+
+def benchmark_calendar_features(rows=2_000_000, sites=1000, reference_rows=1_000_000):
+    """
+    Times add_calendar_features on a multi-site frame of the given size, and compares it with the per-row
+    season apply on reference_rows rows (the apply is too slow to run on the full size).
+    :param rows: Rows of the frame; the default runs in seconds, pass e.g. 100_000_000 on a machine with enough
+                 memory to time the full-size case
+    """
+    reference_rows = min(reference_rows, rows)
+    hours_per_site = rows // sites
+    start = np.datetime64('2000-01-01T00', 'h')
+    frame = pd.DataFrame({
+        'DateTime': np.tile(np.arange(start, start + hours_per_site), sites).astype('datetime64[ns]'),
+        'Latitude': np.repeat(np.linspace(-60, 60, sites, dtype=np.float32), hours_per_site),
+    })
+
+    vectorised, _ = time_function(add_calendar_features, frame, repeat=1)
+    sample = frame.iloc[:reference_rows].copy()
+    apply_time, expected = time_function(_season_by_apply, sample, repeat=1)
+    lookup_time, seasons = time_function(season_codes, sample['DateTime'], repeat=1)
+    assert (seasons == expected.to_numpy()).all()
+
+    print(f"{len(frame)} rows: add_calendar_features {vectorised:.2f}s")
+    print(f"{reference_rows} rows: season apply {apply_time:.3f}s -> lookup {lookup_time:.3f}s "
+          f"({apply_time / lookup_time:.1f}x)")
+
+    return pd.DataFrame([{'rows': len(frame), 'add_calendar_features_s': vectorised,
+                          'reference_rows': reference_rows, 'season_apply_s': apply_time,
+                          'season_lookup_s': lookup_time}])
+
+
+def benchmark_solar_geometry(grid_size=50, year=2023):
+    """
+    Times the zenith angle of every hour of a year over a grid_size x grid_size grid in one broadcast call.
+    """
+    hours = np.arange(np.datetime64(f'{year}-01-01T00', 'h'), np.datetime64(f'{year + 1}-01-01T00', 'h'))
+    latitudes = np.linspace(50, 52, grid_size)
+    longitudes = np.linspace(-1, 1, grid_size)
+    elapsed, zenith = time_function(solar_zenith_angle, hours[:, None, None], latitudes[None, :, None],
+                                    longitudes[None, None, :], repeat=1)
+    print(f"{zenith.size} zenith angles ({grid_size}x{grid_size} grid x {len(hours)} hours) in {elapsed:.2f}s")
+
+    return pd.DataFrame([{'values': zenith.size, 'solar_zenith_angle_s': elapsed}])
+
+
+def benchmark_compact_dataset(sites=500, years=1):
+    """
+    Compares the memory of the long multi-site frame with the CompactDataset holding the same data,
+    and the time to get one site's series from each.
+    """
+    df = multi_site_frame(sites, years)
+    dataset = CompactDataset.from_frame(df)
+    latitude, longitude = df['Latitude'].iloc[-1], df['Longitude'].iloc[-1]
+
+    long_bytes = df.memory_usage(deep=True).sum()
+    mask_time, _ = time_function(
+        lambda: df.loc[(df['Latitude'] == latitude) & (df['Longitude'] == longitude), 'Solar_Irradiance'])
+    slice_time, _ = time_function(dataset.site, latitude, longitude)
+    print(f"{sites} sites: {long_bytes / 2 ** 20:.1f} MB -> {dataset.nbytes / 2 ** 20:.1f} MB, "
+          f"one site {mask_time * 1000:.2f}ms -> {slice_time * 1000:.3f}ms")
+
+    return pd.DataFrame([{'sites': sites, 'long_mb': long_bytes / 2 ** 20, 'compact_mb': dataset.nbytes / 2 ** 20,
+                          'site_mask_s': mask_time, 'site_slice_s': slice_time}])
+
+
+# Modules each CLI subcommand imports, and a script starting the CLI
+STARTUP_MODULES = ('cli', 'data_scraper_nasa', 'data_cleaner', 'solar_irradiance_map', 'response_cache', 'model',
+                   'model_registry', 'batched_regression', 'online_model', 'visualisation')
+# Start-up budget of a short cron invocation
+STARTUP_BUDGET_SECONDS = 1.0
+
+
+def benchmark_startup(modules=STARTUP_MODULES, repeat=3, budget=STARTUP_BUDGET_SECONDS):
+    """
+    Times a fresh interpreter importing each pipeline module, which is what a CLI invocation pays before doing any
+    work, plus the whole `cli.py --help` process. Each import runs in its own process so modules already imported
+    by an earlier measurement do not hide their cost.
+    :param budget: Seconds above which a module is flagged
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    commands = {module: [sys.executable, '-c', f"import {module}"] for module in modules}
+    commands['cli.py --help'] = [sys.executable, os.path.join(folder, 'cli.py'), '--help']
+    baseline, _ = time_function(subprocess.run, [sys.executable, '-c', 'pass'], cwd=folder, repeat=repeat)
+    rows = []
+    for name, command in commands.items():
+        seconds, completed = time_function(subprocess.run, command, cwd=folder, capture_output=True, repeat=repeat)
+        if completed.returncode != 0:
+            print(f"{name}: failed, {completed.stderr.decode().strip().splitlines()[-1]}")
+            continue
+        rows.append({'module': name, 'seconds': seconds, 'import_s': seconds - baseline,
+                     'within_budget': seconds <= budget})
+        print(f"{name}: {seconds:.3f}s{'' if seconds <= budget else ' (over budget)'}")
+    return pd.DataFrame(rows)
+
+
+def _end_date(start_date, years):
+    return (pd.Timestamp(start_date) + pd.Timedelta(days=round(years * 365.25) - 1)).strftime('%Y%m%d')
+
+
+def benchmark_suite(years=1, sites=25, repeat=3, start_date='20000101'):
+    """
+    Times the hot paths of the pipeline end to end on synthetic data, from raw payloads to heatmap frames.
+    Each benchmark reports its best time over repeat runs and its peak memory in one traced run.
+    :param years: Years of hourly data per site
+    :param sites: Number of grid sites for the multi-site benchmarks
+    :return: DataFrame with one row per benchmark
+    """
+    end_date = _end_date(start_date, years)
+    payload = generate_payload(years, start_date=start_date)
+    site_df = assign_season(clean_solar_data_all(payload))
+    rows = []
+
+    def run(name, function, *args, **kwargs):
+        # The progress prints of the pipeline functions would otherwise be part of the timings
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            seconds, result = time_function(function, *args, repeat=repeat, **kwargs)
+            peak, _ = peak_memory(function, *args, **kwargs)
+        rows.append({'benchmark': name, 'seconds': seconds, 'peak_mb': peak / 2 ** 20,
+                     'rows': len(result) if isinstance(result, pd.DataFrame) else None})
+        print(f"{name}: {seconds:.3f}s, peak {peak / 2 ** 20:.1f} MB")
+        return result
+
+    run('clean_solar_data', clean_solar_data, payload)
+    run('clean_solar_data_map', clean_solar_data_map, payload)
+
+    with tempfile.TemporaryDirectory() as data_folder:
+        write_cleaned_grid(generate_grid(sites, years, start_date=start_date), start_date, end_date, data_folder)
+        from solar_irradiance_map import load_cleaned_solar_data
+        combined = run('load_cleaned_solar_data', load_cleaned_solar_data, start_date, end_date,
+                       data_folder=data_folder)
+
+    run('assign_season', lambda df: assign_season(df.copy()), combined)
+    run('train_and_evaluate_by_season', train_and_evaluate_by_season, site_df)
+    run('aggregate_frames', aggregate_frames, combined)
+    frames = run('aggregate_frames_daily', aggregate_frames, combined, 'D')
+    run('build_heatmap_figure', build_heatmap_figure, frames)
+
+    results = pd.DataFrame(rows)
+    results['years'] = years
+    results['sites'] = sites
+    return results
+
+
+def save_baseline(results, path=None):
+    """
+    Saves benchmark results as the baseline later runs are compared with.
+    """
+    path = path or BASELINE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results.to_dict('records'), file, indent=2)
+    print(f"Baseline is saved to {path}")
+    return path
+
+
+def compare_with_baseline(results, path=None, tolerance=1.25):
+    """
+    Compares benchmark results with the saved baseline of the same benchmark and data size.
+    :param tolerance: Ratio above which a slower time or a larger peak memory is reported as a regression
+    :return: DataFrame with the baseline values, the ratios and a Regression flag per benchmark
+    """
+    with open(path or BASELINE_PATH, 'r') as file:
+        baseline = pd.DataFrame(json.load(file))
+
+    keys = ['benchmark', 'years', 'sites']
+    comparison = results.merge(baseline[keys + ['seconds', 'peak_mb']], on=keys, how='left',
+                               suffixes=('', '_baseline'))
+    comparison['time_ratio'] = comparison['seconds'] / comparison['seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_mb'] / comparison['peak_mb_baseline']
+    comparison['Regression'] = (comparison['time_ratio'] > tolerance) | (comparison['memory_ratio'] > tolerance)
+
+    for row in comparison[comparison['Regression']].itertuples():
+        print(f"Regression in {row.benchmark}: {row.time_ratio:.2f}x time, {row.memory_ratio:.2f}x memory")
+    missing = comparison['seconds_baseline'].isna().sum()
+    if missing:
+        print(f"{missing} benchmark(s) have no baseline for this data size")
+    return comparison
+
+
+if __name__ == "__main__":
+    try:
+        suite = benchmark_suite()
+        if os.path.exists(BASELINE_PATH):
+            print(compare_with_baseline(suite))
+        else:
+            save_baseline(suite)
+        print(benchmark_cleaning())
+        print(benchmark_batched_fit())
+        print(benchmark_calendar_features())
+        print(benchmark_solar_geometry())
+        print(benchmark_compact_dataset())
+        print(benchmark_startup())
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
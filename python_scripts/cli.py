@@ -0,0 +1,296 @@
+"""
+Command line entry point of the pipeline:
+
+    python python_scripts/cli.py fetch --latitude 51.54501 --longitude -0.00564 --start 20230101 --end 20230103
+    python python_scripts/cli.py update --latitude 51.54501 --longitude -0.00564 --start 20230101 --end 20231231
+    python python_scripts/cli.py clean --latitude 51.54501 --longitude -0.00564 --start 20230101 --end 20240101
+    python python_scripts/cli.py train --latitude 51.54501 --longitude -0.00564 --start 20230101 --end 20240101
+    python python_scripts/cli.py map --start 20230101 --end 20230103 --freq D
+    python python_scripts/cli.py plot --latitude 51.54501 --longitude -0.00564 --start 20230101 --end 20240101
+    python python_scripts/cli.py simulate --port 8000 --latency 0.05 --rate-limit 30
+    python python_scripts/cli.py loadtest --workers 16 --error-rate 0.02 --rate-limit 50
+
+Only argparse is imported at start-up. Each subcommand imports the modules it needs when it runs, so a cron job
+fetching data does not pay for sklearn, matplotlib or plotly.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+
+def date_argument(value):
+    """
+    Argument type for dates in the YYYYMMDD format the NASA POWER API uses.
+    """
+    try:
+        datetime.strptime(value, '%Y%m%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a date in the YYYYMMDD format")
+    return value
+
+
+def fetch(args):
+    from solar_irradiance_map import downloading_data
+    from data_scraper_nasa import BASE_URL, PARAMETERS, PARAMETERS_WITHOUT_SZA
+    cache = None
+    # Responses of another endpoint, such as the local simulator, are not worth keeping next to NASA's
+    if args.no_cache or (args.base_url and args.base_url != BASE_URL):
+        print("Response cache disabled")
+    else:
+        from response_cache import ResponseCache
+        cache = ResponseCache()
+    downloading_data(args.latitude, args.longitude, args.start, args.end, args.area_lat, args.area_long,
+                     args.interval, max_workers=args.workers, base_url=args.base_url or BASE_URL, cache=cache,
+                     use_cube=args.cube, keep_raw=not args.no_raw, all_parameters=args.all_parameters,
+                     adaptive=args.adaptive, coarse_interval=args.coarse_interval, tolerance=args.tolerance,
+                     parameters=PARAMETERS_WITHOUT_SZA if args.without_sza else PARAMETERS)
+
+
+def update(args):
+    from grid_fetcher import build_grid
+    from incremental_fetch import update_grid
+    from data_scraper_nasa import BASE_URL
+    cells = build_grid(args.latitude, args.longitude, args.area_lat, args.area_long, args.interval)
+    update_grid(cells, args.start, args.end, max_workers=args.workers, base_url=args.base_url or BASE_URL,
+                refetch_days=None if args.refetch_days < 0 else args.refetch_days)
+
+
+def clean(args):
+    from data_cleaner import load_raw_data, clean_solar_data_fast, check_data_availability, save_cleaned_data
+    raw_data = load_raw_data(args.latitude, args.longitude, args.start, args.end)
+    cleaned_data = clean_solar_data_fast(raw_data)
+    check_data_availability(cleaned_data)
+    save_cleaned_data(cleaned_data, args.latitude, args.longitude, args.start, args.end)
+
+
+def training_data(df):
+    """
+    Checks that cleaned data has the columns the models are fitted on. Cells fetched without --all-parameters
+    only keep the irradiance.
+    """
+    from batched_regression import FEATURES
+    missing = [column for column in FEATURES if column not in df.columns]
+    if missing:
+        raise ValueError(f"The cleaned data has no {', '.join(missing)} column, fetch the cells again with "
+                         f"--all-parameters to train on them")
+    return df
+
+
+def train(args):
+    from storage import data_version
+    if args.online:
+        import os
+        from storage import load_cleaned
+        from online_model import OnlineModels, online_models_path
+        cleaned_data = training_data(load_cleaned(args.latitude, args.longitude, args.start, args.end))
+        if os.path.exists(online_models_path(args.name)):
+            models = OnlineModels.load(args.name)
+            # The saved statistics were already decayed with their own half-life, another one would mix both
+            if args.half_life is not None and args.half_life != models.half_life_hours:
+                raise ValueError(f"The online models '{args.name}' were created with a half-life of "
+                                 f"{models.half_life_hours} hours, train under another --name to use "
+                                 f"{args.half_life}")
+        else:
+            models = OnlineModels(args.half_life, name=args.name)
+        rows = models.update(cleaned_data, args.latitude, args.longitude)
+        print(f"{rows} new rows folded into {len(models)} online models")
+        models.save()
+        return
+
+    from model_registry import ModelRegistry
+    if args.latitude is None:
+        # Every stored cell of the date range, one model per cell and season fitted in a single pass
+        from solar_irradiance_map import load_cleaned_solar_data
+        from batched_regression import fit_grouped_least_squares
+        table = fit_grouped_least_squares(training_data(load_cleaned_solar_data(args.start, args.end)))
+    else:
+        from storage import load_cleaned
+        from model import assign_season, feature_engineering, train_and_evaluate_by_season
+        from model_registry import season_results_to_table
+        cleaned_data = training_data(load_cleaned(args.latitude, args.longitude, args.start, args.end))
+        results = train_and_evaluate_by_season(feature_engineering(assign_season(cleaned_data)))
+        table = season_results_to_table(results, args.latitude, args.longitude)
+    ModelRegistry.from_results(table, data_version(args.start, args.end)).save()
+
+
+def heatmap(args):
+    from solar_irradiance_map import load_cleaned_solar_data, generate_heatmap_with_time
+    generate_heatmap_with_time(lambda: load_cleaned_solar_data(args.start, args.end), args.start, args.end,
+                               freq=args.freq, output=args.output, refresh=args.refresh)
+
+
+def plot(args):
+    if not args.show:
+        # Saving only, no display is needed
+        import matplotlib
+        matplotlib.use('Agg')
+    from storage import load_cleaned
+    from model import assign_season, feature_engineering, train_and_evaluate_by_season
+    from visualisation import plot_actual_by_season, PLOTS_FOLDER
+    cleaned_data = assign_season(load_cleaned(args.latitude, args.longitude, args.start, args.end))
+    features = feature_engineering(cleaned_data)
+    results = train_and_evaluate_by_season(features)
+    save_folder = None if args.show else (args.output_folder or PLOTS_FOLDER)
+    saved = plot_actual_by_season(features, results, save_folder=save_folder, max_points=args.max_points)
+    if saved:
+        print(f"{len(saved)} plots saved to {save_folder}")
+
+
+def simulate(args):
+    import time
+    from power_simulator import PowerSimulator
+    simulator = PowerSimulator(args.host, args.port, **simulator_options(args))
+    print(f"NASA POWER simulator listening on {simulator.start()}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+        print(simulator.stats())
+
+
+def load_test(args):
+    from load_test import run_load_test, print_report
+    report = run_load_test(args.latitude, args.longitude, args.start, args.end, args.area_lat, args.area_long,
+                           args.interval, max_workers=args.workers, verbose=args.verbose, **simulator_options(args))
+    print_report('load test', report)
+
+
+def simulator_options(args):
+    return {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+            'throttle_rate': args.throttle_rate, 'rate_limit': args.rate_limit, 'retry_after': args.retry_after}
+
+
+def add_simulator_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--rate-limit', type=float, help="Requests per second above which requests get a 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After (seconds) of the random 429s")
+
+
+def add_site_arguments(parser, required=True):
+    parser.add_argument('--latitude', type=float, required=required)
+    parser.add_argument('--longitude', type=float, required=required)
+    add_date_arguments(parser)
+
+
+def add_date_arguments(parser):
+    parser.add_argument('--start', type=date_argument, required=True, help="Start date (YYYYMMDD)")
+    parser.add_argument('--end', type=date_argument, required=True, help="End date (YYYYMMDD)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Solar irradiance data pipeline")
+    parser.add_argument('--metrics', action='store_true', help="Print the time spent per stage at the end")
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help="Save a cProfile of the stages slower than this many seconds")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_fetch = commands.add_parser('fetch', help="Download, clean and store the cells of an area")
+    add_site_arguments(parser_fetch)
+    parser_fetch.add_argument('--area-lat', type=float, default=0.0, help="Extent north and south (degree)")
+    parser_fetch.add_argument('--area-long', type=float, default=0.0, help="Extent east and west (degree)")
+    parser_fetch.add_argument('--interval', type=float, default=0.01, help="Grid step (degree)")
+    parser_fetch.add_argument('--workers', type=int, default=8)
+    parser_fetch.add_argument('--base-url', help="NASA POWER hourly point endpoint, e.g. a local simulation server")
+    parser_fetch.add_argument('--no-cache', action='store_true', help="Do not use the response cache")
+    parser_fetch.add_argument('--no-raw', action='store_true', help="Do not keep the raw responses")
+    parser_fetch.add_argument('--cube', action='store_true', help="Store the cells in the consolidated cube")
+    parser_fetch.add_argument('--all-parameters', action='store_true',
+                              help="Keep temperature and solar zenith angle, needed for training")
+    parser_fetch.add_argument('--without-sza', action='store_true',
+                              help="Do not download the solar zenith angle, it is computed locally when needed")
+    parser_fetch.add_argument('--adaptive', action='store_true', help="Refine the grid only where cells differ")
+    parser_fetch.add_argument('--coarse-interval', type=float, default=0.5)
+    parser_fetch.add_argument('--tolerance', type=float, default=0.02)
+    parser_fetch.set_defaults(handler=fetch)
+
+    parser_update = commands.add_parser('update', help="Bring the stored series of an area up to date, only "
+                                                       "requesting the hours each cell is missing")
+    add_site_arguments(parser_update)
+    parser_update.add_argument('--area-lat', type=float, default=0.0, help="Extent north and south (degree)")
+    parser_update.add_argument('--area-long', type=float, default=0.0, help="Extent east and west (degree)")
+    parser_update.add_argument('--interval', type=float, default=0.01, help="Grid step (degree)")
+    parser_update.add_argument('--workers', type=int, default=8)
+    parser_update.add_argument('--base-url', help="NASA POWER hourly point endpoint, e.g. a local simulation server")
+    parser_update.add_argument('--refetch-days', type=int, default=7,
+                               help="Days before the last stored day whose missing (-999) hours are requested "
+                                    "again, -1 for every day")
+    parser_update.set_defaults(handler=update)
+
+    parser_clean = commands.add_parser('clean', help="Clean the raw data of one site")
+    add_site_arguments(parser_clean)
+    parser_clean.set_defaults(handler=clean)
+
+    parser_train = commands.add_parser('train', help="Train the seasonal models and save them to the registry")
+    add_site_arguments(parser_train, required=False)
+    parser_train.add_argument('--online', action='store_true',
+                              help="Fold the site's new hours into the incremental models instead")
+    parser_train.add_argument('--half-life', type=float, metavar='HOURS',
+                              help="Forgetting half-life of new incremental models, saved ones keep their own")
+    parser_train.add_argument('--name', default='online', help="Name of the incremental models")
+    parser_train.set_defaults(handler=train)
+
+    parser_map = commands.add_parser('map', help="Render the irradiance heatmap of the stored cells")
+    add_date_arguments(parser_map)
+    parser_map.add_argument('--freq', choices=['D', 'W', 'M'], help="Average per day, week or month")
+    parser_map.add_argument('--output', choices=['html', 'tiles'], default='html')
+    parser_map.add_argument('--refresh', action='store_true', help="Rebuild the cached heatmap frames")
+    parser_map.set_defaults(handler=heatmap)
+
+    parser_plot = commands.add_parser('plot', help="Plot actual against predicted irradiance per season")
+    add_site_arguments(parser_plot)
+    parser_plot.add_argument('--output-folder', help="Folder the plots are saved to, defaults to plots/")
+    parser_plot.add_argument('--show', action='store_true', help="Show the plots instead of saving them")
+    parser_plot.add_argument('--max-points', type=int, default=20000, help="Scatter points drawn per plot")
+    parser_plot.set_defaults(handler=plot)
+
+    parser_simulate = commands.add_parser('simulate', help="Serve a local stand-in for the NASA POWER API")
+    parser_simulate.add_argument('--host', default='127.0.0.1')
+    parser_simulate.add_argument('--port', type=int, default=8000)
+    add_simulator_arguments(parser_simulate)
+    parser_simulate.set_defaults(handler=simulate)
+
+    parser_load_test = commands.add_parser('loadtest', help="Fetch a grid from a local simulator and report "
+                                                            "requests/s and tail latency")
+    parser_load_test.add_argument('--latitude', type=float, default=51.5)
+    parser_load_test.add_argument('--longitude', type=float, default=0.0)
+    parser_load_test.add_argument('--start', type=date_argument, default='20230101')
+    parser_load_test.add_argument('--end', type=date_argument, default='20230131')
+    parser_load_test.add_argument('--area-lat', type=float, default=0.5)
+    parser_load_test.add_argument('--area-long', type=float, default=0.5)
+    parser_load_test.add_argument('--interval', type=float, default=0.1)
+    parser_load_test.add_argument('--workers', type=int, default=8)
+    parser_load_test.add_argument('--verbose', action='store_true', help="Show the per-cell progress")
+    add_simulator_arguments(parser_load_test)
+    parser_load_test.set_defaults(handler=load_test)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'train' and (args.latitude is None) != (args.longitude is None):
+        parser.error("--latitude and --longitude go together")
+    if args.command == 'train' and args.online and args.latitude is None:
+        parser.error("--online needs --latitude and --longitude")
+
+    from instrumentation import METRICS
+    if args.profile is not None:
+        METRICS.enable_profiling(args.profile)
+    try:
+        args.handler(args)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return 1
+    finally:
+        if args.metrics:
+            METRICS.summary()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+ONE_HOUR = np.timedelta64(1, 'h')
+SITE_COLUMNS = ['Latitude', 'Longitude']
+
+
+class CompactDataset:
+    """
+    Multi-site hourly data held as a site table plus one dense float32 matrix per variable, of shape
+    (sites, hours) and indexed by site id and hour offset from the first hour.
+    Compared with the long frame of load_cleaned_solar_data, coordinates and timestamps are stored once instead of
+    on every row and values take 4 bytes, so the same data takes a fraction of the memory. A site, an hour or a
+    time window is a slice of the matrices, found with a dictionary lookup or an offset computation.
+    Missing hours are NaN.
+    """
+
+    def __init__(self, sites, start, values):
+        """
+        :param sites: DataFrame with Latitude and Longitude columns, its row number is the site id
+        :param start: First hour (numpy datetime64)
+        :param values: Dictionary {column: float32 array of shape (sites, hours)}
+        """
+        self.sites = sites.reset_index(drop=True)
+        self.start = np.datetime64(start, 'h')
+        self.values = values
+        self.n_hours = next(iter(values.values())).shape[1] if values else 0
+        self._site_ids = {(round(lat, 6), round(lon, 6)): i for i, (lat, lon) in
+                          enumerate(zip(self.sites['Latitude'].tolist(), self.sites['Longitude'].tolist()))}
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        """
+        Converts a long DataFrame (DateTime, Latitude, Longitude and value columns) into a compact dataset.
+        :param columns: Value columns to keep, defaults to every numeric column other than the coordinates
+        """
+        if columns is None:
+            columns = [column for column in df.columns
+                       if column not in SITE_COLUMNS and pd.api.types.is_numeric_dtype(df[column])]
+        hours = df['DateTime'].to_numpy().astype('datetime64[h]')
+        start = hours.min()
+        offsets = (hours - start).astype(np.int64)
+        site_index = pd.MultiIndex.from_frame(df[SITE_COLUMNS])
+        codes, uniques = pd.factorize(site_index, sort=True)
+        sites = uniques.to_frame(index=False)
+        sites.columns = SITE_COLUMNS
+
+        values = {}
+        for column in columns:
+            matrix = np.full((len(sites), offsets.max() + 1), np.nan, dtype=np.float32)
+            matrix[codes, offsets] = df[column].to_numpy(dtype=np.float32)
+            values[column] = matrix
+        return cls(sites, start, values)
+
+    @classmethod
+    def from_cells(cls, cells, read_frame, start_date, end_date, columns=None):
+        """
+        Builds a compact dataset one cell file at a time, without ever holding a long frame of all cells.
+        :param cells: List of (latitude, longitude, file_path) tuples, see storage.list_cleaned
+        :param read_frame: Function reading a cleaned DataFrame from a file path
+        :param start_date: First day covered (YYYYMMDD), hours outside start_date 00:00 to end_date 23:00 are ignored
+        :param end_date: Last day covered (YYYYMMDD)
+        :param columns: Value columns to keep, defaults to the numeric columns of the first file
+        """
+        start = np.datetime64(pd.Timestamp(start_date), 'h')
+        n_hours = int((np.datetime64(pd.Timestamp(end_date), 'h') + 24 - start) / ONE_HOUR)
+        values = None
+
+        for site, (_, _, file_path) in enumerate(cells):
+            frame = read_frame(file_path)
+            if values is None:
+                columns = columns or [column for column in frame.columns
+                                      if column not in SITE_COLUMNS and pd.api.types.is_numeric_dtype(frame[column])]
+                values = {column: np.full((len(cells), n_hours), np.nan, dtype=np.float32) for column in columns}
+            offsets = ((frame['DateTime'].to_numpy().astype('datetime64[h]') - start) / ONE_HOUR).astype(np.int64)
+            inside = (offsets >= 0) & (offsets < n_hours)
+            for column in columns:
+                values[column][site, offsets[inside]] = frame[column].to_numpy(dtype=np.float32)[inside]
+
+        sites = pd.DataFrame([(lat, lon) for lat, lon, _ in cells], columns=SITE_COLUMNS)
+        return cls(sites, start, values or {})
+
+    @property
+    def times(self):
+        return np.arange(self.start, self.start + self.n_hours, ONE_HOUR)
+
+    @property
+    def nbytes(self):
+        return sum(matrix.nbytes for matrix in self.values.values()) + self.sites.memory_usage(index=False).sum()
+
+    def __len__(self):
+        return len(self.sites)
+
+    def site_id(self, latitude, longitude):
+        """
+        :raises KeyError: When the dataset has no such site
+        """
+        return self._site_ids[(round(latitude, 6), round(longitude, 6))]
+
+    def hour_offset(self, timestamp):
+        return int((np.datetime64(pd.Timestamp(timestamp), 'h') - self.start) / ONE_HOUR)
+
+    def site(self, latitude, longitude, column='Solar_Irradiance'):
+        """
+        One site across time, a view on the matrix.
+        :return: pandas Series indexed by DateTime
+        """
+        return pd.Series(self.values[column][self.site_id(latitude, longitude)],
+                         index=pd.DatetimeIndex(self.times.astype('datetime64[ns]'), name='DateTime'), name=column)
+
+    def at(self, timestamp, column='Solar_Irradiance'):
+        """
+        One hour across the sites.
+        :return: float32 array with one value per site id
+        """
+        return self.values[column][:, self.hour_offset(timestamp)]
+
+    def window(self, start=None, end=None):
+        """
+        Time window from start to end (both included) sharing memory with this dataset.
+        """
+        first = 0 if start is None else max(self.hour_offset(start), 0)
+        last = self.n_hours - 1 if end is None else min(self.hour_offset(end), self.n_hours - 1)
+        return CompactDataset(self.sites, self.start + first,
+                              {column: matrix[:, first:last + 1] for column, matrix in self.values.items()})
+
+    def select(self, site_ids):
+        """
+        Subset of the sites, in the given order.
+        """
+        site_ids = np.asarray(site_ids, dtype=np.int64)
+        return CompactDataset(self.sites.iloc[site_ids], self.start,
+                              {column: matrix[site_ids] for column, matrix in self.values.items()})
+
+    def with_aliases(self, aliases):
+        """
+        Adds sites that share the data of another site, see adaptive_grid.
+        :param aliases: Dictionary {(latitude, longitude): (source latitude, source longitude)}
+        """
+        targets = [(target, self._site_ids.get((round(source[0], 6), round(source[1], 6))))
+                   for target, source in aliases.items()
+                   if (round(target[0], 6), round(target[1], 6)) not in self._site_ids]
+        targets = [(target, source_id) for target, source_id in targets if source_id is not None]
+        if not targets:
+            return self
+        source_ids = np.array([source_id for _, source_id in targets], dtype=np.int64)
+        sites = pd.concat([self.sites, pd.DataFrame([target for target, _ in targets], columns=SITE_COLUMNS)],
+                          ignore_index=True)
+        return CompactDataset(sites, self.start, {column: np.concatenate([matrix, matrix[source_ids]])
+                                                  for column, matrix in self.values.items()})
+
+    def to_frame(self, dropna=True):
+        """
+        Converts back to the long DataFrame of load_cleaned_solar_data (DateTime, value columns, Latitude,
+        Longitude), sorted by site then time.
+        :param dropna: Drop the hours where every value column is missing, as they are absent from the files
+        """
+        n_sites, n_hours = len(self.sites), self.n_hours
+        frame = pd.DataFrame({'DateTime': np.tile(self.times.astype('datetime64[ns]'), n_sites)})
+        for column, matrix in self.values.items():
+            frame[column] = matrix.reshape(-1)
+        frame['Latitude'] = np.repeat(self.sites['Latitude'].to_numpy(), n_hours)
+        frame['Longitude'] = np.repeat(self.sites['Longitude'].to_numpy(), n_hours)
+        if dropna:
+            frame = frame.dropna(subset=list(self.values), how='all').reset_index(drop=True)
+        return frame
+
+    def save(self, path):
+        """
+        Saves the dataset to a .npz file.
+        """
+        np.savez(path, latitudes=self.sites['Latitude'].to_numpy(), longitudes=self.sites['Longitude'].to_numpy(),
+                 start=self.start, columns=np.array(list(self.values)), **{f"values_{column}": matrix
+                                                                          for column, matrix in self.values.items()})
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sites = pd.DataFrame({'Latitude': data['latitudes'], 'Longitude': data['longitudes']})
+            values = {str(column): data[f"values_{column}"] for column in data['columns']}
+            return cls(sites, data['start'], values)
@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+DATA_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data')
+# A chunk covers a year of hours of a small tile of cells, so a cell's series is read from one contiguous run
+DEFAULT_TIME_CHUNK = 24 * 366
+DEFAULT_TILE_SIZE = 16
+ONE_HOUR = np.timedelta64(1, 'h')
+
+
+def cube_path(start_date, end_date, data_folder=None):
+    """
+    Returns the folder of the consolidated store of a date range.
+    """
+    return os.path.join(data_folder or DATA_FOLDER, f"cube_{start_date}_to_{end_date}")
+
+
+class CubeStore:
+    """
+    Consolidated (time x latitude x longitude) store of gridded hourly data.
+    Each variable is split into chunks covering a tile of tile_size x tile_size cells over time_chunk hours,
+    saved as float32 .npy files that are memory-mapped. Inside a chunk the hours of a cell are contiguous, so
+    reading one cell across time, the main access pattern, only touches the pages of that cell.
+    Chunks are created on the first write, a chunk that does not exist reads as NaN.
+    Coordinates are kept in coords.npz and meta.json describes the variables and chunking.
+
+    Layout of the folder:
+    - meta.json: variables, time chunk size, tile size and shape
+    - coords.npz: times (datetime64[h]), latitudes and longitudes, all sorted
+    - written.npy: bool array of shape (latitudes, longitudes), True for the cells written so far
+    - {variable}_{time chunk}_{tile row}_{tile column}.npy: float32 array of shape
+      (tile latitudes, tile longitudes, chunk hours), NaN where missing
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        if 'tile_size' not in self.meta:
+            raise ValueError(f"{path} uses the former (time, latitude, longitude) chunk layout, "
+                             f"remove it so it is downloaded again into tiled chunks")
+        with np.load(os.path.join(path, 'coords.npz')) as coords:
+            self.times = coords['times'].astype('datetime64[h]')
+            self.latitudes = coords['latitudes']
+            self.longitudes = coords['longitudes']
+        self.variables = self.meta['variables']
+        self.time_chunk = self.meta['time_chunk']
+        self.tile_size = self.meta['tile_size']
+        self._chunks = {}
+        self._written = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, start_date, end_date, latitudes, longitudes, variables=('Solar_Irradiance',),
+               time_chunk=DEFAULT_TIME_CHUNK, tile_size=DEFAULT_TILE_SIZE):
+        """
+        Creates an empty store covering every hour from start_date 00:00 to end_date 23:00.
+        :param latitudes: Grid latitudes
+        :param longitudes: Grid longitudes
+        :param variables: Names of the columns stored, as in the cleaned DataFrames
+        :param time_chunk: Hours per chunk
+        :param tile_size: Latitudes and longitudes per chunk
+        :return: CubeStore opened for writing
+        """
+        os.makedirs(path, exist_ok=True)
+        first = np.datetime64(pd.Timestamp(start_date), 'h')
+        last = np.datetime64(pd.Timestamp(end_date), 'h') + 23
+        times = np.arange(first, last + 1, ONE_HOUR)
+        latitudes = np.unique(np.round(np.asarray(latitudes, dtype=np.float64), 6))
+        longitudes = np.unique(np.round(np.asarray(longitudes, dtype=np.float64), 6))
+
+        np.savez(os.path.join(path, 'coords.npz'), times=times.astype(np.int64), latitudes=latitudes,
+                 longitudes=longitudes)
+        meta = {'variables': list(variables), 'time_chunk': time_chunk, 'tile_size': tile_size,
+                'shape': [len(times), len(latitudes), len(longitudes)]}
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        np.save(os.path.join(path, 'written.npy'), np.zeros((len(latitudes), len(longitudes)), dtype=bool))
+
+        return cls(path, mode='r+')
+
+    @staticmethod
+    def _chunk_file(path, variable, chunk, row, column):
+        return os.path.join(path, f"{variable}_{chunk:05d}_{row:04d}_{column:04d}.npy")
+
+    def _chunk_shape(self, chunk, row, column):
+        size = self.tile_size
+        return (min(size, len(self.latitudes) - row * size), min(size, len(self.longitudes) - column * size),
+                min(self.time_chunk, len(self.times) - chunk * self.time_chunk))
+
+    def _chunk(self, variable, chunk, row, column, create=False):
+        """
+        :return: Memory-mapped chunk, or None when it was never written and create is False
+        """
+        key = (variable, chunk, row, column)
+        array = self._chunks.get(key)
+        if array is None:
+            file_path = self._chunk_file(self.path, variable, chunk, row, column)
+            with self._lock:
+                if not os.path.exists(file_path):
+                    if not create:
+                        return None
+                    array = np.lib.format.open_memmap(file_path, mode='w+', dtype=np.float32,
+                                                      shape=self._chunk_shape(chunk, row, column))
+                    array[:] = np.nan
+                    array.flush()
+                array = self._chunks[key] = np.load(file_path, mmap_mode=self.mode)
+        return array
+
+    def _tiles(self):
+        size = self.tile_size
+        for row in range(-(-len(self.latitudes) // size)):
+            for column in range(-(-len(self.longitudes) // size)):
+                yield row, column, slice(row * size, (row + 1) * size), slice(column * size, (column + 1) * size)
+
+    def _time_chunks(self, first, last):
+        # (chunk, first hour in the chunk, end hour in the chunk, offset in the window) covering [first, last]
+        for chunk in range(first // self.time_chunk, last // self.time_chunk + 1):
+            chunk_start = chunk * self.time_chunk
+            lo, hi = max(first, chunk_start), min(last + 1, chunk_start + self.time_chunk)
+            yield chunk, lo - chunk_start, hi - chunk_start, lo - first
+
+    def add_variables(self, variables):
+        """
+        Adds the variables the store does not hold yet, cells already written read as NaN for them.
+        :return: List of the variables added
+        """
+        if self.mode == 'r':
+            raise ValueError(f"Store {self.path} is opened read-only")
+        added = [variable for variable in variables if variable not in self.variables]
+        if added:
+            self.variables = self.variables + added
+            self.meta['variables'] = self.variables
+            with open(os.path.join(self.path, 'meta.json'), 'w') as file:
+                json.dump(self.meta, file)
+        return added
+
+    def off_grid(self, cells):
+        """
+        :param cells: List of (latitude, longitude) tuples
+        :return: The cells that do not fall on a grid point of the store
+        """
+        outside = []
+        for lat, lon in cells:
+            try:
+                self.lat_index(lat), self.lon_index(lon)
+            except KeyError:
+                outside.append((lat, lon))
+        return outside
+
+    def _written_cells(self):
+        if self._written is None:
+            path = os.path.join(self.path, 'written.npy')
+            if os.path.exists(path):
+                self._written = np.load(path, mmap_mode=self.mode)
+            else:
+                # Stores written before the bitmap existed: a cell counts as written when it holds any value.
+                # A store opened read-only keeps the result in memory and is left untouched.
+                written = np.zeros((len(self.latitudes), len(self.longitudes)), dtype=bool)
+                for variable in self.variables:
+                    for chunk in range(-(-len(self.times) // self.time_chunk)):
+                        for row, column, rows, columns in self._tiles():
+                            array = self._chunk(variable, chunk, row, column)
+                            if array is not None:
+                                written[rows, columns] |= np.isfinite(array).any(axis=2)
+                if self.mode == 'r':
+                    self._written = written
+                else:
+                    np.save(path, written)
+                    self._written = np.load(path, mmap_mode=self.mode)
+        return self._written
+
+    def _coordinate_index(self, coordinates, value, name):
+        # Nearest grid coordinate, rejecting values that fall between grid points
+        index = int(np.clip(np.searchsorted(coordinates, value), 1, len(coordinates) - 1)) if len(coordinates) > 1 else 0
+        if index > 0 and abs(coordinates[index - 1] - value) < abs(coordinates[index] - value):
+            index -= 1
+        step = np.min(np.diff(coordinates)) if len(coordinates) > 1 else 0.0
+        if abs(coordinates[index] - value) > max(step / 2, 1e-6):
+            raise KeyError(f"{name} {value} is not on the grid")
+        return index
+
+    def lat_index(self, latitude):
+        return self._coordinate_index(self.latitudes, latitude, 'Latitude')
+
+    def lon_index(self, longitude):
+        return self._coordinate_index(self.longitudes, longitude, 'Longitude')
+
+    def time_index(self, timestamp):
+        index = int((np.datetime64(pd.Timestamp(timestamp), 'h') - self.times[0]) // ONE_HOUR)
+        if not 0 <= index < len(self.times):
+            raise KeyError(f"Timestamp {timestamp} is outside of the store")
+        return index
+
+    def write_cell(self, latitude, longitude, df):
+        """
+        Writes the series of one cell.
+        :param df: Cleaned DataFrame with a DateTime column and one column per stored variable
+        """
+        i, j = self.lat_index(latitude), self.lon_index(longitude)
+        row, column = i // self.tile_size, j // self.tile_size
+        hours = df['DateTime'].to_numpy().astype('datetime64[h]')
+        positions = ((hours - self.times[0]) // ONE_HOUR).astype(np.int64)
+        inside = (positions >= 0) & (positions < len(self.times))
+        positions = positions[inside]
+        chunks = positions // self.time_chunk
+
+        for variable in self.variables:
+            if variable not in df.columns:
+                continue
+            values = df[variable].to_numpy(dtype=np.float32)[inside]
+            for chunk in np.unique(chunks):
+                selected = chunks == chunk
+                array = self._chunk(variable, int(chunk), row, column, create=True)
+                array[i % self.tile_size, j % self.tile_size, positions[selected] - chunk * self.time_chunk] = \
+                    values[selected]
+        self._written_cells()[i, j] = True
+
+    def has_cell(self, latitude, longitude):
+        """
+        Tells whether a cell was written, from the written bitmap instead of its time series.
+        """
+        try:
+            return bool(self._written_cells()[self.lat_index(latitude), self.lon_index(longitude)])
+        except KeyError:
+            return False
+
+    def read_time(self, timestamp, variable='Solar_Irradiance'):
+        """
+        Reads one timestamp across the grid.
+        :return: float32 array of shape (latitudes, longitudes)
+        """
+        index = self.time_index(timestamp)
+        chunk, offset = index // self.time_chunk, index % self.time_chunk
+        grid = np.full((len(self.latitudes), len(self.longitudes)), np.nan, dtype=np.float32)
+        for row, column, rows, columns in self._tiles():
+            array = self._chunk(variable, chunk, row, column)
+            if array is not None:
+                grid[rows, columns] = array[:, :, offset]
+        return grid
+
+    def read_cell(self, latitude, longitude, variable='Solar_Irradiance', start=None, end=None):
+        """
+        Reads one cell across time.
+        :return: pandas Series indexed by DateTime
+        """
+        i, j = self.lat_index(latitude), self.lon_index(longitude)
+        row, column = i // self.tile_size, j // self.tile_size
+        first = 0 if start is None else self.time_index(start)
+        last = len(self.times) - 1 if end is None else self.time_index(end)
+
+        values = np.full(last - first + 1, np.nan, dtype=np.float32)
+        for chunk, lo, hi, offset in self._time_chunks(first, last):
+            array = self._chunk(variable, chunk, row, column)
+            if array is not None:
+                values[offset:offset + hi - lo] = array[i % self.tile_size, j % self.tile_size, lo:hi]
+
+        index = pd.DatetimeIndex(self.times[first:last + 1].astype('datetime64[ns]'), name='DateTime')
+        return pd.Series(values, index=index, name=variable)
+
+    def read_frame(self, start=None, end=None, variables=None):
+        """
+        Reads a time window of the whole grid as a long DataFrame (DateTime, Latitude, Longitude, variables),
+        the shape load_cleaned_solar_data returns. Rows with no value are dropped.
+        """
+        variables = variables or self.variables
+        first = 0 if start is None else self.time_index(start)
+        last = len(self.times) - 1 if end is None else self.time_index(end)
+        n_times, n_lat, n_lon = last - first + 1, len(self.latitudes), len(self.longitudes)
+
+        blocks = {}
+        for variable in variables:
+            block = np.full((n_times, n_lat, n_lon), np.nan, dtype=np.float32)
+            for chunk, lo, hi, offset in self._time_chunks(first, last):
+                for row, column, rows, columns in self._tiles():
+                    array = self._chunk(variable, chunk, row, column)
+                    if array is not None:
+                        block[offset:offset + hi - lo, rows, columns] = np.moveaxis(array[:, :, lo:hi], 2, 0)
+            blocks[variable] = block.reshape(-1)
+
+        frame = pd.DataFrame({
+            'DateTime': np.repeat(self.times[first:last + 1].astype('datetime64[ns]'), n_lat * n_lon),
+            'Latitude': np.tile(np.repeat(self.latitudes, n_lon), n_times),
+            'Longitude': np.tile(self.longitudes, n_times * n_lat),
+            **blocks,
+        })
+        return frame.dropna(subset=list(variables), how='all').reset_index(drop=True)
+
+    def flush(self):
+        for array in [*self._chunks.values(), self._written]:
+            if isinstance(array, np.memmap):
+                array.flush()
@@ -2,6 +2,13 @@ import os
 import json
 import pandas as pd
 import numpy as np
+import storage
+from instrumentation import timed
+from solar_geometry import fill_solar_zenith
+
+# Column names used in the cleaned data for the NASA POWER parameters, other parameters keep their NASA name
+PARAMETER_COLUMNS = {'ALLSKY_SFC_SW_DWN': 'Solar_Irradiance', 'T2M': 'Temperature', 'SZA': 'Solar_zenith_angle'}
+MISSING_VALUE = -999
 
 def load_data_from_folder_in_json(latitude, longitude, start_date, end_date):
     """
@@ -18,6 +25,16 @@ def load_data_from_folder_in_json(latitude, longitude, start_date, end_date):
 
     return data
 
+def load_raw_data(latitude, longitude, start_date, end_date):
+    """
+        Loads the raw solar data through the storage backend, whichever format it was saved in.
+        :param start_date: The start date of the data (format 'YYYYMMDD').
+        :param end_date: The end date of the data (format 'YYYYMMDD').
+        :return: The raw solar data as a dictionary.
+    """
+    return storage.load_raw(latitude, longitude, start_date, end_date)
+
+@timed('clean_solar_data_map')
 def clean_solar_data_map(data):
     """
     Cleans the solar irradiance  converting invalid solar irradiance (-999) to NaN
@@ -25,24 +42,79 @@ def clean_solar_data_map(data):
     :param data: Dictionary containing raw solar data
     :return: Cleaned pandas DataFrame.
     """
-    # Convert the JSON data to pandas DataFrames
-
-    df_irradiance = pd.DataFrame(list(data['ALLSKY_SFC_SW_DWN'].items()), columns=['DateTime', 'Solar_Irradiance'])
-
-    # Convert DateTime to a proper datetime object. To note that the data is hourly. eg 2024052401
-    df_irradiance['DateTime'] = pd.to_datetime(df_irradiance['DateTime'], format='%Y%m%d%H')
-
-    # Replace invalid data (-999) with NaN
-    df_irradiance['Solar_Irradiance'] = df_irradiance['Solar_Irradiance'].replace(-999, np.nan)
-
-    # Ensure column is numeric
-    df_irradiance['Solar_Irradiance'] = pd.to_numeric(df_irradiance['Solar_Irradiance'], errors='coerce')
+    df_irradiance = clean_solar_data_fast(data, parameters=['ALLSKY_SFC_SW_DWN'])
 
     # Drop rows with NaN values (optional, only if you want to remove missing data)
     df_irradiance.dropna(subset=['Solar_Irradiance'], inplace=True)
 
     return df_irradiance
 
+def parse_hour_keys(keys):
+    """
+    Converts NASA hourly keys ('YYYYMMDDHH') to datetime64 values with integer arithmetic,
+    which is much faster than parsing them as strings with pd.to_datetime.
+    :param keys: Sequence of 'YYYYMMDDHH' strings or integers
+    :return: numpy datetime64[ns] array
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    hour = keys % 100
+    day = keys // 100 % 100
+    month = keys // 10000 % 100
+    year = keys // 1000000
+
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    return (days.astype('datetime64[h]') + hour).astype('datetime64[ns]')
+
+def _parameter_values(values, keys):
+    # NASA returns every parameter with the same hourly keys in the same order, anything else is realigned on the keys
+    if len(values) != len(keys) or list(values) != keys:
+        values = {key: values.get(key, np.nan) for key in keys}
+    try:
+        return np.fromiter(values.values(), dtype=np.float64, count=len(keys))
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(list(values.values())), errors='coerce').to_numpy(dtype=np.float64)
+
+@timed('clean_solar_data_fast', rows_counter='rows_cleaned')
+def clean_solar_data_fast(data, parameters=None, latitude=None, longitude=None, zenith='nasa'):
+    """
+    Vectorised equivalent of clean_solar_data for any list of parameters.
+    Builds the frame directly from one array per parameter instead of merging one DataFrame per parameter:
+    the keys are parsed once and -999 is masked in a single pass over the value block.
+    Parameters whose keys are not aligned with the first parameter are realigned on its keys (missing hours become NaN).
+    :param data: Dictionary containing raw solar data
+    :param parameters: NASA parameter names to keep, defaults to every parameter in data
+    :param latitude: Latitude of the location, needed to compute the solar zenith angle locally
+    :param longitude: Longitude of the location, needed to compute the solar zenith angle locally
+    :param zenith: 'nasa' keeps the downloaded SZA, 'fill' computes the missing values (or the whole column when
+                   SZA was not downloaded) and 'compute' replaces it with locally computed values
+    :return: Cleaned pandas DataFrame with a DateTime column and one column per parameter, empty (with those
+             columns) when there is no data.
+    """
+    if parameters is None:
+        parameters = list(data) or list(PARAMETER_COLUMNS)
+    parameters = list(parameters)
+    # An empty response still gives the usual columns, so callers can select and drop on them
+    keys = list(data[parameters[0]]) if data else []
+
+    block = np.empty((len(parameters), len(keys)), dtype=np.float64)
+    for row, name in enumerate(parameters):
+        block[row] = _parameter_values(data[name], keys) if data else np.nan
+    block[block == MISSING_VALUE] = np.nan
+
+    columns = {'DateTime': parse_hour_keys(keys)}
+    for row, name in enumerate(parameters):
+        columns[PARAMETER_COLUMNS.get(name, name)] = block[row]
+    df = pd.DataFrame(columns)
+
+    if zenith != 'nasa':
+        if latitude is None or longitude is None:
+            raise ValueError("Latitude and longitude are required to compute the solar zenith angle")
+        fill_solar_zenith(df, latitude, longitude, replace=(zenith == 'compute'))
+
+    return df
+
+@timed('clean_solar_data', rows_counter='rows_cleaned')
 def clean_solar_data(data):
     """
     Cleans the solar irradiance and temperature data, converting invalid solar irradiance (-999) to NaN
@@ -75,6 +147,19 @@ def clean_solar_data(data):
 
     return df
 
+@timed('clean_solar_data_all')
+def clean_solar_data_all(data):
+    """
+    Cleans every parameter of a grid cell with the fast path and, like clean_solar_data_map,
+    drops the hours without solar irradiance. Used when the grid data is also meant for training.
+    :param data: Dictionary containing raw solar data
+    :return: Cleaned pandas DataFrame.
+    """
+    df = clean_solar_data_fast(data)
+    df.dropna(subset=['Solar_Irradiance'], inplace=True)
+
+    return df
+
 def check_data_availability(df):
     """
     Checks the cleaned solar data for missing values in the Solar Irradiance column and temperature column and
@@ -96,27 +181,30 @@ def check_data_availability(df):
 
     return df
 
-def save_cleaned_data(df, latitude, longitude, start_date, end_date):
+def cleaned_data_path(latitude, longitude, start_date, end_date):
+    """
+    Returns the path of the cleaned data file of a location and date range in the configured storage format.
     """
-    Saves the cleaned solar data to a JSON file in the data directory with start and end date in the filename.
+    return storage.cleaned_data_path(latitude, longitude, start_date, end_date)
+
+def save_cleaned_data(df, latitude, longitude, start_date, end_date, data_folder=None):
+    """
+    Saves the cleaned solar data in the data directory with start and end date in the filename.
+    The file format is the one configured in storage (Parquet by default).
     :param df: The cleaned pandas DataFrame containing solar data.
     :param start_date: The start date of the data (format 'YYYYMMDD').
     :param end_date: The end date of the data (format 'YYYYMMDD').
+    :param data_folder: Folder to save to, defaults to the project data folder
     """
-    data_folder = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')),'data')
-    filename = f"cleaned_solar_data_lat_{latitude}_long_{longitude}_{start_date}_to_{end_date}.json"
-    file_path = os.path.join(data_folder, filename)
-
-    with open(file_path, 'w') as file:
-        df.to_json(file, orient='records', date_format='iso')
+    file_path = storage.save_cleaned(df, latitude, longitude, start_date, end_date, data_folder=data_folder)
     print(f"Data is saved to {file_path}")
 
 if __name__ == "__main__":
     try:
         start_date , end_date = '20230101', '20240101'
         latitude, longitude = 51.54501, -0.00564
-        raw_data = load_data_from_folder_in_json(latitude, longitude, start_date, end_date)
-        cleaned_data = clean_solar_data(raw_data)
+        raw_data = load_raw_data(latitude, longitude, start_date, end_date)
+        cleaned_data = clean_solar_data_fast(raw_data)
         first_missing_date = check_data_availability(cleaned_data)
         save_cleaned_data(cleaned_data, latitude, longitude, start_date, end_date)
     except Exception as e:
@@ -1,8 +1,29 @@
 import requests
 import json
 import os
+from instrumentation import timed, count
 
-def fetch_solar_data(latitude, longitude, start_date, end_date):
+BASE_URL = "https://power.larc.nasa.gov/api/temporal/hourly/point"
+PARAMETERS = 'ALLSKY_SFC_SW_DWN,T2M,SZA'
+# SZA is purely astronomical and can be computed locally (see solar_geometry), leaving it out shrinks the payload
+PARAMETERS_WITHOUT_SZA = 'ALLSKY_SFC_SW_DWN,T2M'
+COMMUNITY = 'RE'
+
+
+class FetchError(Exception):
+    """
+    Raised when the NASA POWER API answers with a non-200 status code.
+    Keeps the status code and any Retry-After hint so callers can decide whether to retry.
+    """
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Error fetching data: {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@timed('fetch_solar_data')
+def fetch_solar_data(latitude, longitude, start_date, end_date, session=None, base_url=BASE_URL, timeout=60,
+                     parameters=PARAMETERS, community=COMMUNITY):
     """
     Fetch solar irradiance (kW-hr/m^2/day), Solar Zenith Angle and temperature at 2m (C) data from NASA POWER API
     https://power.larc.nasa.gov/#resources
@@ -11,12 +32,15 @@ def fetch_solar_data(latitude, longitude, start_date, end_date):
     :param longitude: Longitude of the location
     :param start_date: Start date for data in 'YYYYMMDD' format
     :param end_date: End date for data in 'YYYYMMDD' format
+    :param session: Optional requests.Session to reuse pooled connections across calls
+    :param base_url: Endpoint to query, overridable to point at a local stand-in server
+    :param timeout: Seconds to wait for the server before giving up
+    :param parameters: Comma separated NASA POWER parameter names
     :return: Dictionary containing solar data
     """
-    base_url = "https://power.larc.nasa.gov/api/temporal/hourly/point"
     params = {
-        'parameters': 'ALLSKY_SFC_SW_DWN,T2M,SZA',
-        'community': 'RE',
+        'parameters': parameters,
+        'community': community,
         'longitude': longitude,
         'latitude': latitude,
         'start': start_date,
@@ -24,13 +48,16 @@ def fetch_solar_data(latitude, longitude, start_date, end_date):
         'format': 'JSON'
     }
 
-    response = requests.get(base_url, params=params)
+    http = session if session is not None else requests
+    response = http.get(base_url, params=params, timeout=timeout)
+    count('requests')
+    count('bytes_downloaded', len(response.content))
 
     if response.status_code == 200: # 200 = success , https://power.larc.nasa.gov/docs/services/api/
         data = response.json()
         return data['properties']['parameter']
     else:
-        raise Exception(f"Error fetching data: {response.status_code}")
+        raise FetchError(response.status_code, response.headers.get('Retry-After'))
 
 
 def save_data_to_json(data, latitude, longitude, start_date, end_date):
@@ -45,10 +72,15 @@ def save_data_to_json(data, latitude, longitude, start_date, end_date):
 
 # to test script when running it directly, location : london, Period : year 2023
 if __name__ == "__main__":
+    from response_cache import ResponseCache, fetch_solar_data_cached
+    from storage import save_raw
     try:
         latitude, longitude = 51.54501, -0.00564
         start_date , end_date = '20230101', '20240101'
-        solar_data = fetch_solar_data(latitude, longitude, start_date, end_date)
-        save_data_to_json(solar_data, latitude, longitude, start_date, end_date)
+        cache = ResponseCache()
+        solar_data = fetch_solar_data_cached(cache, latitude, longitude, start_date, end_date)
+        print(f"Cache stats: {cache.stats()}")
+        file_path = save_raw(solar_data, latitude, longitude, start_date, end_date)
+        print(f"Data is saved to {file_path}")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Season code of each month (1 Winter, 2 Spring, 3 Summer, 4 Fall), index 0 is unused so months index directly
+SEASON_BY_MONTH = np.array([0, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 1], dtype=np.int8)
+# South of the equator the seasons are shifted by six months: June-August is winter
+SOUTHERN_SEASON_BY_MONTH = np.array([0, 3, 3, 4, 4, 4, 1, 1, 1, 2, 2, 2, 3], dtype=np.int8)
+
+
+def _datetime64(datetimes):
+    if isinstance(datetimes, (pd.Series, pd.Index)):
+        datetimes = datetimes.to_numpy()
+    return np.asarray(datetimes, dtype='datetime64[ns]')
+
+
+def months(datetimes):
+    """
+    Month (1-12) of each timestamp, computed with datetime64 arithmetic.
+    """
+    return (_datetime64(datetimes).astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+
+
+def seasons_from_months(month, latitudes=None):
+    """
+    Season code of each month by table lookup.
+    :param month: Array of months (1-12)
+    :param latitudes: Optional latitude of each row (or a single latitude), southern rows get the shifted seasons
+    :return: int8 array of season codes
+    """
+    if latitudes is None:
+        return SEASON_BY_MONTH[month]
+    return np.where(np.asarray(latitudes) < 0, SOUTHERN_SEASON_BY_MONTH[month], SEASON_BY_MONTH[month])
+
+
+def season_codes(datetimes, latitudes=None):
+    """
+    Season code of each timestamp, see seasons_from_months.
+    """
+    return seasons_from_months(months(datetimes), latitudes)
+
+
+def calendar_features(datetimes, latitudes=None, cyclic=True):
+    """
+    Computes the calendar features of an array of timestamps.
+    :param latitudes: Optional latitudes for hemisphere-aware seasons, see season_codes
+    :param cyclic: Also return sine/cosine encodings of the hour and the day of the year
+    :return: Dictionary of numpy arrays: Month, Season_Encoded, Hour, Day_of_year and, with cyclic,
+             Hour_sin, Hour_cos, Day_of_year_sin, Day_of_year_cos (float32)
+    """
+    values = _datetime64(datetimes)
+    hours = values.astype('datetime64[h]')
+    days = values.astype('datetime64[D]')
+    month = months(values)
+
+    features = {
+        'Month': month,
+        'Season_Encoded': seasons_from_months(month, latitudes),
+        'Hour': (hours - days).astype(np.int8),
+        'Day_of_year': ((days - values.astype('datetime64[Y]')).astype(np.int16) + 1),
+    }
+    if cyclic:
+        hour_angle = features['Hour'].astype(np.float32) * np.float32(2 * np.pi / 24)
+        day_angle = features['Day_of_year'].astype(np.float32) * np.float32(2 * np.pi / 365.25)
+        features['Hour_sin'] = np.sin(hour_angle)
+        features['Hour_cos'] = np.cos(hour_angle)
+        features['Day_of_year_sin'] = np.sin(day_angle)
+        features['Day_of_year_cos'] = np.cos(day_angle)
+
+    return features
+
+
+def add_calendar_features(data, datetime_column='DateTime', latitude_column='Latitude', hemisphere_aware=True,
+                          cyclic=True):
+    """
+    Adds the calendar features in place to a DataFrame or to a column store (dictionary of arrays).
+    :param data: pandas DataFrame or dictionary of numpy arrays holding datetime_column
+    :param hemisphere_aware: Use the latitude column, when present, to shift the seasons of southern sites
+    :return: The same object, with the feature columns added
+    """
+    latitudes = None
+    if hemisphere_aware and latitude_column in data:
+        latitudes = data[latitude_column]
+        latitudes = latitudes.to_numpy() if isinstance(latitudes, pd.Series) else latitudes
+
+    for name, values in calendar_features(data[datetime_column], latitudes, cyclic).items():
+        data[name] = values
+
+    return data
@@ -0,0 +1,178 @@
+import random
+import time
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from data_scraper_nasa import fetch_solar_data, FetchError, BASE_URL, PARAMETERS
+from instrumentation import count
+
+# 429 = throttled by NASA, 5xx = transient server side failures, both are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+THROTTLED_STATUS_CODE = 429
+# A throttled cell is only late, it is retried this many times before it counts as failed
+MAX_THROTTLED_RETRIES = 50
+# Longest computed backoff is backoff * 2 ** MAX_BACKOFF_EXPONENT seconds
+MAX_BACKOFF_EXPONENT = 6
+# Cells between two progress lines of fetch_grid
+PROGRESS_EVERY = 100
+
+
+def build_grid(latitude, longitude, area_lat, area_long, interval):
+    """
+    Builds the list of (latitude, longitude) cells covering the requested area.
+    :param latitude: Latitude of the centre of the area
+    :param longitude: Longitude of the centre of the area
+    :param area_lat: Additional latitude (degree) on each side of the centre
+    :param area_long: Additional longitude (degree) on each side of the centre
+    :param interval: Step size between two cells (degree)
+    :return: List of (latitude, longitude) tuples
+    """
+    latitudes = np.arange(latitude - area_lat, latitude + area_lat + interval, interval)
+    longitudes = np.arange(longitude - area_long, longitude + area_long + interval, interval)
+
+    return [(lat, lon) for lat in latitudes for lon in longitudes]
+
+
+def create_session(pool_size):
+    """
+    Creates a requests session whose connection pool is large enough for every worker to keep
+    its connection alive between cells.
+    :param pool_size: Number of connections kept open per host
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def fetch_with_retry(session, latitude, longitude, start_date, end_date, max_retries=5, backoff=1.0,
+                     base_url=BASE_URL, parameters=PARAMETERS, max_throttled_retries=MAX_THROTTLED_RETRIES):
+    """
+    Fetches one cell, retrying with exponential backoff on throttling, server errors and dropped connections.
+    A Retry-After header sent by the server takes precedence over the computed backoff, with jitter on top.
+    Throttled (429) attempts do not count against max_retries: a throttled cell is delayed, not dropped.
+    :param session: Shared requests.Session
+    :param max_retries: Number of retries after the first attempt on server errors and dropped connections
+    :param backoff: Base delay in seconds, doubled after every failed attempt
+    :param parameters: Comma separated NASA parameter names, see fetch_solar_data
+    :param max_throttled_retries: Number of retries after throttled attempts
+    :return: Dictionary containing solar data
+    """
+    attempt = throttled = 0
+    while True:
+        try:
+            return fetch_solar_data(latitude, longitude, start_date, end_date, session=session, base_url=base_url,
+                                    parameters=parameters)
+        except FetchError as e:
+            if e.status_code == THROTTLED_STATUS_CODE and throttled < max_throttled_retries:
+                delay = _retry_delay(backoff, throttled, e.retry_after)
+                throttled += 1
+            elif e.status_code in RETRY_STATUS_CODES and e.status_code != THROTTLED_STATUS_CODE \
+                    and attempt < max_retries:
+                delay = _retry_delay(backoff, attempt, e.retry_after)
+                attempt += 1
+            else:
+                raise
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(backoff, attempt)
+            attempt += 1
+
+        count('retries')
+        time.sleep(delay)
+
+
+def fetch_cell(session, cache, latitude, longitude, start_date, end_date, max_retries=5, backoff=1.0,
+               base_url=BASE_URL, parameters=PARAMETERS):
+    """
+    Fetches one cell through the response cache: hits are served from disk, misses are fetched
+    with retries and stored. Without a cache this is plain fetch_with_retry.
+    """
+    if cache is None:
+        return fetch_with_retry(session, latitude, longitude, start_date, end_date, max_retries, backoff, base_url,
+                                parameters)
+
+    key = cache.make_key(latitude, longitude, start_date, end_date, parameters=parameters, base_url=base_url)
+    data = cache.get(key)
+    if data is None:
+        data = fetch_with_retry(session, latitude, longitude, start_date, end_date, max_retries, backoff, base_url,
+                                parameters)
+        cache.put(key, data)
+
+    return data
+
+
+def _retry_delay(backoff, attempt, retry_after=None):
+    # Jitter spreads the retries of workers that were throttled at the same moment, with Retry-After as well:
+    # waiting exactly the time asked sends every throttled worker back at once into the next 429
+    if retry_after is not None:
+        try:
+            return float(retry_after) * (1 + random.random())
+        except ValueError:
+            pass
+    return backoff * (2 ** min(attempt, MAX_BACKOFF_EXPONENT)) * (0.5 + random.random())
+
+
+def fetch_grid(cells, start_date, end_date, max_workers=8, max_retries=5, backoff=1.0, base_url=BASE_URL,
+               cache=None, parameters=PARAMETERS, progress_every=PROGRESS_EVERY):
+    """
+    Fetches every cell of the grid concurrently over a bounded thread pool sharing one pooled session.
+    Results are yielded as soon as a cell completes, so the caller can save them while other cells are
+    still downloading. At most 2 * max_workers cells are in flight at any time.
+    :param cells: List of (latitude, longitude) tuples, see build_grid
+    :param start_date: Start date for data in 'YYYYMMDD' format
+    :param end_date: End date for data in 'YYYYMMDD' format
+    :param max_workers: Number of concurrent requests
+    :param cache: Optional ResponseCache, cached cells are served from disk without a request
+    :param parameters: Comma separated NASA parameter names to request
+    :param progress_every: Cells between two progress lines, failed cells are reported by the caller
+    :return: Generator of (latitude, longitude, data, error) tuples, data is None when error is set
+    """
+    total = len(cells)
+    done = failed = 0
+    started = time.perf_counter()
+    pending = {}
+    cell_iter = iter(cells)
+
+    session = create_session(max_workers)
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit_next():
+            cell = next(cell_iter, None)
+            if cell is None:
+                return False
+            future = executor.submit(fetch_cell, session, cache, cell[0], cell[1], start_date, end_date,
+                                     max_retries, backoff, base_url, parameters)
+            pending[future] = cell
+            return True
+
+        for _ in range(2 * max_workers):
+            if not submit_next():
+                break
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                lat, lon = pending.pop(future)
+                error = future.exception()
+                data = None if error is not None else future.result()
+                done += 1
+                if error is not None:
+                    failed += 1
+
+                if done % progress_every == 0 and done < total:
+                    elapsed = time.perf_counter() - started
+                    print(f"[{done}/{total}] {failed} failed - {done / elapsed:.2f} cells/s")
+
+                yield lat, lon, data, error
+                submit_next()
+
+    elapsed = time.perf_counter() - started
+    print(f"Fetched {done - failed}/{total} cells in {elapsed:.1f}s ({failed} failed)")
+    if cache is not None:
+        print(f"Cache stats: {cache.stats()}")
@@ -0,0 +1,147 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data', 'cache')
+
+
+def aggregate_frames(data, freq=None, value_column='Solar_Irradiance'):
+    """
+    Pre-aggregates a long frame (DateTime, Latitude, Longitude, value) into one grid per timestamp.
+    :param data: DataFrame as returned by load_cleaned_solar_data
+    :param freq: Optional pandas period used to downsample in time ('D' daily, 'W' weekly, 'M' monthly), values are
+                 averaged per period and cell. None keeps one frame per timestamp.
+    :return: Dictionary with 'times' (datetime64[ns]), 'latitudes', 'longitudes' and 'grid', a float32 array
+             of shape (times, latitudes, longitudes) holding NaN where a cell has no value
+    """
+    times = data['DateTime']
+    if freq is not None:
+        times = times.dt.to_period(freq).dt.start_time
+
+    unique_times, time_codes = np.unique(times.to_numpy(dtype='datetime64[ns]'), return_inverse=True)
+    latitudes, lat_codes = np.unique(data['Latitude'].to_numpy(), return_inverse=True)
+    longitudes, lon_codes = np.unique(data['Longitude'].to_numpy(), return_inverse=True)
+    values = data[value_column].to_numpy(dtype=np.float64)
+
+    # Sum and count per (time, cell) in one pass, then divide for the mean
+    shape = (len(unique_times), len(latitudes), len(longitudes))
+    flat = np.ravel_multi_index((time_codes, lat_codes, lon_codes), shape)
+    valid = ~np.isnan(values)
+    sums = np.bincount(flat[valid], weights=values[valid], minlength=np.prod(shape))
+    counts = np.bincount(flat[valid], minlength=np.prod(shape))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid = (sums / counts).astype(np.float32).reshape(shape)
+
+    return {'times': unique_times, 'latitudes': latitudes, 'longitudes': longitudes, 'grid': grid}
+
+
+def frames_cache_path(version, freq=None, cache_folder=None):
+    return os.path.join(cache_folder or CACHE_FOLDER, f"heatmap_frames_{version}_{freq or 'raw'}.npz")
+
+
+def remove_stale_frames(version, cache_folder=None):
+    """
+    Deletes the cached frames of earlier versions of the same data, for every frequency. Versions are
+    '{data}_{fingerprint}' (see solar_irradiance_map.cleaned_data_fingerprint), frames of other data are kept.
+    :return: Number of files removed
+    """
+    cache_folder = cache_folder or CACHE_FOLDER
+    data_key = version.rsplit('_', 1)[0]
+    removed = 0
+    for file in os.listdir(cache_folder):
+        if not file.startswith('heatmap_frames_') or not file.endswith('.npz'):
+            continue
+        file_version = file[len('heatmap_frames_'):-len('.npz')].rsplit('_', 1)[0]
+        if file_version != version and file_version.rsplit('_', 1)[0] == data_key:
+            try:
+                os.remove(os.path.join(cache_folder, file))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def load_or_build_frames(load_data, version, freq=None, cache_folder=None, refresh=False):
+    """
+    Returns the aggregated frames of a data version, computing and caching them on the first call.
+    Writing new frames deletes those of earlier versions of the same data, see remove_stale_frames.
+    :param load_data: Function returning the long DataFrame, only called on a cache miss
+    :param version: Version the frames are keyed by, it has to change whenever the data does,
+                    see solar_irradiance_map.cleaned_data_fingerprint
+    :param refresh: Rebuild the frames even when they are cached
+    """
+    path = frames_cache_path(version, freq, cache_folder)
+    if os.path.exists(path) and not refresh:
+        with np.load(path) as cached:
+            return {name: cached[name] for name in cached.files}
+
+    frames = aggregate_frames(load_data(), freq)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, **frames)
+    # Frames of an earlier fingerprint can never be served again
+    remove_stale_frames(version, os.path.dirname(path))
+    return frames
+
+
+def _density_trace():
+    # Recent plotly versions replaced the mapbox traces with MapLibre based ones
+    import plotly.graph_objects as go
+    if hasattr(go, 'Densitymap'):
+        return go, go.Densitymap, 'map'
+    return go, go.Densitymapbox, 'mapbox'
+
+
+def build_heatmap_figure(frames, radius=20, range_color=(0, 100), height=900):
+    """
+    Builds an animated density map where each frame only carries its own z values; the coordinates are sent once
+    in the base trace and plotly serialises the float32 arrays in its compact binary encoding.
+    """
+    go, trace, map_key = _density_trace()
+    lat_grid, lon_grid = np.meshgrid(frames['latitudes'], frames['longitudes'], indexing='ij')
+    lat, lon = lat_grid.ravel(), lon_grid.ravel()
+    labels = pd.DatetimeIndex(frames['times']).strftime('%Y-%m-%d %H:%M').tolist()
+    grid = frames['grid'].reshape(len(labels), -1)
+
+    base = dict(radius=radius, zmin=range_color[0], zmax=range_color[1], colorscale='Plasma')
+    figure = go.Figure(
+        data=[trace(lat=lat, lon=lon, z=grid[0], **base)],
+        frames=[go.Frame(data=[trace(z=grid[i])], name=label) for i, label in enumerate(labels)],
+    )
+    figure.update_layout(
+        height=height,
+        **{map_key: dict(style='open-street-map', zoom=4, center=dict(lat=float(lat.mean()), lon=float(lon.mean())))},
+        sliders=[dict(steps=[dict(method='animate', label=label,
+                                  args=[[label], dict(mode='immediate', frame=dict(duration=0, redraw=True))])
+                             for label in labels])],
+        updatemenus=[dict(type='buttons', buttons=[dict(label='Play', method='animate', args=[None])])],
+    )
+    return figure
+
+
+def write_frame_tiles(frames, output_folder, range_color=(0, 100), cmap='plasma'):
+    """
+    Renders every frame as a small PNG tile (one pixel per grid cell, north up) plus an index.json with
+    the timestamps and the geographic bounds, for viewers that overlay images on a map.
+    :return: Path of the index file
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(output_folder, exist_ok=True)
+    labels = pd.DatetimeIndex(frames['times']).strftime('%Y%m%d%H').tolist()
+    for label, grid in zip(labels, frames['grid']):
+        plt.imsave(os.path.join(output_folder, f"frame_{label}.png"), grid[::-1], cmap=cmap,
+                   vmin=range_color[0], vmax=range_color[1])
+
+    index = {
+        'frames': [f"frame_{label}.png" for label in labels],
+        'times': labels,
+        'bounds': [[float(frames['latitudes'].min()), float(frames['longitudes'].min())],
+                   [float(frames['latitudes'].max()), float(frames['longitudes'].max())]],
+    }
+    index_path = os.path.join(output_folder, 'index.json')
+    with open(index_path, 'w') as file:
+        json.dump(index, file)
+    return index_path
@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from data_scraper_nasa import BASE_URL, PARAMETERS
+from grid_fetcher import create_session, fetch_with_retry
+from storage import load_series, save_series
+from data_cleaner import parse_hour_keys
+
+# Longest date range requested in one call, NASA POWER rejects hourly point requests spanning more than a year
+MAX_CHUNK_DAYS = 366
+MISSING_VALUE = -999
+# NASA publishes the latest hours as -999 until they are processed, a few days later they are final
+DEFAULT_REFETCH_DAYS = 7
+
+
+def _day_keys(days):
+    # datetime64[D] days to YYYYMMDD integers
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_numbers = months.astype(np.int64) % 12 + 1
+    day_numbers = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return years * 10000 + month_numbers * 100 + day_numbers
+
+
+def _last_stored_day(series):
+    last_keys = [max(values) for values in series.values() if values]
+    return datetime.strptime(max(last_keys)[:8], '%Y%m%d') if last_keys else None
+
+
+def missing_ranges(series, start_date, end_date, parameters=PARAMETERS, max_chunk_days=MAX_CHUNK_DAYS,
+                   refetch_days=DEFAULT_REFETCH_DAYS):
+    """
+    Finds the date ranges that still have to be downloaded for the requested window.
+    A day is missing as soon as one of its 24 hours is absent for any parameter. A day whose hours are stored
+    but still -999 is only missing within refetch_days of the last stored day: NASA publishes recent hours as -999
+    until they are processed, while older -999 values are permanent gaps that it never back-fills.
+    The hours of the window are compared with the usable stored hours of each parameter as one set difference.
+    Consecutive missing days are merged and split into chunks of at most max_chunk_days.
+    :param series: Stored series, see storage.load_series
+    :param refetch_days: Days before the last stored day whose -999 hours are requested again, None for every day
+    :return: List of (start_date, end_date) tuples in 'YYYYMMDD' format
+    """
+    first = np.datetime64(datetime.strptime(start_date, '%Y%m%d'), 'h')
+    days = np.arange(first.astype('datetime64[D]'),
+                     np.datetime64(datetime.strptime(end_date, '%Y%m%d'), 'D') + 1)
+    n_hours = 24 * len(days)
+
+    last_day = _last_stored_day(series)
+    refetch_from = None if refetch_days is None or last_day is None else last_day - timedelta(days=refetch_days)
+    refetch_from = 0 if refetch_from is None else int(refetch_from.strftime('%Y%m%d'))
+
+    missing = np.zeros(n_hours, dtype=bool)
+    for name in parameters.split(','):
+        values = series.get(name, {})
+        keys = np.fromiter(map(int, values.keys()), dtype=np.int64, count=len(values))
+        # None and NaN are hours another parameter had but this one did not
+        try:
+            stored = np.fromiter(values.values(), dtype=np.float64, count=len(values))
+        except TypeError:
+            stored = np.array(list(values.values()), dtype=np.float64)
+        usable = ~np.isnan(stored) & ~((stored == MISSING_VALUE) & (keys // 100 >= refetch_from))
+
+        # Set difference by position: each usable stored hour marks its slot of the window
+        positions = (parse_hour_keys(keys[usable]).astype('datetime64[h]') - first).astype(np.int64)
+        present = np.zeros(n_hours, dtype=bool)
+        present[positions[(positions >= 0) & (positions < n_hours)]] = True
+        missing |= ~present
+
+    missing_days = [datetime.strptime(str(day), '%Y%m%d')
+                    for day in _day_keys(days[missing.reshape(len(days), 24).any(axis=1)])]
+
+    ranges = []
+    for day in missing_days:
+        if ranges and day - ranges[-1][1] == timedelta(days=1) and (day - ranges[-1][0]).days < max_chunk_days:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+
+    return [(first.strftime('%Y%m%d'), last.strftime('%Y%m%d')) for first, last in ranges]
+
+
+def merge_series(series, new_data):
+    """
+    Merges freshly fetched hours into a stored series in place, new values overwrite old ones.
+    Keys are kept sorted so the series stays in chronological order.
+    """
+    for name, values in new_data.items():
+        merged = series.get(name, {})
+        merged.update(values)
+        series[name] = dict(sorted(merged.items()))
+
+    return series
+
+
+def series_window(series, start_date, end_date):
+    """
+    Extracts a date window from a series, in the same shape as fetch_solar_data returns.
+    """
+    first, last = f"{start_date}00", f"{end_date}23"
+    return {name: {key: value for key, value in values.items() if first <= key <= last}
+            for name, values in series.items()}
+
+
+def update_series(latitude, longitude, start_date, end_date, session=None, max_retries=5, backoff=1.0,
+                  base_url=BASE_URL, refetch_days=DEFAULT_REFETCH_DAYS, data_folder=None):
+    """
+    Brings the stored series of a location up to date for the requested window, downloading
+    only the missing date ranges. The series is stored through the storage backend under data/series.
+    :param refetch_days: See missing_ranges
+    :param data_folder: Folder holding the series folder, defaults to the project data folder
+    :return: Tuple (window data in fetch_solar_data shape, number of requests made)
+    """
+    series = load_series(latitude, longitude, data_folder)
+    ranges = missing_ranges(series, start_date, end_date, refetch_days=refetch_days)
+
+    for chunk_start, chunk_end in ranges:
+        new_data = fetch_with_retry(session, latitude, longitude, chunk_start, chunk_end, max_retries, backoff,
+                                    base_url)
+        merge_series(series, new_data)
+
+    if ranges:
+        save_series(series, latitude, longitude, data_folder=data_folder)
+
+    return series_window(series, start_date, end_date), len(ranges)
+
+
+def update_grid(cells, start_date, end_date, max_workers=8, base_url=BASE_URL, refetch_days=DEFAULT_REFETCH_DAYS,
+                data_folder=None):
+    """
+    Incrementally refreshes every cell of a grid, only requesting the hours each cell is missing.
+    :param cells: List of (latitude, longitude) tuples, see grid_fetcher.build_grid
+    :return: Number of requests made
+    """
+    requests_made = 0
+    session = create_session(max_workers)
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(update_series, lat, lon, start_date, end_date, session, base_url=base_url,
+                                   refetch_days=refetch_days, data_folder=data_folder): (lat, lon)
+                   for lat, lon in cells}
+        for future, (lat, lon) in futures.items():
+            try:
+                _, count = future.result()
+                requests_made += count
+                print(f"({lat:.2f}, {lon:.2f}) up to date, {count} request(s)")
+            except Exception as e:
+                print(f"Error updating data for ({lat:.2f}, {lon:.2f}): {str(e)}")
+
+    print(f"Grid refreshed with {requests_made} request(s) for {len(cells)} locations")
+    return requests_made
+
+
+# to test script when running it directly, location : london, refreshing the last week of 2023
+if __name__ == "__main__":
+    try:
+        latitude, longitude = 51.54501, -0.00564
+        start_date, end_date = '20231225', '20231231'
+        window, count = update_series(latitude, longitude, start_date, end_date)
+        print(f"{count} request(s) made, {len(window.get('ALLSKY_SFC_SW_DWN', {}))} hours available")
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
@@ -0,0 +1,224 @@
+import cProfile
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+PROFILES_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data', 'profiles')
+# Upper bounds (seconds) of the latency histogram buckets, from a cached read to a long training run
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Counter names used across the pipeline
+COUNTERS = ('requests', 'retries', 'bytes_downloaded', 'bytes_written', 'bytes_read', 'rows_cleaned',
+            'rows_trained', 'cache_hits', 'cache_misses')
+
+
+class Metrics:
+    """
+    Thread-safe registry of per-stage latency histograms and pipeline counters.
+    A stage is timed with the timed decorator or the stage context manager. When profiling is enabled,
+    each thread runs its innermost stage calls under its own cProfile, and a profile is kept only if the call was
+    slower than the threshold. Stages enclosing other stages are not profiled, their time is in the nested ones.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self._lock = threading.Lock()
+        # Per thread stack of the profilers of the stages being run, None for a stage without one
+        self._local = threading.local()
+        # Worker threads save many profiles per second, a sequence number keeps the file names apart
+        self._profile_ids = itertools.count()
+        self.profile_threshold = None
+        self.profiles_folder = PROFILES_FOLDER
+        # Individual durations of the stages listed by collect_samples
+        self._samples = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def collect_samples(self, *stages):
+        """
+        Keeps every duration of the given stages, for exact percentiles over a bounded run such as a load test.
+        The histograms only give bucket bounds. Called without stages, collection stops.
+        """
+        with self._lock:
+            self._samples = {stage: [] for stage in stages}
+
+    def samples(self, stage):
+        """
+        :return: Seconds of each call of a stage since collect_samples
+        """
+        with self._lock:
+            return list(self._samples.get(stage, ()))
+
+    def enable_profiling(self, threshold, profiles_folder=None):
+        """
+        Profiles stage calls and saves the ones slower than threshold seconds as .prof files
+        (readable with pstats or snakeviz).
+        :param threshold: Seconds, None disables profiling
+        """
+        self.profile_threshold = threshold
+        self.profiles_folder = profiles_folder or PROFILES_FOLDER
+
+    def observe(self, stage, seconds):
+        """
+        Records one call of a stage.
+        """
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                              'buckets': np.zeros(len(self.buckets), dtype=np.int64)}
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            # Buckets are cumulative, as Prometheus expects them
+            entry['buckets'][self.buckets >= seconds] += 1
+            if stage in self._samples:
+                self._samples[stage].append(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one call of a stage.
+        """
+        stack = getattr(self._local, 'profilers', None)
+        if stack is None:
+            stack = self._local.profilers = []
+        profiler = None
+        if self.profile_threshold is not None:
+            # The enclosing stage is no longer a leaf, its profile is dropped
+            if stack and stack[-1] is not None:
+                stack[-1].disable()
+                stack[-1] = None
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # From Python 3.12 only one profiler can be active in the whole process
+                profiler = None
+        stack.append(profiler)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            profiler = stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                if elapsed >= self.profile_threshold:
+                    self._save_profile(profiler, name, elapsed)
+            self.observe(name, elapsed)
+
+    def _save_profile(self, profiler, name, elapsed):
+        os.makedirs(self.profiles_folder, exist_ok=True)
+        path = os.path.join(self.profiles_folder, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}_"
+                                                  f"{threading.get_ident()}_{next(self._profile_ids)}.prof")
+        profiler.dump_stats(path)
+        print(f"Stage {name} took {elapsed:.2f}s, profile saved to {path}")
+
+    def to_dict(self):
+        """
+        :return: Dictionary with the counters and, per stage, the call count, total, mean and maximum
+                 seconds and the cumulative bucket counts keyed by upper bound
+        """
+        with self._lock:
+            stages = {}
+            for name, entry in self.stages.items():
+                stages[name] = {
+                    'count': entry['count'],
+                    'sum': entry['sum'],
+                    'mean': entry['sum'] / entry['count'],
+                    'max': entry['max'],
+                    'buckets': {str(bound): int(count) for bound, count in zip(self.buckets, entry['buckets'])},
+                }
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def to_json(self, path=None):
+        """
+        :param path: Optional file to write the metrics to
+        :return: JSON text
+        """
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+    def to_prometheus(self, prefix='solar'):
+        """
+        :return: Metrics in the Prometheus text exposition format
+        """
+        metrics = self.to_dict()
+        lines = [f"# HELP {prefix}_stage_duration_seconds Duration of the pipeline stages",
+                 f"# TYPE {prefix}_stage_duration_seconds histogram"]
+        for name, entry in metrics['stages'].items():
+            for bound, total in entry['buckets'].items():
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {total}')
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{name}"}} {entry["sum"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{name}"}} {entry["count"]}')
+        for name, value in metrics['counters'].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Prints one line per stage, slowest total first, and the non-zero counters.
+        """
+        metrics = self.to_dict()
+        for name, entry in sorted(metrics['stages'].items(), key=lambda item: -item[1]['sum']):
+            print(f"{name}: {entry['count']} call(s), {entry['sum']:.2f}s total, "
+                  f"{entry['mean'] * 1000:.1f}ms mean, {entry['max'] * 1000:.1f}ms max")
+        print(", ".join(f"{name}={value}" for name, value in metrics['counters'].items() if value))
+
+
+# Registry shared by the whole pipeline
+METRICS = Metrics()
+# Setting SOLAR_PROFILE_SECONDS profiles the stages slower than that many seconds
+if os.environ.get('SOLAR_PROFILE_SECONDS'):
+    METRICS.enable_profiling(float(os.environ['SOLAR_PROFILE_SECONDS']))
+
+
+def timed(stage, rows_counter=None, metrics=None):
+    """
+    Decorator recording every call of a function as one call of a stage.
+    :param rows_counter: Counter incremented by the length of the returned DataFrame, e.g. 'rows_cleaned'
+    :param metrics: Metrics registry, defaults to METRICS
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            registry = metrics or METRICS
+            with registry.stage(stage):
+                result = function(*args, **kwargs)
+            if rows_counter is not None and hasattr(result, 'shape'):
+                registry.increment(rows_counter, len(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Increments a counter of the shared registry.
+    """
+    METRICS.increment(name, value)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
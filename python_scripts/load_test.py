@@ -0,0 +1,106 @@
+import contextlib
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from power_simulator import PowerSimulator
+from solar_irradiance_map import downloading_data
+from storage import list_cleaned
+from grid_fetcher import build_grid
+from instrumentation import METRICS
+
+# Fault profiles worth comparing: a fast server, a slow one, a flaky one and a rate limited one
+SCENARIOS = {
+    'baseline': {},
+    'latency': {'latency': 0.05, 'jitter': 0.1},
+    'errors': {'error_rate': 0.05},
+    'throttled': {'rate_limit': 20},
+}
+
+
+def run_load_test(latitude=51.5, longitude=0.0, start_date='20230101', end_date='20230131', area_lat=0.5,
+                  area_long=0.5, interval=0.1, max_workers=8, keep_raw=False, verbose=False, **simulator_options):
+    """
+    Starts a PowerSimulator, drives downloading_data against it for a grid around (latitude, longitude) and
+    reports the throughput, the latency seen by the server and by the client, and the client's retries.
+    The client latency of a request runs from sending it to parsing its response, connection waits included.
+    The cleaned cells go to a temporary folder and the response cache is not used, so every cell is requested.
+    :param verbose: Show the per-cell progress of the pipeline
+    :param simulator_options: Keyword arguments of PowerSimulator: latency, jitter, error_rate, throttle_rate,
+                              rate_limit, burst, retry_after...
+    :return: Dictionary with the number of cells, persisted cells, requests, requests and cells per second,
+             responses per status code, retries, megabytes downloaded and the p50/p95/p99/max latency (ms) of the
+             server (server_p50_ms...) and of the client (client_p50_ms...)
+    """
+    before = METRICS.to_dict()['counters']
+    METRICS.collect_samples('fetch_solar_data')
+    try:
+        with PowerSimulator(**simulator_options) as simulator, tempfile.TemporaryDirectory() as data_folder:
+            started = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, \
+                    contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull):
+                downloading_data(latitude, longitude, start_date, end_date, area_lat, area_long, interval,
+                                 max_workers=max_workers, base_url=simulator.base_url, cache=None,
+                                 keep_raw=keep_raw, data_folder=data_folder)
+            elapsed = time.perf_counter() - started
+            persisted = len(list_cleaned(start_date, end_date, data_folder))
+            stats = simulator.stats()
+        # Each fetch_solar_data call is one request as the client sees it, retries being separate calls
+        client = np.asarray(METRICS.samples('fetch_solar_data'))
+    finally:
+        METRICS.collect_samples()
+    after = METRICS.to_dict()['counters']
+
+    report = {
+        'cells': len(build_grid(latitude, longitude, area_lat, area_long, interval)),
+        'persisted': persisted,
+        'seconds': elapsed,
+        'requests': stats['requests'],
+        'requests_per_s': stats['requests'] / elapsed,
+        'cells_per_s': persisted / elapsed,
+        'statuses': stats['statuses'],
+        'retries': after.get('retries', 0) - before.get('retries', 0),
+        'mb_downloaded': (after.get('bytes_downloaded', 0) - before.get('bytes_downloaded', 0)) / 2 ** 20,
+    }
+    for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+        report[f"server_{name}_ms"] = stats[name] * 1000 if stats[name] is not None else None
+        report[f"client_{name}_ms"] = float(np.percentile(client, q)) * 1000 if len(client) else None
+    return report
+
+
+def _milliseconds(value):
+    # Percentiles are None when no request was made
+    return "n/a" if value is None else f"{value:.1f}ms"
+
+
+def print_report(name, report):
+    statuses = ", ".join(f"{status}: {total}" for status, total in sorted(report['statuses'].items()))
+    print(f"{name}: {report['persisted']}/{report['cells']} cells in {report['seconds']:.1f}s, "
+          f"{report['requests_per_s']:.1f} req/s ({statuses}), {report['retries']} retries, "
+          f"server latency p50 {_milliseconds(report['server_p50_ms'])} "
+          f"p95 {_milliseconds(report['server_p95_ms'])} p99 {_milliseconds(report['server_p99_ms'])}, "
+          f"client latency p50 {_milliseconds(report['client_p50_ms'])} "
+          f"p95 {_milliseconds(report['client_p95_ms'])} p99 {_milliseconds(report['client_p99_ms'])}")
+
+
+def run_scenarios(scenarios=None, **options):
+    """
+    Runs the load test once per fault profile.
+    :param scenarios: Dictionary {name: PowerSimulator keyword arguments}, defaults to SCENARIOS
+    :param options: Keyword arguments of run_load_test shared by every scenario (grid, dates, workers...)
+    :return: DataFrame with one row per scenario
+    """
+    rows = []
+    for name, simulator_options in (scenarios or SCENARIOS).items():
+        report = run_load_test(**options, **simulator_options)
+        print_report(name, report)
+        rows.append({'scenario': name, **report})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    try:
+        print(run_scenarios().drop(columns=['statuses']))
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
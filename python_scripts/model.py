@@ -1,36 +1,34 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from storage import load_cleaned
+from features import months, seasons_from_months
+from instrumentation import timed, count
 pd.set_option('display.max_columns', None)
 season_mapping = {1: "Winter", 2: "Spring", 3: "Summer", 4: "Fall"}
+# Columns of the results table returned by the batch training functions
+RESULT_COLUMNS = ['Latitude', 'Longitude', 'Season_Encoded', 'Intercept', 'Coef_Temperature', 'Coef_Solar_zenith_angle',
+                  'R2', 'MAE', 'MSE', 'N_train', 'N_test']
+# Fewer rows than this cannot be split into a train and a test set worth evaluating: the 20 % test split
+# needs at least 2 rows for R² to be defined
+MIN_ROWS_PER_MODEL = 20
 
 def assign_season(df):
     """
     Assigns a season based on the month in the DateTime column and encodes the season into a numerical label.
-    Seasons for London
+    Seasons for London (northern hemisphere, rows with a negative Latitude get the southern seasons)
     - Winter: December, January, February (12, 1, 2) -> 1
     - Spring: March, April, May (3, 4, 5) -> 2
     - Summer: June, July, August (6, 7, 8) -> 3
     - Fall: September, October, November (9, 10, 11) -> 4
     """
 
-    # Define function to map months to seasons
-    def get_season(month):
-        if month in [12, 1, 2]:
-            return 1  # Winter
-        elif month in [3, 4, 5]:
-            return 2  # Spring
-        elif month in [6, 7, 8]:
-            return 3  # Summer
-        elif month in [9, 10, 11]:
-            return 4  # Fall
-
-    # Extract month from DateTime and assign seasons
-    df['Month'] = df['DateTime'].dt.month
-    df['Season_Encoded'] = df['Month'].apply(get_season)
+    # Month and season come from a lookup table indexed by the month instead of a Python call per row
+    month = months(df['DateTime'])
+    latitudes = df['Latitude'].to_numpy() if 'Latitude' in df.columns else None
+    df['Month'] = month
+    df['Season_Encoded'] = seasons_from_months(month, latitudes)
 
     return df
 
@@ -42,11 +40,11 @@ def feature_engineering(df):
     :param df: Cleaned pandas DataFrame.
     :return: DataFrame with new features for modeling.
     """
-
-    df_clean = df.dropna(subset=['Solar_Irradiance', 'Solar_zenith_angle', 'Temperature', 'Season_Encoded'])
-    df_clean = df_clean[df_clean['Solar_Irradiance'] != 0.00]
+    columns = ['Solar_Irradiance', 'Solar_zenith_angle', 'Temperature', 'Season_Encoded']
+    # Missing values and zero irradiance are filtered with a single mask, so only the final selection is copied
+    mask = df[columns].notna().all(axis=1) & (df['Solar_Irradiance'] != 0.00)
     # Keep relevant features (including the target)
-    features = df_clean[['Solar_Irradiance', 'Solar_zenith_angle', 'Temperature', 'Season_Encoded','DateTime']]
+    features = df.loc[mask, ['Solar_Irradiance', 'Solar_zenith_angle', 'Temperature', 'Season_Encoded','DateTime']]
 
     return features
 
@@ -57,6 +55,9 @@ def split_data(df):
     :param df: DataFrame with features.
     :return: X_train, X_test, y_train, y_test
     """
+    # sklearn is slow to import, so it is only loaded by the functions that train
+    from sklearn.model_selection import train_test_split
+
     # Define target variable and features
     x = df[['Temperature','Solar_zenith_angle']]
     y = df['Solar_Irradiance']
@@ -74,6 +75,7 @@ def train_model(X_train, y_train):
     :param y_train: Training target variable (solar irradiance).
     :return: Trained model.
     """
+    from sklearn.linear_model import LinearRegression
     model = LinearRegression()
     model.fit(X_train, y_train)
     r_sq = model.score(X_train, y_train)
@@ -88,6 +90,7 @@ def evaluate_model(model, X_test, y_test):
     :param X_test: Test features.
     :param y_test: True values for the test set.
     """
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
     # Predict on the test set
     y_pred = model.predict(X_test)
 
@@ -106,6 +109,7 @@ def evaluate_model(model, X_test, y_test):
 
     return y_pred
 
+@timed('train_and_evaluate_by_season')
 def train_and_evaluate_by_season(df):
     """
     Trains and evaluates separate models for each season.
@@ -113,6 +117,7 @@ def train_and_evaluate_by_season(df):
     """
     results = {}
     seasons = df['Season_Encoded'].unique()
+    count('rows_trained', len(df))
 
     for season in seasons:
 
@@ -141,14 +146,76 @@ def train_and_evaluate_by_season(df):
     return results
 
 
+def _fit_site(site):
+    """
+    Trains one model per season for a single site, the unit of work of train_by_site_and_season.
+    Runs in a worker process, so it only returns plain result rows.
+    """
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    (latitude, longitude), df = site
+    rows = []
+
+    for season in sorted(df['Season_Encoded'].dropna().unique()):
+        features = feature_engineering(df[df['Season_Encoded'] == season])
+        if len(features) < MIN_ROWS_PER_MODEL:
+            continue
+
+        X_train, X_test, y_train, y_test = split_data(features)
+        model = LinearRegression()
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_test)
+
+        rows.append({
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'Season_Encoded': int(season),
+            'Intercept': model.intercept_,
+            'Coef_Temperature': model.coef_[0],
+            'Coef_Solar_zenith_angle': model.coef_[1],
+            'R2': r2_score(y_test, y_pred),
+            'MAE': mean_absolute_error(y_test, y_pred),
+            'MSE': mean_squared_error(y_test, y_pred),
+            'N_train': len(X_train),
+            'N_test': len(X_test),
+        })
+
+    return rows
+
+@timed('train_by_site_and_season')
+def train_by_site_and_season(df, max_workers=None, chunksize=8):
+    """
+    Trains and evaluates one model per (site, season) for a multi-site frame, spreading the sites over a process pool.
+    Each model is fitted and evaluated exactly like train_and_evaluate_by_season does it.
+    :param df: Multi-site DataFrame as returned by load_cleaned_solar_data, with Latitude, Longitude, DateTime,
+               Solar_Irradiance, Temperature and Solar_zenith_angle columns.
+    :param max_workers: Number of worker processes, defaults to the number of CPUs
+    :param chunksize: Number of sites sent to a worker at once
+    :return: DataFrame with one row per (site, season): coefficients, R², MAE, MSE and train/test sizes
+    """
+    if 'Season_Encoded' not in df.columns:
+        df = assign_season(df)
+
+    columns = ['Latitude', 'Longitude', 'DateTime', 'Solar_Irradiance', 'Temperature', 'Solar_zenith_angle',
+               'Season_Encoded']
+    sites = df[columns].groupby(['Latitude', 'Longitude'], sort=False)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for rows in executor.map(_fit_site, sites, chunksize=chunksize):
+            results.extend(rows)
+
+    count('rows_trained', len(df))
+    print(f"Trained {len(results)} models for {sites.ngroups} sites")
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
 if __name__ == "__main__":
     try:
         # Load the cleaned solar data
         start_date , end_date = '20230101', '20240101'
-        data_folder = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data')
-        filename = f"cleaned_solar_data_{start_date}_to_{end_date}.json"
-        file_path = os.path.join(data_folder, filename)
-        cleaned_data = pd.read_json(file_path)
+        latitude, longitude = 51.54501, -0.00564
+        cleaned_data = load_cleaned(latitude, longitude, start_date, end_date)
 
         # Assign seasons
         cleaned_data = assign_season(cleaned_data)
@@ -157,6 +224,12 @@ if __name__ == "__main__":
         features = feature_engineering(cleaned_data)
 
         # Group and analyze by season
-        train_and_evaluate_by_season(features)
+        results = train_and_evaluate_by_season(features)
+
+        # Keep the trained coefficients so predictions and plots do not need to retrain
+        from model_registry import ModelRegistry, season_results_to_table
+        from storage import data_version
+        table = season_results_to_table(results, latitude, longitude)
+        ModelRegistry.from_results(table, data_version(start_date, end_date)).save()
     except Exception as e:
         print(f"An error occurred: {str(e)}")
\ No newline at end of file
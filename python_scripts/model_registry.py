@@ -0,0 +1,159 @@
+import os
+import numpy as np
+import pandas as pd
+from model import RESULT_COLUMNS
+from storage import data_version
+from features import SEASON_BY_MONTH, SOUTHERN_SEASON_BY_MONTH, seasons_from_months
+from solar_geometry import solar_zenith_angle
+
+MODELS_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'models')
+METRIC_COLUMNS = ['R2', 'MAE', 'MSE', 'N_train', 'N_test']
+COEFFICIENT_COLUMNS = ['Intercept', 'Coef_Temperature', 'Coef_Solar_zenith_angle']
+
+
+def registry_path(version, models_folder=None):
+    return os.path.join(models_folder or MODELS_FOLDER, f"model_registry_{version}.npz")
+
+
+def season_results_to_table(results, latitude, longitude):
+    """
+    Converts the dictionary returned by train_and_evaluate_by_season for one site into results table rows.
+    :return: DataFrame with the columns of model.RESULT_COLUMNS
+    """
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    rows = []
+    for season, (model, y_pred, X_train, X_test, y_train, y_test) in results.items():
+        rows.append({
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'Season_Encoded': int(season),
+            'Intercept': model.intercept_,
+            'Coef_Temperature': model.coef_[0],
+            'Coef_Solar_zenith_angle': model.coef_[1],
+            'R2': r2_score(y_test, y_pred),
+            'MAE': mean_absolute_error(y_test, y_pred),
+            'MSE': mean_squared_error(y_test, y_pred),
+            'N_train': len(X_train),
+            'N_test': len(X_test),
+        })
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+class ModelRegistry:
+    """
+    Compact store of the per-(site, season) linear models of one data version.
+    Coefficients are kept in a dense (sites x 5 x 3) array indexed by site and season code, so a prediction
+    is a nearest-site lookup followed by a dot product of three values.
+    """
+
+    def __init__(self, latitudes, longitudes, coefficients, metrics, version):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.coefficients = coefficients
+        self.metrics = metrics
+        self.version = version
+        self._cos_latitudes = np.cos(np.radians(self.latitudes))
+        self._site_lookup = {(round(lat, 6), round(lon, 6)): i
+                             for i, (lat, lon) in enumerate(zip(self.latitudes.tolist(), self.longitudes.tolist()))}
+
+    @classmethod
+    def from_results(cls, results, version):
+        """
+        Builds a registry from a results table (train_by_site_and_season or fit_grouped_least_squares).
+        """
+        sites = results[['Latitude', 'Longitude']].drop_duplicates().sort_values(['Latitude', 'Longitude'])
+        site_index = pd.MultiIndex.from_frame(sites)
+        rows = site_index.get_indexer(pd.MultiIndex.from_frame(results[['Latitude', 'Longitude']]))
+        seasons = results['Season_Encoded'].to_numpy(dtype=np.int64)
+
+        coefficients = np.full((len(sites), 5, len(COEFFICIENT_COLUMNS)), np.nan)
+        coefficients[rows, seasons] = results[COEFFICIENT_COLUMNS].to_numpy(dtype=np.float64)
+        metrics = np.full((len(sites), 5, len(METRIC_COLUMNS)), np.nan)
+        metrics[rows, seasons] = results[METRIC_COLUMNS].to_numpy(dtype=np.float64)
+
+        return cls(sites['Latitude'].to_numpy(), sites['Longitude'].to_numpy(), coefficients, metrics, version)
+
+    def save(self, models_folder=None):
+        """
+        Saves the registry to models/model_registry_{version}.npz.
+        :return: Path of the written file
+        """
+        path = registry_path(self.version, models_folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(path, latitudes=self.latitudes, longitudes=self.longitudes,
+                            coefficients=self.coefficients, metrics=self.metrics, version=self.version)
+        print(f"Models are saved to {path}")
+        return path
+
+    @classmethod
+    def load(cls, version, models_folder=None):
+        with np.load(registry_path(version, models_folder)) as data:
+            return cls(data['latitudes'], data['longitudes'], data['coefficients'], data['metrics'],
+                       str(data['version']))
+
+    def to_results(self):
+        """
+        Returns the registry content as a results table.
+        """
+        sites, seasons = np.nonzero(~np.isnan(self.coefficients[:, :, 0]))
+        table = pd.DataFrame({'Latitude': self.latitudes[sites], 'Longitude': self.longitudes[sites],
+                              'Season_Encoded': seasons})
+        table[COEFFICIENT_COLUMNS] = self.coefficients[sites, seasons]
+        table[METRIC_COLUMNS] = self.metrics[sites, seasons]
+        return table[RESULT_COLUMNS]
+
+    def nearest_site(self, latitude, longitude):
+        """
+        Index of the site closest to a location, exact grid points are found without a search.
+        """
+        index = self._site_lookup.get((round(latitude, 6), round(longitude, 6)))
+        if index is not None:
+            return index
+        # Longitude differences shrink with latitude, an equirectangular distance is enough to rank grid sites
+        d_lat = self.latitudes - latitude
+        d_lon = (self.longitudes - longitude) * self._cos_latitudes
+        return int(np.argmin(d_lat * d_lat + d_lon * d_lon))
+
+    def predict(self, latitude, longitude, datetime, temperature, zenith=None):
+        """
+        Predicts the solar irradiance of one location and hour with the model of the nearest site.
+        :param datetime: datetime, pandas Timestamp or anything pd.Timestamp accepts
+        :param zenith: Solar zenith angle, computed from the location and time when None (so future hours work)
+        :return: Predicted irradiance, NaN if the nearest site has no model for that season
+        """
+        if zenith is None:
+            zenith = float(solar_zenith_angle(pd.Timestamp(datetime).to_datetime64(), latitude, longitude, 'LST', 0.5))
+        month = datetime.month if hasattr(datetime, 'month') else pd.Timestamp(datetime).month
+        site = self.nearest_site(latitude, longitude)
+        # Seasons follow the hemisphere of the site, as in model.assign_season
+        season = (SOUTHERN_SEASON_BY_MONTH if self.latitudes[site] < 0 else SEASON_BY_MONTH)[month]
+        intercept, coef_temperature, coef_zenith = self.coefficients[site, season]
+        return float(intercept + coef_temperature * temperature + coef_zenith * zenith)
+
+    def nearest_sites(self, latitudes, longitudes, chunk_size=4096):
+        """
+        Vectorised nearest_site for arrays of locations, processed in chunks to bound memory.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        sites = np.empty(len(latitudes), dtype=np.int64)
+        for start in range(0, len(latitudes), chunk_size):
+            end = start + chunk_size
+            d_lat = self.latitudes[None, :] - latitudes[start:end, None]
+            d_lon = (self.longitudes[None, :] - longitudes[start:end, None]) * self._cos_latitudes[None, :]
+            sites[start:end] = np.argmin(d_lat * d_lat + d_lon * d_lon, axis=1)
+        return sites
+
+    def predict_batch(self, latitudes, longitudes, datetimes, temperatures, zeniths=None):
+        """
+        Predicts the solar irradiance for arrays of locations, hours, temperatures and zenith angles.
+        :param zeniths: Solar zenith angles, computed from the locations and times when None
+        :return: numpy array of predictions
+        """
+        if zeniths is None:
+            zeniths = solar_zenith_angle(datetimes, latitudes, longitudes, 'LST', 0.5)
+        months = np.asarray(datetimes, dtype='datetime64[M]').astype(np.int64) % 12 + 1
+        sites = self.nearest_sites(latitudes, longitudes)
+        coefficients = self.coefficients[sites, seasons_from_months(months, self.latitudes[sites])]
+        return (coefficients[:, 0] + coefficients[:, 1] * np.asarray(temperatures, dtype=np.float64)
+                + coefficients[:, 2] * np.asarray(zeniths, dtype=np.float64))
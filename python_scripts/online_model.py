@@ -0,0 +1,246 @@
+import os
+import numpy as np
+import pandas as pd
+from model import assign_season, RESULT_COLUMNS, MIN_ROWS_PER_MODEL
+from batched_regression import FEATURES, TARGET, GROUP_COLUMNS, design_matrix, grouped_sufficient_statistics, \
+    solve_normal_equations
+from instrumentation import timed, count
+from model_registry import MODELS_FOLDER
+
+# Weight of the newest error in the rolling metrics, about the last 1 / alpha hours are averaged
+DEFAULT_METRIC_ALPHA = 0.01
+ONE_HOUR = np.timedelta64(1, 'h')
+
+
+def online_models_path(name='online', models_folder=None):
+    return os.path.join(models_folder or MODELS_FOLDER, f"online_models_{name}.npz")
+
+
+class OnlineModels:
+    """
+    Per-(site, season) linear models of Solar_Irradiance on Temperature and Solar_zenith_angle kept up to date from
+    running sufficient statistics (XtX, Xty, y'y and the weight sum of each group), so new hourly rows are folded in
+    without touching the history: an update costs O(new rows + groups they touch).
+    With a half-life, older hours are forgotten exponentially, the statistics being scaled down by the time elapsed
+    since the group's last update. Error metrics are prequential: new rows are first predicted with the current
+    coefficients and the errors feed exponentially weighted moving averages (MAE, MSE and the target variance for R²).
+    """
+
+    STATE = ['xtx', 'xty', 'yty', 'weight', 'coefficients', 'ewma_abs', 'ewma_sq', 'ewma_y', 'ewma_y2',
+             'n_seen', 'n_evaluated', 'last_hour']
+
+    def __init__(self, half_life_hours=None, metric_alpha=DEFAULT_METRIC_ALPHA, name='online'):
+        """
+        :param half_life_hours: Age in hours at which a row counts half, None keeps every row at full weight
+        :param metric_alpha: Smoothing factor of the rolling error metrics
+        """
+        self.half_life_hours = half_life_hours
+        self.metric_alpha = metric_alpha
+        self.name = name
+        self.keys = pd.DataFrame({'Latitude': np.zeros(0), 'Longitude': np.zeros(0),
+                                  'Season_Encoded': np.zeros(0, dtype=np.int64)})
+        p = len(FEATURES) + 1
+        self.xtx = np.zeros((0, p, p))
+        self.xty = np.zeros((0, p))
+        self.coefficients = np.zeros((0, p))
+        for state in ('yty', 'weight', 'ewma_abs', 'ewma_sq', 'ewma_y', 'ewma_y2'):
+            setattr(self, state, np.zeros(0))
+        self.n_seen = np.zeros(0, dtype=np.int64)
+        self.n_evaluated = np.zeros(0, dtype=np.int64)
+        # Hours since the epoch of the newest row of each group
+        self.last_hour = np.zeros(0, dtype=np.int64)
+        # (latitude, longitude, season) -> group id, the row of the group in keys and in the state arrays
+        self._group_ids = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _group_codes(self, keys):
+        # Maps each row's (site, season) to a group through a dictionary lookup of the batch's distinct keys,
+        # appending the groups seen for the first time
+        batch_codes, uniques = pd.factorize(pd.MultiIndex.from_frame(keys))
+        ids = np.fromiter((self._group_ids.get(key, -1) for key in uniques), dtype=np.int64, count=len(uniques))
+        new = ids < 0
+        if new.any():
+            added = int(new.sum())
+            ids[new] = np.arange(len(self.keys), len(self.keys) + added)
+            new_keys = uniques[new].to_frame(index=False, name=GROUP_COLUMNS)
+            self.keys = pd.concat([self.keys, new_keys], ignore_index=True)
+            self._group_ids.update(zip(uniques[new], ids[new].tolist()))
+            p = self.xtx.shape[1]
+            self.xtx = np.concatenate([self.xtx, np.zeros((added, p, p))])
+            self.xty = np.concatenate([self.xty, np.zeros((added, p))])
+            self.coefficients = np.concatenate([self.coefficients, np.full((added, p), np.nan)])
+            for state in ('yty', 'weight', 'ewma_abs', 'ewma_sq', 'ewma_y', 'ewma_y2'):
+                setattr(self, state, np.concatenate([getattr(self, state), np.zeros(added)]))
+            for state in ('n_seen', 'n_evaluated'):
+                setattr(self, state, np.concatenate([getattr(self, state), np.zeros(added, dtype=np.int64)]))
+            self.last_hour = np.concatenate([self.last_hour, np.full(added, np.iinfo(np.int64).min)])
+        return ids[batch_codes]
+
+    def _ewma(self, state, local, values, ranks, sizes, groups):
+        # Exact sequential EWMA over each group's new values in time order, computed in one pass:
+        # the previous value decays by (1 - a)^k and the i-th of k new values is weighted a * (1 - a)^(k - 1 - i)
+        # local indexes groups, the ids of the groups the batch touches; groups without a value are left alone
+        a = self.metric_alpha
+        weights = a * (1 - a) ** (sizes[local] - 1 - ranks)
+        update = np.bincount(local, weights=weights * values, minlength=len(groups))
+        present = sizes > 0
+        touched, sizes, update = groups[present], sizes[present], update[present]
+        current = getattr(self, state)
+        first = self.n_evaluated[touched] == 0
+        # The first evaluated hour of a group starts the average instead of being blended with zero
+        decay = np.where(first, 0.0, (1 - a) ** sizes)
+        scale = np.where(first, 1 / (1 - (1 - a) ** sizes), 1.0)
+        current[touched] = decay * current[touched] + scale * update
+
+    @timed('online_update')
+    def update(self, df, latitude=None, longitude=None):
+        """
+        Folds new hourly rows into the models. Rows are filtered as in feature_engineering and rows at or before
+        their group's newest hour are ignored, so overlapping windows can be fed safely.
+        Only the groups of the new rows are read and written, the other groups are not visited.
+        :param df: Cleaned DataFrame with DateTime, Solar_Irradiance, Temperature and Solar_zenith_angle, plus
+                   Latitude/Longitude for multi-site data
+        :param latitude: Site latitude when df has no Latitude column
+        :param longitude: Site longitude when df has no Longitude column
+        :return: Number of rows folded in
+        """
+        if 'Latitude' not in df.columns:
+            df = df.assign(Latitude=latitude, Longitude=longitude)
+        if 'Season_Encoded' not in df.columns:
+            df = assign_season(df.copy())
+        mask = df[FEATURES + [TARGET, 'Season_Encoded']].notna().all(axis=1).to_numpy() & (
+                df[TARGET].to_numpy() != 0.0)
+        rows = df.loc[mask, GROUP_COLUMNS + FEATURES + [TARGET, 'DateTime']]
+        rows = rows.astype({'Season_Encoded': np.int64})
+        if rows.empty:
+            return 0
+
+        hours = (rows['DateTime'].to_numpy().astype('datetime64[h]') - np.datetime64(0, 'h')) // ONE_HOUR
+        codes = self._group_codes(rows[GROUP_COLUMNS])
+        fresh = hours > self.last_hour[codes]
+        if not fresh.any():
+            return 0
+        order = np.lexsort((hours[fresh], codes[fresh]))
+        codes, hours = codes[fresh][order], hours[fresh][order]
+        x = rows[FEATURES].to_numpy(dtype=np.float64)[fresh][order]
+        y = rows[TARGET].to_numpy(dtype=np.float64)[fresh][order]
+
+        # Everything below is indexed by the touched groups only: local is the position of a row's group in touched
+        touched, local = np.unique(codes, return_inverse=True)
+        sizes = np.bincount(local, minlength=len(touched))
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        ranks = np.arange(len(codes)) - starts[local]
+
+        # Test, then train: the new rows are scored with the coefficients fitted before them
+        scored = ~np.isnan(self.coefficients[codes, 0])
+        if scored.any():
+            residuals = y[scored] - np.einsum('ij,ij->i', design_matrix(x[scored]), self.coefficients[codes[scored]])
+            scored_local = local[scored]
+            scored_sizes = np.bincount(scored_local, minlength=len(touched))
+            scored_starts = np.concatenate([[0], np.cumsum(scored_sizes)[:-1]])
+            scored_ranks = np.arange(len(scored_local)) - scored_starts[scored_local]
+            for state, values in (('ewma_abs', np.abs(residuals)), ('ewma_sq', residuals ** 2),
+                                  ('ewma_y', y[scored]), ('ewma_y2', y[scored] ** 2)):
+                self._ewma(state, scored_local, values, scored_ranks, scored_sizes, touched)
+            self.n_evaluated[touched] += scored_sizes
+
+        # Rows are sorted by hour within their group, the last one is the newest
+        newest = hours[starts + sizes - 1]
+        weights = None
+        if self.half_life_hours is not None:
+            decay = 0.5 ** (1.0 / self.half_life_hours)
+            # Old statistics age by the hours between the previous and the new newest row of the group
+            had_rows = self.n_seen[touched] > 0
+            elapsed = np.where(had_rows, newest - self.last_hour[touched], 0)
+            factor = decay ** elapsed
+            self.xtx[touched] *= factor[:, None, None]
+            self.xty[touched] *= factor[:, None]
+            self.yty[touched] *= factor
+            self.weight[touched] *= factor
+            weights = decay ** (newest[local] - hours)
+
+        xtx, xty, yty, weight = grouped_sufficient_statistics(local, x, y, len(touched), weights)
+        self.xtx[touched] += xtx
+        self.xty[touched] += xty
+        self.yty[touched] += yty
+        self.weight[touched] += weight
+        self.n_seen[touched] += sizes
+        self.last_hour[touched] = newest
+
+        solvable = touched[self.n_seen[touched] >= max(MIN_ROWS_PER_MODEL, len(FEATURES) + 1)]
+        if len(solvable):
+            self.coefficients[solvable] = solve_normal_equations(self.xtx[solvable], self.xty[solvable])
+
+        count('rows_trained', len(codes))
+        return len(codes)
+
+    def results(self):
+        """
+        Current models as a results table (model.RESULT_COLUMNS), usable with ModelRegistry.from_results.
+        R², MAE and MSE are the rolling prequential metrics, N_train the rows folded in and N_test the rows scored.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = self.ewma_y2 - self.ewma_y ** 2
+            r2 = np.where(self.n_evaluated > 0, 1 - self.ewma_sq / variance, np.nan)
+        evaluated = self.n_evaluated > 0
+        table = self.keys.assign(
+            Intercept=self.coefficients[:, 0],
+            Coef_Temperature=self.coefficients[:, 1],
+            Coef_Solar_zenith_angle=self.coefficients[:, 2],
+            R2=r2,
+            MAE=np.where(evaluated, self.ewma_abs, np.nan),
+            MSE=np.where(evaluated, self.ewma_sq, np.nan),
+            N_train=self.n_seen,
+            N_test=self.n_evaluated,
+        )
+        table = table[~np.isnan(self.coefficients[:, 0])].reset_index(drop=True)
+        return table[RESULT_COLUMNS]
+
+    def save(self, models_folder=None):
+        """
+        Saves the statistics and settings to models/online_models_{name}.npz.
+        :return: Path of the written file
+        """
+        path = online_models_path(self.name, models_folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, keys=self.keys.to_numpy(dtype=np.float64),
+                 half_life_hours=np.nan if self.half_life_hours is None else self.half_life_hours,
+                 metric_alpha=self.metric_alpha, **{state: getattr(self, state) for state in self.STATE})
+        print(f"Online models are saved to {path}")
+        return path
+
+    @classmethod
+    def load(cls, name='online', models_folder=None):
+        """
+        Loads saved models, or returns new empty ones when none were saved under that name.
+        """
+        path = online_models_path(name, models_folder)
+        if not os.path.exists(path):
+            return cls(name=name)
+        with np.load(path) as data:
+            half_life = float(data['half_life_hours'])
+            models = cls(None if np.isnan(half_life) else half_life, float(data['metric_alpha']), name)
+            models.keys = pd.DataFrame(data['keys'], columns=GROUP_COLUMNS).astype({'Season_Encoded': np.int64})
+            models._group_ids = {key: i for i, key in enumerate(pd.MultiIndex.from_frame(models.keys))}
+            for state in cls.STATE:
+                setattr(models, state, data[state])
+        return models
+
+
+if __name__ == "__main__":
+    try:
+        from storage import load_cleaned
+        start_date, end_date = '20230101', '20240101'
+        latitude, longitude = 51.54501, -0.00564
+        cleaned_data = load_cleaned(latitude, longitude, start_date, end_date)
+
+        models = OnlineModels.load()
+        # Replaying the year one day at a time, as the hourly refresh job would feed it
+        for _, day in cleaned_data.groupby(cleaned_data['DateTime'].dt.floor('D')):
+            models.update(day, latitude, longitude)
+        print(models.results())
+        models.save()
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
@@ -0,0 +1,106 @@
+import threading
+from queue import Queue
+from data_scraper_nasa import BASE_URL, PARAMETERS
+from data_cleaner import clean_solar_data_map, save_cleaned_data
+from grid_fetcher import fetch_grid
+from storage import save_raw
+from solar_geometry import fill_solar_zenith
+
+# Marks the end of the stream on the persist queue
+_END_OF_STREAM = object()
+
+
+def stream_cleaned(cells, start_date, end_date, clean=clean_solar_data_map, max_workers=8, base_url=BASE_URL,
+                   cache=None, keep_raw=False, data_folder=None, parameters=PARAMETERS, compute_zenith=False):
+    """
+    Streams the cells of a grid through fetch and clean without going through disk in between.
+    Nothing is fetched ahead of the consumer beyond the bounded window of fetch_grid, so memory stays flat
+    whatever the grid size.
+    :param clean: Function turning the raw parameter dictionary into a cleaned DataFrame
+    :param keep_raw: Also save the raw response through the storage backend
+    :param data_folder: Folder the raw responses are saved to, defaults to the project data folder
+    :param parameters: Comma separated NASA parameter names to request
+    :param compute_zenith: Add the Solar_zenith_angle column computed locally, for data requested without SZA
+    :return: Generator of (latitude, longitude, cleaned DataFrame) tuples, failed cells are reported and skipped
+    """
+    for lat, lon, solar_data, error in fetch_grid(cells, start_date, end_date, max_workers=max_workers,
+                                                  base_url=base_url, cache=cache, parameters=parameters):
+        if error is not None:
+            print(f"Error fetching data for ({lat:.2f}, {lon:.2f}): {str(error)}")
+            continue
+        try:
+            if keep_raw:
+                save_raw(solar_data, lat, lon, start_date, end_date, data_folder=data_folder)
+            cleaned_data = clean(solar_data)
+            if compute_zenith:
+                fill_solar_zenith(cleaned_data, lat, lon)
+        except Exception as e:
+            print(f"Error cleaning data for ({lat:.2f}, {lon:.2f}): {str(e)}")
+            continue
+
+        # Drop the raw dictionary before handing the cleaned frame over
+        del solar_data
+        yield lat, lon, cleaned_data
+
+
+def file_sink(start_date, end_date, data_folder=None):
+    """
+    Persists each cleaned cell to its own file through save_cleaned_data.
+    """
+    def sink(latitude, longitude, df):
+        save_cleaned_data(df, latitude, longitude, start_date, end_date, data_folder)
+    return sink
+
+
+def cube_sink(cube):
+    """
+    Persists each cleaned cell into a consolidated CubeStore.
+    """
+    def sink(latitude, longitude, df):
+        cube.write_cell(latitude, longitude, df)
+    return sink
+
+
+def run_pipeline(cells, start_date, end_date, sink, clean=clean_solar_data_map, max_workers=8, queue_size=16,
+                 base_url=BASE_URL, cache=None, keep_raw=False, data_folder=None, parameters=PARAMETERS,
+                 compute_zenith=False):
+    """
+    Runs fetch -> clean -> persist over a grid. Persisting happens on its own thread fed by a bounded queue:
+    when the sink falls behind the queue fills up, the cleaning loop blocks and no new cells are fetched,
+    so at most queue_size cleaned cells plus the fetch window are held in memory.
+    :param sink: Function (latitude, longitude, df) persisting one cleaned cell, see file_sink and cube_sink
+    :param queue_size: Number of cleaned cells allowed to wait for the sink
+    :param parameters: Comma separated NASA parameter names to request, see stream_cleaned
+    :param compute_zenith: Compute Solar_zenith_angle locally, see stream_cleaned
+    :return: Dictionary with the number of persisted and failed cells
+    """
+    persist_queue = Queue(maxsize=queue_size)
+    counts = {'persisted': 0, 'failed': 0}
+
+    def persist():
+        while True:
+            item = persist_queue.get()
+            if item is _END_OF_STREAM:
+                return
+            lat, lon, df = item
+            try:
+                sink(lat, lon, df)
+                counts['persisted'] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"Error saving data for ({lat:.2f}, {lon:.2f}): {str(e)}")
+
+    worker = threading.Thread(target=persist, name='pipeline-persist', daemon=True)
+    worker.start()
+    try:
+        for item in stream_cleaned(cells, start_date, end_date, clean=clean, max_workers=max_workers,
+                                   base_url=base_url, cache=cache, keep_raw=keep_raw, data_folder=data_folder,
+                                   parameters=parameters, compute_zenith=compute_zenith):
+            persist_queue.put(item)
+    finally:
+        persist_queue.put(_END_OF_STREAM)
+        worker.join()
+
+    counts['failed'] += len(cells) - counts['persisted'] - counts['failed']
+    print(f"Pipeline finished: {counts['persisted']} cells persisted, {counts['failed']} failed")
+    return counts
@@ -0,0 +1,261 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from synthetic_data import generate_response
+
+ENDPOINT_PATH = '/api/temporal/hourly/point'
+REQUIRED_QUERY_PARAMETERS = ('parameters', 'community', 'latitude', 'longitude', 'start', 'end')
+# NASA POWER hourly data comes on the MERRA-2 grid of 0.5 x 0.625 degree, every point of a pixel gets the same values
+PIXEL_SIZE = (0.5, 0.625)
+# Generating a year of hourly data takes longer than serving it, recent responses are kept ready
+RESPONSE_CACHE_SIZE = 256
+
+
+class _TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to burst requests.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        :return: 0 when a token was taken, otherwise the seconds until the next token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class PowerSimulator:
+    """
+    Local HTTP server standing in for the NASA POWER hourly point API, for running and load testing the fetch path
+    offline. It takes the same query parameters and answers with the same GeoJSON response (properties.parameter
+    holding ALLSKY_SFC_SW_DWN, T2M, SZA or any requested parameter) made of synthetic data, see
+    synthetic_data.generate_response. Points are snapped to NASA's pixels, so neighbouring cells of a fine grid get
+    identical data as they do from the real API.
+    Faults are injected on request: a fixed plus random latency on the successful responses, a share of 500 errors,
+    and 429 throttling with a Retry-After header, either for a random share of the requests or above a request rate.
+    Errors and 429s are answered at once, as a server rejecting a request does not generate its data.
+
+        with PowerSimulator(latency=0.05, rate_limit=20) as simulator:
+            fetch_solar_data(51.5, 0.0, '20230101', '20231231', base_url=simulator.base_url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, burst=None, retry_after=1, gap_fraction=0.01, pixel_size=PIXEL_SIZE, seed=None):
+        """
+        :param port: Port to listen on, 0 picks a free one
+        :param latency: Seconds added to every successful response
+        :param jitter: Upper bound of an extra uniformly random latency (seconds)
+        :param error_rate: Share of the requests answered with a 500 error
+        :param throttle_rate: Share of the requests answered with a 429
+        :param rate_limit: Requests per second above which requests are answered with a 429, None for no limit
+        :param burst: Requests allowed at once under rate_limit, defaults to one second worth of requests
+        :param retry_after: Retry-After header (seconds) of random 429s; rate limited ones get the time until the
+                            next request is allowed, rounded up to a whole second as HTTP requires
+        :param gap_fraction: Share of the values reported missing (-999)
+        :param pixel_size: (latitude, longitude) size of the pixels sharing the same data, None disables snapping.
+                           Pixels are centred on the multiples of their size, as on the MERRA-2 grid
+        :param seed: Seed of the fault injection, for reproducible runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.gap_fraction = gap_fraction
+        self.pixel_size = pixel_size
+        self.bucket = _TokenBucket(rate_limit, burst or max(rate_limit, 1)) if rate_limit else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+        self.reset_stats()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{ENDPOINT_PATH}"
+
+    def start(self):
+        """
+        Serves in a background thread.
+        :return: Base URL to pass to fetch_solar_data or downloading_data
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, name='power-simulator', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.statuses = Counter()
+            self.latencies = []
+            self.bytes_sent = 0
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of requests, the count per status code, the bytes sent and the
+                 p50/p95/p99 and maximum server-side latency in seconds
+        """
+        with self._lock:
+            latencies = np.asarray(self.latencies)
+            stats = {'requests': len(latencies), 'statuses': dict(self.statuses), 'bytes_sent': self.bytes_sent}
+        for name, q in (('p50', 50), ('p95', 95), ('p99', 99)):
+            stats[name] = float(np.percentile(latencies, q)) if len(latencies) else None
+        stats['max'] = float(latencies.max()) if len(latencies) else None
+        return stats
+
+    def _snap(self, latitude, longitude):
+        if self.pixel_size is None:
+            return latitude, longitude
+        lat_size, lon_size = self.pixel_size
+        # Nearest pixel centre, a point half way between two centres goes to the northern / eastern one
+        return (round(math.floor(latitude / lat_size + 0.5) * lat_size, 6),
+                round(math.floor(longitude / lon_size + 0.5) * lon_size, 6))
+
+    def _response_body(self, latitude, longitude, start_date, end_date, parameters):
+        key = (self._snap(latitude, longitude), start_date, end_date, parameters)
+        with self._lock:
+            body = self._responses.get(key)
+            if body is not None:
+                self._responses.move_to_end(key)
+                return body
+        (lat, lon), _, _, _ = key
+        # The seed derives from the pixel, so a pixel gets the same data on every run as from the real API
+        response = generate_response(lat, lon, start_date, end_date, parameters.split(','), self.gap_fraction)
+        body = json.dumps(response).encode()
+        with self._lock:
+            self._responses[key] = body
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return body
+
+    def _fault(self):
+        # Decides the status of a request before any work is done: (status, Retry-After or None)
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait > 0:
+                return 429, max(1, math.ceil(wait))
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            return 429, self.retry_after
+        if draw < self.throttle_rate + self.error_rate:
+            return 500, None
+        return 200, None
+
+    def _delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+    def _record(self, status, seconds, size):
+        with self._lock:
+            self.statuses[status] += 1
+            self.latencies.append(seconds)
+            self.bytes_sent += size
+
+    def _handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the pooled sessions of grid_fetcher reuse their connections as with the real API
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, content, headers=None):
+                body = content if isinstance(content, bytes) else json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(body)
+                return len(body)
+
+            def do_GET(self):
+                started = time.perf_counter()
+                status, size = self.answer()
+                simulator._record(status, time.perf_counter() - started, size)
+
+            def answer(self):
+                url = urlparse(self.path)
+                if url.path.rstrip('/') != ENDPOINT_PATH:
+                    return 404, self.send_json(404, {'detail': 'Not Found'})
+                query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+                missing = [name for name in REQUIRED_QUERY_PARAMETERS if not query.get(name)]
+                try:
+                    latitude, longitude = float(query.get('latitude', 'nan')), float(query.get('longitude', 'nan'))
+                except ValueError:
+                    latitude = longitude = float('nan')
+                # The real API validates the request and answers 422 with the list of messages
+                messages = [f"Missing required query parameter: {name}" for name in missing]
+                if not missing and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                    messages.append("Latitude must be within -90 to 90 and longitude within -180 to 180")
+                if messages:
+                    return 422, self.send_json(422, {'header': 'Validation error', 'messages': messages})
+
+                status, retry_after = simulator._fault()
+                if status == 429:
+                    return status, self.send_json(429, {'detail': 'Too Many Requests'},
+                                                  {'Retry-After': retry_after})
+                if status != 200:
+                    return status, self.send_json(status, {'detail': 'Internal Server Error'})
+                try:
+                    body = simulator._response_body(latitude, longitude, query['start'], query['end'],
+                                                    query['parameters'])
+                except ValueError as e:
+                    return 422, self.send_json(422, {'header': 'Validation error', 'messages': [str(e)]})
+                time.sleep(simulator._delay())
+                return 200, self.send_json(200, body)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    try:
+        simulator = PowerSimulator(port=8000, latency=0.05, jitter=0.05, error_rate=0.01, rate_limit=30)
+        print(f"NASA POWER simulator listening on {simulator.start()}, press Ctrl+C to stop")
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+        print(simulator.stats())
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
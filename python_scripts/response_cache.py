@@ -0,0 +1,202 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from data_scraper_nasa import fetch_solar_data, BASE_URL, PARAMETERS, COMMUNITY
+from instrumentation import count
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3  # 5 GB
+# Responses have a folder of their own, data/cache also holds derived data such as the heatmap frames
+CACHE_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data', 'cache',
+                            'responses')
+# Holds the total size of the entries, so opening the cache does not stat every entry
+INDEX_FILE = 'index'
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for NASA POWER responses.
+    Every response is stored once under the hash of the request that produced it
+    (latitude, longitude, parameters, community, date range and endpoint). A hit refreshes the file's
+    modification time, so evicting the oldest files first gives least recently used eviction.
+    The total size is kept in an index file next to the entries and recomputed whenever entries are evicted.
+    """
+
+    def __init__(self, cache_folder=None, max_bytes=DEFAULT_MAX_BYTES, max_age_days=None):
+        """
+        :param cache_folder: Folder holding the cached responses, defaults to data/cache/responses
+        :param max_bytes: Total size above which the least recently used entries are evicted
+        :param max_age_days: Entries older than this are treated as missing and deleted when read or evicted
+                             (None = never expire)
+        """
+        self.cache_folder = cache_folder or CACHE_FOLDER
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = None if max_age_days is None else max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = self._read_index()
+        if self._size is None:
+            # First use of the folder: one scan, the index keeps the total from then on
+            self._size = sum(os.path.getsize(path) for path in self._entries())
+            self._write_index()
+
+    @staticmethod
+    def make_key(latitude, longitude, start_date, end_date, parameters=PARAMETERS, community=COMMUNITY,
+                 base_url=BASE_URL):
+        """
+        Builds the cache key of a request. Coordinates are rounded so that the float noise
+        of np.arange grids does not produce distinct keys for the same cell.
+        Responses of another endpoint (e.g. a local simulator) get keys of their own, while the keys of the
+        NASA endpoint stay the ones entries were stored under before the endpoint was part of the key.
+        """
+        request = [round(float(latitude), 6), round(float(longitude), 6), parameters, community.upper(),
+                   str(start_date), str(end_date)]
+        if base_url != BASE_URL:
+            request.append(base_url)
+        return hashlib.sha256(json.dumps(request).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_folder, f"{key}.json")
+
+    def _entries(self):
+        return [os.path.join(self.cache_folder, name) for name in os.listdir(self.cache_folder)
+                if name.endswith('.json')]
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_folder, INDEX_FILE), 'r') as file:
+                return int(json.load(file)['size_bytes'])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+
+    def _write_index(self):
+        # Called with the lock held, or before the cache is shared
+        path = os.path.join(self.cache_folder, INDEX_FILE)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'size_bytes': self._size}, file)
+        os.replace(tmp_path, path)
+
+    def _remove(self, path, file_size):
+        # True when this call removed the entry, another thread or process may have been first
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self._size = max(self._size - file_size, 0)
+            self.evictions += 1
+            self._write_index()
+        return True
+
+    def _expired(self, mtime, now):
+        return self.max_age is not None and now - mtime > self.max_age
+
+    def get(self, key):
+        """
+        Returns the cached data for a key, or None on a miss or an expired entry. Expired entries are deleted.
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self._expired(stat.st_mtime, time.time()):
+                self._remove(path, stat.st_size)
+                raise FileNotFoundError(path)
+            with open(path, 'r') as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            count('cache_misses')
+            return None
+
+        # Touch the entry so it becomes the most recently used one, unless another thread evicted it meanwhile
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        with self._lock:
+            self.hits += 1
+        count('cache_hits')
+        return data
+
+    def put(self, key, data):
+        """
+        Stores data under a key and evicts old entries if the cache grew above its limit.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += os.path.getsize(path) - previous_size
+            self._write_index()
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones until the cache fits in max_bytes.
+        """
+        now = time.time()
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        with self._lock:
+            size = sum(entry[1] for entry in entries)
+            for mtime, file_size, path in entries:
+                if size <= self.max_bytes and not self._expired(mtime, now):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+                self.evictions += 1
+            # The scan is exact, it also corrects any drift of the index from other processes
+            self._size = size
+            self._write_index()
+
+    def stats(self):
+        """
+        :return: Dictionary with hit/miss/eviction counters and the current cache size in bytes
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size_bytes': self._size,
+            }
+
+
+def fetch_solar_data_cached(cache, latitude, longitude, start_date, end_date, session=None, base_url=BASE_URL,
+                            parameters=PARAMETERS, community=COMMUNITY):
+    """
+    Serves a request from the cache when possible, otherwise fetches it and stores the response.
+    :param cache: ResponseCache instance
+    :return: Dictionary containing solar data
+    """
+    key = cache.make_key(latitude, longitude, start_date, end_date, parameters, community, base_url)
+    data = cache.get(key)
+    if data is None:
+        data = fetch_solar_data(latitude, longitude, start_date, end_date, session=session, base_url=base_url,
+                                parameters=parameters, community=community)
+        cache.put(key, data)
+
+    return data
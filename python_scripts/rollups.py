@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pandas as pd
+from features import seasons_from_months
+from storage import get_backend, backend_for_path, configured_format, BACKENDS, DATA_FOLDER
+
+SITE_COLUMNS = ['Latitude', 'Longitude']
+STATISTIC_AGGREGATIONS = {'Sum': 'sum', 'Count': 'sum', 'Daylight_count': 'sum', 'Min': 'min', 'Max': 'max'}
+# Hours is a bitmask of the hours of the day already ingested; hours are only added once, so summing the bits of
+# new hours into it is the same as or-ing them
+DAILY_AGGREGATIONS = {**STATISTIC_AGGREGATIONS, 'Hours': 'sum'}
+ALL_HOURS = (1 << 24) - 1
+
+
+def _with_derived(table):
+    # Means and energy are derived from the additive statistics so partial periods can be merged exactly
+    table['Mean'] = table['Sum'] / table['Count']
+    table['Daylight_mean'] = table['Sum'] / table['Daylight_count'].where(table['Daylight_count'] > 0)
+    # Hourly values are W/m^2 averaged over the hour, so their sum is Wh/m^2
+    table['Energy_kWh_m2'] = table['Sum'] / 1000.0
+    return table
+
+
+def _touched(table, keys, columns):
+    # Boolean mask of the rows of table whose key columns appear in keys
+    return pd.MultiIndex.from_frame(table[columns]).isin(pd.MultiIndex.from_frame(keys[columns]))
+
+
+class RollupStore:
+    """
+    Precomputed per-site rollups of hourly solar irradiance: daily, monthly and seasonal sums, counts,
+    daylight counts (hours with irradiance above zero), minimum, maximum and energy totals.
+    Hourly rows are only ever read once: update() ingests the hours each day does not hold yet into the daily
+    table, and only the months and seasons of the days that changed are rebuilt from the daily table.
+    """
+
+    def __init__(self, name='rollups', folder=None):
+        self.folder = os.path.join(folder or DATA_FOLDER, name)
+        self.daily = self._load('daily')
+        self.monthly = self._load('monthly')
+        self.seasonal = self._load('seasonal')
+        if self.daily is not None and 'Hours' not in self.daily.columns:
+            self._hours_from_watermarks(self._load('watermarks'))
+
+    def _path(self, table):
+        return os.path.join(self.folder, f"{table}{get_backend().extension}")
+
+    def _load(self, table):
+        # The configured format first, as list_cleaned does, then any other format the table may still be in
+        preferred = configured_format()
+        for storage_format in [preferred] + [name for name in BACKENDS if name != preferred]:
+            path = os.path.join(self.folder, f"{table}{BACKENDS[storage_format].extension}")
+            if os.path.exists(path):
+                return backend_for_path(path).read_frame(path)
+        return None
+
+    def _hours_from_watermarks(self, watermarks):
+        # Stores written before the hours were tracked per day kept one watermark per site: every hour up to it
+        # counts as ingested
+        self.daily['Hours'] = np.int64(ALL_HOURS)
+        if watermarks is None:
+            return
+        last = self.daily[SITE_COLUMNS].merge(watermarks, on=SITE_COLUMNS, how='left')['Last_DateTime']
+        on_last_day = (self.daily['Date'].to_numpy() == last.dt.floor('D').to_numpy())
+        last_hours = (np.int64(2) << last.dt.hour.fillna(23).to_numpy().astype(np.int64)) - 1
+        self.daily['Hours'] = np.where(on_last_day, last_hours, ALL_HOURS).astype(np.int64)
+
+    def save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        for table in ('daily', 'monthly', 'seasonal'):
+            if getattr(self, table) is not None:
+                # Sums keep float64 so repeated incremental updates do not accumulate rounding errors
+                get_backend().write_frame(getattr(self, table), self._path(table), float32=False)
+        for backend in BACKENDS.values():
+            # The per-site watermarks of earlier stores live in the daily table now
+            path = os.path.join(self.folder, f"watermarks{backend.extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def update(self, df, latitude=None, longitude=None, value_column='Solar_Irradiance'):
+        """
+        Ingests new hourly rows. Hours a site's day already holds are ignored, so feeding overlapping windows
+        does not count hours twice, while late backfills of earlier hours or days are still added.
+        :param df: Cleaned DataFrame with DateTime and value_column, plus Latitude/Longitude for multi-site data
+        :param latitude: Site latitude when df has no Latitude column
+        :param longitude: Site longitude when df has no Longitude column
+        :return: Number of hourly rows ingested
+        """
+        rows = df[['DateTime', value_column] + [c for c in SITE_COLUMNS if c in df.columns]]
+        if 'Latitude' not in rows.columns:
+            rows = rows.assign(Latitude=latitude, Longitude=longitude)
+        rows = rows.dropna(subset=[value_column]).drop_duplicates(SITE_COLUMNS + ['DateTime'])
+        rows = rows.assign(Date=rows['DateTime'].dt.floor('D'),
+                           Hours=np.int64(1) << rows['DateTime'].dt.hour.to_numpy().astype(np.int64))
+
+        if self.daily is not None and len(self.daily):
+            known = rows[SITE_COLUMNS + ['Date']].merge(self.daily[SITE_COLUMNS + ['Date', 'Hours']],
+                                                         on=SITE_COLUMNS + ['Date'], how='left')['Hours']
+            known = known.fillna(0).to_numpy().astype(np.int64)
+            rows = rows[(known & rows['Hours'].to_numpy()) == 0]
+        if rows.empty:
+            return 0
+
+        values = rows[value_column]
+        new_daily = (rows.assign(Sum=values, Count=1, Daylight_count=(values > 0).astype(np.int64), Min=values,
+                                 Max=values)
+                     .groupby(SITE_COLUMNS + ['Date'], as_index=False).agg(DAILY_AGGREGATIONS))
+        if self.daily is None:
+            self.daily = _with_derived(new_daily)
+        else:
+            # Only the days that received hours are merged, the other days are kept as they are
+            touched = _touched(self.daily, new_daily, SITE_COLUMNS + ['Date'])
+            merged = (pd.concat([self.daily.loc[touched, new_daily.columns], new_daily])
+                      .groupby(SITE_COLUMNS + ['Date'], as_index=False).agg(DAILY_AGGREGATIONS))
+            self.daily = pd.concat([self.daily[~touched], _with_derived(merged)]).sort_values(
+                SITE_COLUMNS + ['Date'], ignore_index=True)
+
+        self._rebuild_from_daily(new_daily[SITE_COLUMNS + ['Date']])
+        return len(rows)
+
+    def _rebuild_from_daily(self, days):
+        """
+        Rebuilds the monthly and seasonal rows the given days belong to.
+        :param days: DataFrame of (Latitude, Longitude, Date) keys of the days that changed
+        """
+        daily = self.daily
+        statistics = daily[SITE_COLUMNS + list(STATISTIC_AGGREGATIONS)].assign(
+            Month=daily['Date'].dt.to_period('M').dt.start_time,
+            Season_Encoded=seasons_from_months(daily['Date'].dt.month.to_numpy(), daily['Latitude'].to_numpy()))
+        days = days.assign(Month=days['Date'].dt.to_period('M').dt.start_time,
+                           Season_Encoded=seasons_from_months(days['Date'].dt.month.to_numpy(),
+                                                              days['Latitude'].to_numpy()))
+
+        for table, period in (('monthly', 'Month'), ('seasonal', 'Season_Encoded')):
+            key = SITE_COLUMNS + [period]
+            changed = days[key].drop_duplicates()
+            rebuilt = _with_derived(statistics[_touched(statistics, changed, key)]
+                                    .groupby(key, as_index=False).agg(STATISTIC_AGGREGATIONS))
+            current = getattr(self, table)
+            if current is not None:
+                rebuilt = pd.concat([current[~_touched(current, changed, key)], rebuilt]).sort_values(
+                    key, ignore_index=True)
+            setattr(self, table, rebuilt)
+
+    def season_average(self, latitude=None, longitude=None, daylight_only=True):
+        """
+        Average irradiance per season, over every site or for one site.
+        :param daylight_only: Average over hours with irradiance above zero, as feature_engineering filters them
+        :return: pandas Series indexed by Season_Encoded
+        """
+        table = self.seasonal
+        if latitude is not None:
+            table = table[np.isclose(table['Latitude'], latitude) & np.isclose(table['Longitude'], longitude)]
+        totals = table.groupby('Season_Encoded')[['Sum', 'Count', 'Daylight_count']].sum()
+        return totals['Sum'] / (totals['Daylight_count'] if daylight_only else totals['Count'])
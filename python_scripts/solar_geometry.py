@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Solar constant (W/m^2)
+SOLAR_CONSTANT = 1361.0
+
+
+def _hours_since_epoch(datetimes):
+    if isinstance(datetimes, (pd.Series, pd.Index)):
+        datetimes = datetimes.to_numpy()
+    values = np.asarray(datetimes, dtype='datetime64[s]')
+    return values, values.astype(np.int64) / 3600.0
+
+
+def solar_position(datetimes, latitudes, longitudes, time_standard='UTC', hour_offset=0.0):
+    """
+    Computes the solar zenith and azimuth angles with the NOAA general solar position equations
+    (Spencer's Fourier series for the declination and the equation of time, accurate to a few tenths of a degree).
+    All inputs are broadcast together, so a whole grid over a year can be computed at once,
+    e.g. datetimes[:, None] with latitudes[None, :].
+    :param datetimes: Array of timestamps (numpy datetime64, pandas Series/Index or anything numpy accepts)
+    :param latitudes: Latitudes in degrees
+    :param longitudes: Longitudes in degrees (east positive)
+    :param time_standard: 'UTC', or 'LST' for local solar time (UTC shifted by longitude / 15 hours), the
+                          time standard of the NASA POWER hourly keys
+    :param hour_offset: Hours added to each timestamp, 0.5 evaluates the middle of an hourly period
+    :return: Dictionary with 'zenith' and 'azimuth' (degrees, azimuth clockwise from north) and 'cos_zenith'
+    """
+    values, hours = _hours_since_epoch(datetimes)
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    hours = hours + hour_offset
+    if time_standard == 'LST':
+        hours = hours - longitudes / 15.0
+    elif time_standard != 'UTC':
+        raise ValueError(f"Unknown time standard: {time_standard}")
+
+    days = np.floor(hours / 24.0)
+    utc_hour = hours - days * 24.0
+    year_start = values.astype('datetime64[Y]').astype('datetime64[s]').astype(np.int64) / 86400.0
+    day_of_year = days - year_start + 1
+
+    # Fractional year (radians)
+    gamma = 2 * np.pi / 365 * (day_of_year - 1 + (utc_hour - 12) / 24)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                 - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    declination = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma)
+                   + 0.000907 * np.sin(2 * gamma) - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    true_solar_minutes = utc_hour * 60 + equation_of_time + 4 * longitudes
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+
+    cos_zenith = (np.sin(latitudes) * np.sin(declination)
+                  + np.cos(latitudes) * np.cos(declination) * np.cos(hour_angle))
+    cos_zenith = np.clip(cos_zenith, -1.0, 1.0)
+    azimuth = np.degrees(np.arctan2(np.sin(hour_angle),
+                                    np.cos(hour_angle) * np.sin(latitudes)
+                                    - np.tan(declination) * np.cos(latitudes))) + 180.0
+
+    return {'zenith': np.degrees(np.arccos(cos_zenith)), 'azimuth': azimuth % 360.0, 'cos_zenith': cos_zenith}
+
+
+def solar_zenith_angle(datetimes, latitudes, longitudes, time_standard='UTC', hour_offset=0.0):
+    """
+    Solar zenith angle in degrees, see solar_position.
+    """
+    return solar_position(datetimes, latitudes, longitudes, time_standard, hour_offset)['zenith']
+
+
+def extraterrestrial_irradiance(datetimes, latitudes, longitudes, time_standard='UTC', hour_offset=0.0):
+    """
+    Clear-sky top of atmosphere irradiance on a horizontal surface (W/m^2), zero when the sun is below the horizon.
+    Uses Spencer's correction for the Earth-Sun distance.
+    """
+    values, _ = _hours_since_epoch(datetimes)
+    day_of_year = (values.astype('datetime64[D]') - values.astype('datetime64[Y]')).astype(np.int64) + 1
+    day_angle = 2 * np.pi * (day_of_year - 1) / 365
+    distance_factor = (1.000110 + 0.034221 * np.cos(day_angle) + 0.001280 * np.sin(day_angle)
+                       + 0.000719 * np.cos(2 * day_angle) + 0.000077 * np.sin(2 * day_angle))
+    cos_zenith = solar_position(datetimes, latitudes, longitudes, time_standard, hour_offset)['cos_zenith']
+
+    return SOLAR_CONSTANT * distance_factor * np.maximum(cos_zenith, 0.0)
+
+
+def fill_solar_zenith(df, latitude, longitude, replace=False, time_standard='LST', hour_offset=0.5):
+    """
+    Fills the Solar_zenith_angle column of a cleaned DataFrame in place with locally computed values.
+    NASA POWER hourly keys are in local solar time and describe the hour starting at the key, hence the defaults.
+    :param replace: Overwrite every value instead of only the missing ones (or a missing column)
+    :return: The same DataFrame
+    """
+    zenith = solar_zenith_angle(df['DateTime'], latitude, longitude, time_standard, hour_offset)
+    if replace or 'Solar_zenith_angle' not in df.columns:
+        df['Solar_zenith_angle'] = zenith
+    else:
+        df['Solar_zenith_angle'] = df['Solar_zenith_angle'].fillna(pd.Series(zenith, index=df.index))
+
+    return df
+
+
+def validate_against_nasa(df, latitude, longitude, time_standard='LST', hour_offset=0.5):
+    """
+    Compares the computed zenith angle with the NASA SZA values of a cleaned DataFrame.
+    :return: Dictionary with the mean and maximum absolute difference (degrees) and the number of hours compared
+    """
+    observed = df['Solar_zenith_angle'].to_numpy(dtype=np.float64)
+    computed = solar_zenith_angle(df['DateTime'], latitude, longitude, time_standard, hour_offset)
+    valid = ~np.isnan(observed)
+    difference = np.abs(computed[valid] - observed[valid])
+
+    return {'mean_abs_diff': float(difference.mean()) if valid.any() else np.nan,
+            'max_abs_diff': float(difference.max()) if valid.any() else np.nan,
+            'hours': int(valid.sum())}
+
+
+if __name__ == "__main__":
+    try:
+        from storage import load_cleaned
+        start_date, end_date = '20230101', '20240101'
+        latitude, longitude = 51.54501, -0.00564
+        cleaned_data = load_cleaned(latitude, longitude, start_date, end_date)
+        print(validate_against_nasa(cleaned_data, latitude, longitude))
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
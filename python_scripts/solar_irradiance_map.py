@@ -1,80 +1,189 @@
+import hashlib
 import os
 import pandas as pd
-import folium
 import numpy as np
-import json
-import plotly_express as px
-from folium.plugins import HeatMapWithTime
-from data_scraper_nasa import fetch_solar_data, save_data_to_json
-from data_cleaner import load_data_from_folder_in_json, clean_solar_data_map, save_cleaned_data
+from data_scraper_nasa import BASE_URL, PARAMETERS
+from data_cleaner import clean_solar_data_map, clean_solar_data_all, PARAMETER_COLUMNS
+from storage import cleaned_exists, list_cleaned, backend_for_path, data_version, load_cleaned
+from grid_fetcher import build_grid
+from pipeline import run_pipeline, file_sink, cube_sink
+from response_cache import ResponseCache
+from cube_store import CubeStore, cube_path
+from heatmap_frames import load_or_build_frames, build_heatmap_figure, write_frame_tiles
+from instrumentation import timed, METRICS
+from spatial_index import SpatialIndex
+from compact_dataset import CompactDataset
+from adaptive_grid import adaptive_download, load_aliases, expand_aliases, aliases_path, DEFAULT_COARSE_INTERVAL, \
+    DEFAULT_TOLERANCE
 
-def downloading_data(latitude, longitude, start_date, end_date,area_lat, area_long,interval):
+@timed('downloading_data')
+def downloading_data(latitude, longitude, start_date, end_date,area_lat, area_long,interval, max_workers=8,
+                     base_url=BASE_URL, cache=None, skip_existing=True, use_cube=False, keep_raw=True,
+                     all_parameters=False, adaptive=False, coarse_interval=DEFAULT_COARSE_INTERVAL,
+                     tolerance=DEFAULT_TOLERANCE, data_folder=None, parameters=PARAMETERS):
+    """
+    Downloads, cleans and saves the data of every cell of the area.
+    :param adaptive: Sample the area adaptively instead of fetching every cell: coarse cells first, refined only
+                     where neighbouring cells differ by more than tolerance; the skipped and duplicate cells are
+                     saved as aliases of a stored cell (see adaptive_grid)
+    :param coarse_interval: Step size (degree) of the first adaptive level
+    :param tolerance: Relative irradiance difference under which neighbouring cells are considered the same
+    :param data_folder: Folder to save to, defaults to the project data folder
+    :param parameters: Comma separated NASA parameter names to request. Without SZA (PARAMETERS_WITHOUT_SZA) the
+                       responses are smaller and, with all_parameters, the solar zenith angle is computed locally
+    """
 
     # Generate latitudes and longitudes with the given interval
-    latitudes = np.arange(latitude - area_lat, latitude + area_lat + interval, interval)
-    longitudes = np.arange(longitude - area_long, longitude + area_long + interval, interval)
+    cells = build_grid(latitude, longitude, area_lat, area_long, interval)
+
+    # Irradiance is enough for the heatmap, training per site also needs temperature and solar zenith angle
+    clean = clean_solar_data_all if all_parameters else clean_solar_data_map
+    variables = list(PARAMETER_COLUMNS.values()) if all_parameters else ['Solar_Irradiance']
+    compute_zenith = all_parameters and 'SZA' not in parameters.split(',')
+
+    # With use_cube the cleaned data of every cell goes into one consolidated store instead of one file per cell
+    cube = None
+    if use_cube:
+        path = cube_path(start_date, end_date, data_folder)
+        if os.path.exists(path):
+            cube = CubeStore(path, mode='r+')
+            # The grid of a store is fixed when it is created, new variables only need new chunks
+            outside = cube.off_grid(cells)
+            if outside:
+                lat, lon = outside[0]
+                raise ValueError(f"{len(outside)} requested locations, e.g. ({lat:.4f}, {lon:.4f}), are not on "
+                                 f"the grid of {path} ({len(cube.latitudes)} latitudes from {cube.latitudes[0]} to "
+                                 f"{cube.latitudes[-1]}, {len(cube.longitudes)} longitudes from "
+                                 f"{cube.longitudes[0]} to {cube.longitudes[-1]}), remove it or drop use_cube")
+            added = cube.add_variables(variables)
+            if added:
+                print(f"Added {', '.join(added)} to {path}")
+        else:
+            cube = CubeStore.create(path, start_date, end_date, [lat for lat, _ in cells], [lon for _, lon in cells],
+                                    variables=variables)
 
-    print(f"Fetching solar data from {start_date} to {end_date} for multiple locations...")
+    sink = cube_sink(cube) if cube is not None else file_sink(start_date, end_date, data_folder)
 
-    # Loop through all latitude and longitude pairs
-    for lat in latitudes:
-        for lon in longitudes:
-            print(f"\nFetching data for latitude: {lat:.2f}, longitude: {lon:.2f}...")
-            try:
-                # Fetch solar irradiance data using NASA POWER API
-                solar_data = fetch_solar_data(lat, lon, start_date, end_date)
+    if adaptive:
+        def run(adaptive_cells, adaptive_sink):
+            run_pipeline(adaptive_cells, start_date, end_date, adaptive_sink, clean=clean, max_workers=max_workers,
+                         base_url=base_url, cache=cache, keep_raw=keep_raw, data_folder=data_folder,
+                         parameters=parameters, compute_zenith=compute_zenith)
 
-                # Save the raw data
-                save_data_to_json(solar_data, lat, lon, start_date, end_date)
-                print(f"Data saved for ({lat:.2f}, {lon:.2f})")
+        def load_existing(lat, lon):
+            # Stored cells take part in the refinement without being fetched again
+            if cube is not None:
+                return cube.read_cell(lat, lon) if cube.has_cell(lat, lon) else None
+            if cleaned_exists(lat, lon, start_date, end_date, data_folder):
+                return load_cleaned(lat, lon, start_date, end_date, data_folder).set_index('DateTime')['Solar_Irradiance']
+            return None
 
-                # Load and clean the raw data
-                raw_data = load_data_from_folder_in_json(lat, lon, start_date, end_date)
-                cleaned_data = clean_solar_data_map(raw_data)
+        adaptive_download(cells, start_date, end_date, sink, run, load_existing if skip_existing else None,
+                          coarse_interval, interval, tolerance, data_folder)
+        if cube is not None:
+            cube.flush()
+        print("\nAll locations processed.")
+        return
 
-                # Save the cleaned data
-                save_cleaned_data(cleaned_data, lat, lon, start_date, end_date)
-                print(f"Cleaned data saved for ({lat:.2f}, {lon:.2f})")
+    # Cells whose cleaned output is already on disk need neither a request nor a clean
+    if skip_existing:
+        if cube is not None:
+            missing = [(lat, lon) for lat, lon in cells if not cube.has_cell(lat, lon)]
+        else:
+            missing = [(lat, lon) for lat, lon in cells
+                       if not cleaned_exists(lat, lon, start_date, end_date, data_folder)]
+        print(f"Skipping {len(cells) - len(missing)} locations already present in the data folder")
+        cells = missing
 
-            except Exception as e:
-                print(f"Error fetching data for ({lat:.2f}, {lon:.2f}): {str(e)}")
+    print(f"Fetching solar data from {start_date} to {end_date} for {len(cells)} locations...")
+
+    # Cells stream through fetch -> clean -> save without re-reading the raw file that was just written
+    run_pipeline(cells, start_date, end_date, sink, clean=clean, max_workers=max_workers,
+                 base_url=base_url, cache=cache, keep_raw=keep_raw, data_folder=data_folder,
+                 parameters=parameters, compute_zenith=compute_zenith)
+
+    if cube is not None:
+        cube.flush()
 
     print("\nAll locations processed.")
 
 
-def load_cleaned_solar_data(start_date, end_date):
+@timed('load_cleaned_solar_data')
+def load_cleaned_solar_data(start_date, end_date, start_time=None, end_time=None, data_folder=None, bounds=None,
+                            compact=False):
     """
-    Loads cleaned solar irradiance data from all available JSON files in the data folder.
+    Loads cleaned solar irradiance data from the consolidated store of the date range when there is one,
+    otherwise from all available files in the data folder.
     :param start_date: Start date of data (YYYYMMDD)
     :param end_date: End date of data (YYYYMMDD)
+    :param start_time: Optional first timestamp to read from the consolidated store
+    :param end_time: Optional last timestamp to read from the consolidated store
+    :param data_folder: Folder to read from, defaults to the project data folder
+    :param bounds: Optional (lat_min, lat_max, lon_min, lon_max), only the cells inside are read
+    :param compact: Return a CompactDataset (site table + float32 matrices) instead of the long DataFrame
     :return: Combined DataFrame with latitude, longitude, DateTime, and Solar_Irradiance
     """
-    data_folder = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data')
-    all_data = []
+    # Cells of an adaptive download that were not fetched or were duplicates are copied from their source cell
+    aliases = load_aliases(start_date, end_date, data_folder)
+    if bounds is not None:
+        lat_min, lat_max, lon_min, lon_max = bounds
+        aliases = {(lat, lon): source for (lat, lon), source in aliases.items()
+                   if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max}
 
-    # Loop through all cleaned solar data files in the folder
-    for file in os.listdir(data_folder):
-        if file.startswith("cleaned_solar_data") and file.endswith(f"_{start_date}_to_{end_date}.json"):
-            file_path = os.path.join(data_folder, file)
-            parts = file.split("_")
-            lat = float(parts[4])  # Corrected index for latitude
-            lon = float(parts[6])  # Corrected index for longitude
+    path = cube_path(start_date, end_date, data_folder)
+    if os.path.exists(path):
+        # Only the chunks covering the requested window are read from the memory-mapped store
+        combined_df = expand_aliases(CubeStore(path).read_frame(start_time, end_time), aliases)
+        if bounds is not None:
+            lat_min, lat_max, lon_min, lon_max = bounds
+            combined_df = combined_df[combined_df['Latitude'].between(lat_min, lat_max)
+                                      & combined_df['Longitude'].between(lon_min, lon_max)].reset_index(drop=True)
+        if compact:
+            return CompactDataset.from_frame(combined_df)
+        print(combined_df.head())
+        return combined_df
 
-            # Load data
-            with open(file_path, 'r') as f:
-                raw_data = json.load(f)
+    all_data = []
+    if bounds is None:
+        cells = list_cleaned(start_date, end_date, data_folder)
+    else:
+        # The spatial index picks the files inside the bounds without listing and parsing every file name
+        index = SpatialIndex.load_or_build(start_date, end_date, data_folder)
+        cells = index.cells(index.bbox(*bounds))
+        # Sources of the aliases inside the bounds may lie outside of them
+        inside = {(lat, lon) for lat, lon, _ in cells}
+        sources = {source for source in aliases.values() if source not in inside}
+        cells += [cell for source in sources for cell in index.cells(index.nearest(*source)[0])]
 
-            data = pd.DataFrame(raw_data)
-            # Append latitude and longitude to the DataFrame
-            data['Latitude'] = lat
-            data['Longitude'] = lon
-            all_data.append(data)
+    if compact:
+        if not cells:
+            raise FileNotFoundError(f"No cleaned data found for the given date range: {start_date} to {end_date}")
+        # Each file goes straight into the matrices, the long frame is never built
+        dataset = CompactDataset.from_cells(cells, lambda file_path: backend_for_path(file_path).read_frame(file_path),
+                                            start_date, end_date).with_aliases(aliases)
+        if bounds is not None:
+            sites = dataset.sites
+            dataset = dataset.select(np.nonzero((sites['Latitude'].between(lat_min, lat_max)
+                                                 & sites['Longitude'].between(lon_min, lon_max)).to_numpy())[0])
+        return dataset
+
+    # Loop through all cleaned solar data files in the folder, whatever format they are stored in
+    for lat, lon, file_path in cells:
+        data = backend_for_path(file_path).read_frame(file_path)
+        # Append latitude and longitude to the DataFrame
+        data['Latitude'] = lat
+        data['Longitude'] = lon
+        all_data.append(data)
 
     if not all_data:
         raise FileNotFoundError(f"No cleaned data found for the given date range: {start_date} to {end_date}")
 
     # Combine all location data
     combined_df = pd.concat(all_data, ignore_index=True)
+    combined_df = expand_aliases(combined_df, aliases)
+    if bounds is not None:
+        combined_df = combined_df[combined_df['Latitude'].between(lat_min, lat_max)
+                                  & combined_df['Longitude'].between(lon_min, lon_max)].reset_index(drop=True)
 
     # Convert DateTime to proper format
     combined_df['DateTime'] = pd.to_datetime(combined_df['DateTime'])
@@ -82,35 +191,59 @@ def load_cleaned_solar_data(start_date, end_date):
 
     return combined_df
 
-def generate_heatmap_with_time(data):
+def cleaned_data_fingerprint(start_date, end_date, data_folder=None):
+    """
+    Fingerprint of the cleaned data of a date range, from the name, modification time and size of the files
+    load_cleaned_solar_data reads (the consolidated store when there is one, otherwise every cleaned file)
+    and of the aliases file. It changes as soon as a cell is added, rewritten or aliased, without reading any data.
+    :return: Version tag, data_version followed by a short hash
+    """
+    path = cube_path(start_date, end_date, data_folder)
+    if os.path.exists(path):
+        files = [os.path.join(path, file) for file in os.listdir(path)]
+    else:
+        files = [file_path for _, _, file_path in list_cleaned(start_date, end_date, data_folder)]
+    files.append(aliases_path(start_date, end_date, data_folder))
+
+    digest = hashlib.sha256()
+    for file_path in sorted(files):
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.basename(file_path)}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return f"{data_version(start_date, end_date)}_{digest.hexdigest()[:16]}"
+
+
+def generate_heatmap_with_time(data, start_date, end_date, freq=None, output='html', refresh=False,
+                               data_folder=None):
     """
     Generates a heatmap with a time slider.
-    :param data: DataFrame containing Latitude, Longitude, DateTime, and Solar_Irradiance
+    Frames are pre-aggregated per timestamp (or per period with freq) and cached by a fingerprint of the stored data,
+    so regenerating the map of unchanged data only renders.
+    :param data: DataFrame containing Latitude, Longitude, DateTime, and Solar_Irradiance, or a function returning it
+                 (only called when the frames are not cached yet)
     :param start_date: Start date (YYYYMMDD)
     :param end_date: End date (YYYYMMDD)
-    :param interval: The interval step size used for grid creation.
+    :param freq: Optional temporal downsampling: 'D' daily or 'M' monthly means, None keeps every hour
+    :param output: 'html' for an animated map, 'tiles' for one PNG tile per frame plus an index
+    :param refresh: Rebuild the frames even when they are cached
+    :param data_folder: Folder the data was loaded from, defaults to the project data folder
     """
+    load_data = data if callable(data) else (lambda: data)
+    frames = load_or_build_frames(load_data, cleaned_data_fingerprint(start_date, end_date, data_folder), freq,
+                                  refresh=refresh)
+    suffix = f"_{freq}" if freq else ""
+
+    if output == 'tiles':
+        index_path = write_frame_tiles(frames, f"solar_irradiance_tiles_{start_date}_to_{end_date}{suffix}")
+        print(f"✅ {len(frames['times'])} heatmap tiles saved, index at {index_path}.")
+        return index_path
 
-    data["DateTime"] = data["DateTime"].astype(str)
-    fig = px.density_mapbox(
-        data,
-        lat= "Latitude",
-        lon = "Longitude",
-        z = "Solar_Irradiance",
-        radius = 20,
-        center = dict(lat=data.Latitude.mean(), lon=data.Longitude.mean()),
-        zoom =4,
-        mapbox_style = "open-street-map",
-        height = 900,
-        animation_frame="DateTime",
-        color_continuous_scale="plasma",  # Use a visually appealing gradient (Options: viridis, plasma, inferno, etc.)
-        range_color=[0, 100]  # Fix the color range from 0 to 100
-    )
-
-    heatmap_filename = f"solar_irradiance_heatmap_{start_date}_to_{end_date}.html"
+    fig = build_heatmap_figure(frames)
+    heatmap_filename = f"solar_irradiance_heatmap_{start_date}_to_{end_date}{suffix}.html"
     fig.write_html(heatmap_filename)
 
     print(f"✅ Heatmap saved as {heatmap_filename}. Open it in a browser to view.")
+    return heatmap_filename
 
 
 if __name__ == "__main__":
@@ -134,13 +267,14 @@ if __name__ == "__main__":
         area_long = float(0.0)
         interval = float(0.01)
 
-        downloading_data(latitude, longitude, start_date, end_date, area_lat, area_long, interval)
+        downloading_data(latitude, longitude, start_date, end_date, area_lat, area_long, interval,
+                         cache=ResponseCache())
 
-        # Step 2: Load Cleaned Data
-        solar_data = load_cleaned_solar_data(start_date, end_date)
+        # Step 2 and 3: Load Cleaned Data (only if the heatmap frames are not cached yet) and Generate Heatmap
+        generate_heatmap_with_time(lambda: load_cleaned_solar_data(start_date, end_date), start_date, end_date)
 
-        # Step 3: Generate Heatmap
-        generate_heatmap_with_time(solar_data)
+        # Where the time went, per stage
+        METRICS.summary()
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
\ No newline at end of file
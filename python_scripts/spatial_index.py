@@ -0,0 +1,211 @@
+import os
+import numpy as np
+import pandas as pd
+from storage import DATA_FOLDER, list_cleaned, backend_for_path, data_version
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distance in km between a point and arrays of points.
+    """
+    lat1, lat2 = np.radians(latitude), np.radians(latitudes)
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(longitudes) - longitude)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _bracket(grid, value):
+    # Grid lines on each side of a value and its relative position between them, clamped to the edges of the grid
+    i = np.searchsorted(grid, value)
+    if i == 0:
+        return grid[0], grid[0], 0.0
+    if i == len(grid):
+        return grid[-1], grid[-1], 0.0
+    return grid[i - 1], grid[i], float((value - grid[i - 1]) / (grid[i] - grid[i - 1]))
+
+
+def index_path(version, data_folder=None):
+    return os.path.join(data_folder or DATA_FOLDER, f"spatial_index_{version}.npz")
+
+
+class SpatialIndex:
+    """
+    Index of the grid cells held for a date range, with the file each one is stored in.
+    Cells are sorted by latitude, so every query first narrows the cells to a latitude band with a binary search
+    and only computes distances inside that band. The sorted unique latitudes and longitudes of the cells give the
+    enclosing grid rectangle of a point for bilinear interpolation.
+    """
+
+    def __init__(self, latitudes, longitudes, paths, version):
+        order = np.lexsort((longitudes, latitudes))
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)[order]
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)[order]
+        self.paths = np.asarray(paths, dtype=str)[order]
+        self.version = version
+        self.grid_latitudes = np.unique(self.latitudes)
+        self.grid_longitudes = np.unique(self.longitudes)
+        self._lookup = {(round(lat, 6), round(lon, 6)): i
+                        for i, (lat, lon) in enumerate(zip(self.latitudes.tolist(), self.longitudes.tolist()))}
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @classmethod
+    def build(cls, start_date, end_date, data_folder=None, cells=None):
+        """
+        Indexes the cleaned data files of a date range.
+        :param cells: Result of storage.list_cleaned when the caller already listed the files
+        """
+        cells = list_cleaned(start_date, end_date, data_folder) if cells is None else cells
+        if not cells:
+            raise FileNotFoundError(f"No cleaned data found for the given date range: {start_date} to {end_date}")
+        latitudes, longitudes, paths = zip(*cells)
+        return cls(latitudes, longitudes, paths, data_version(start_date, end_date))
+
+    def save(self, data_folder=None):
+        """
+        Saves the index to data/spatial_index_{version}.npz.
+        :return: Path of the written file
+        """
+        path = index_path(self.version, data_folder)
+        np.savez(path, latitudes=self.latitudes, longitudes=self.longitudes, paths=self.paths, version=self.version)
+        return path
+
+    @classmethod
+    def load_or_build(cls, start_date, end_date, data_folder=None):
+        """
+        Loads the saved index of a date range, rebuilding and saving it when the cleaned files of the range
+        are no longer the ones it indexes. Other writes to the data folder, or rewrites of an indexed file,
+        leave the index as it is.
+        """
+        data_folder = data_folder or DATA_FOLDER
+        path = index_path(data_version(start_date, end_date), data_folder)
+        cells = list_cleaned(start_date, end_date, data_folder)
+        if os.path.exists(path):
+            with np.load(path) as saved:
+                index = cls(saved['latitudes'], saved['longitudes'], saved['paths'], str(saved['version']))
+            if sorted(index.paths.tolist()) == sorted(file_path for _, _, file_path in cells):
+                return index
+
+        index = cls.build(start_date, end_date, data_folder, cells)
+        index.save(data_folder)
+        return index
+
+    def _band(self, lat_min, lat_max):
+        return (np.searchsorted(self.latitudes, lat_min, side='left'),
+                np.searchsorted(self.latitudes, lat_max, side='right'))
+
+    def nearest(self, latitude, longitude, k=1):
+        """
+        The k cells closest to a point.
+        :return: (indices, distances in km), both sorted by distance
+        """
+        k = min(k, len(self))
+        # Widen the latitude band until it holds k cells that are closer than the band's edge
+        half_width = max(float(np.median(np.diff(self.grid_latitudes))) if len(self.grid_latitudes) > 1 else 1.0,
+                         1e-6)
+        while True:
+            start, end = self._band(latitude - half_width, latitude + half_width)
+            distances = haversine_km(latitude, longitude, self.latitudes[start:end], self.longitudes[start:end])
+            covers_all = start == 0 and end == len(self)
+            if end - start >= k:
+                order = np.argsort(distances)[:k]
+                if covers_all or distances[order[-1]] <= half_width * KM_PER_DEGREE:
+                    return start + order, distances[order]
+            elif covers_all:
+                order = np.argsort(distances)
+                return start + order, distances[order]
+            half_width *= 2
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Cells within radius_km of a point.
+        :return: (indices, distances in km), sorted by distance
+        """
+        half_width = radius_km / KM_PER_DEGREE
+        start, end = self._band(latitude - half_width, latitude + half_width)
+        distances = haversine_km(latitude, longitude, self.latitudes[start:end], self.longitudes[start:end])
+        inside = np.nonzero(distances <= radius_km)[0]
+        order = inside[np.argsort(distances[inside])]
+        return start + order, distances[order]
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Indices of the cells inside a bounding box, edges included.
+        """
+        start, end = self._band(lat_min, lat_max)
+        longitudes = self.longitudes[start:end]
+        return start + np.nonzero((longitudes >= lon_min) & (longitudes <= lon_max))[0]
+
+    def cells(self, indices):
+        """
+        :return: List of (latitude, longitude, file_path) tuples, as storage.list_cleaned returns them
+        """
+        return [(float(self.latitudes[i]), float(self.longitudes[i]), str(self.paths[i])) for i in indices]
+
+    def load_cells(self, indices, columns=None):
+        """
+        Reads only the given cells into one frame with Latitude and Longitude columns.
+        :param columns: Optional subset of the stored columns to keep
+        """
+        frames = []
+        for lat, lon, file_path in self.cells(indices):
+            data = backend_for_path(file_path).read_frame(file_path)
+            if columns is not None:
+                data = data[columns]
+            frames.append(data.assign(Latitude=lat, Longitude=lon))
+        if not frames:
+            return pd.DataFrame(columns=(columns or []) + ['Latitude', 'Longitude'])
+        return pd.concat(frames, ignore_index=True)
+
+    def _corners(self, latitude, longitude):
+        lat0, lat1, ty = _bracket(self.grid_latitudes, latitude)
+        lon0, lon1, tx = _bracket(self.grid_longitudes, longitude)
+        corners = []
+        for lat, lon, weight in ((lat0, lon0, (1 - ty) * (1 - tx)), (lat0, lon1, (1 - ty) * tx),
+                                 (lat1, lon0, ty * (1 - tx)), (lat1, lon1, ty * tx)):
+            index = self._lookup.get((round(float(lat), 6), round(float(lon), 6)))
+            if index is not None and weight > 0:
+                corners.append((index, weight))
+        return corners
+
+    def interpolate(self, latitude, longitude, value_column='Solar_Irradiance'):
+        """
+        Bilinear interpolation of a column between the four grid cells around a point, hour by hour.
+        Corners that are not held, or have no value at an hour, are left out and the remaining weights renormalised;
+        without any corner the nearest cell is returned.
+        :return: pandas Series indexed by DateTime
+        """
+        corners = self._corners(latitude, longitude)
+        if not corners:
+            corners = [(int(self.nearest(latitude, longitude)[0][0]), 1.0)]
+
+        values = None
+        weights = None
+        for index, weight in corners:
+            file_path = str(self.paths[index])
+            data = backend_for_path(file_path).read_frame(file_path).set_index('DateTime')[value_column]
+            data = data.astype(np.float64)
+            present = data.notna().astype(np.float64) * weight
+            if values is None:
+                values, weights = data.fillna(0.0) * weight, present
+            else:
+                values = values.add(data.fillna(0.0) * weight, fill_value=0.0)
+                weights = weights.add(present, fill_value=0.0)
+
+        return (values / weights.where(weights > 0)).rename(value_column)
+
+
+if __name__ == "__main__":
+    try:
+        start_date, end_date = '20230101', '20230103'
+        index = SpatialIndex.load_or_build(start_date, end_date)
+        print(f"{len(index)} cells indexed")
+        print(index.cells(index.nearest(51.54501, -0.00564)[0]))
+        print(index.interpolate(51.54501, -0.00564).head())
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
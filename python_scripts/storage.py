@@ -0,0 +1,294 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import timed, count, file_size
+
+DATA_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data')
+# Format used for new files, 'parquet' (default) or 'json', unless SOLAR_STORAGE_FORMAT says otherwise.
+# Reading falls back to the other format.
+DEFAULT_STORAGE_FORMAT = 'parquet'
+
+
+def configured_format():
+    """
+    Format new files are written in. The environment is read on every call, so SOLAR_STORAGE_FORMAT can be
+    changed after import.
+    """
+    return os.environ.get('SOLAR_STORAGE_FORMAT', DEFAULT_STORAGE_FORMAT)
+
+
+def data_version(start_date, end_date):
+    """
+    Version tag of the data of a date range, used to key trained models and cached derived data.
+    """
+    return f"{start_date}_to_{end_date}"
+
+
+class JsonStorage:
+    """
+    Original storage format: raw data as the NASA parameter dictionary, cleaned data as records.
+    """
+    extension = '.json'
+
+    def write_raw(self, data, file_path):
+        with open(file_path, 'w') as file:
+            json.dump(data, file, indent=4)
+
+    def read_raw(self, file_path):
+        with open(file_path, 'r') as file:
+            return json.load(file)
+
+    def write_frame(self, df, file_path, float32=True):
+        with open(file_path, 'w') as file:
+            df.to_json(file, orient='records', date_format='iso')
+
+    def read_frame(self, file_path):
+        df = pd.read_json(file_path, orient='records')
+        if 'DateTime' in df.columns:
+            df['DateTime'] = pd.to_datetime(df['DateTime'])
+        return df
+
+
+class ParquetStorage:
+    """
+    Columnar storage: one float32 column per parameter, zstd compressed and memory-mapped on read.
+    Raw data keeps the NASA 'YYYYMMDDHH' keys as an int64 column so it can be turned back into
+    the parameter dictionary returned by fetch_solar_data.
+    """
+    extension = '.parquet'
+    compression = 'zstd'
+
+    def write_raw(self, data, file_path):
+        keys = list(next(iter(data.values())).keys()) if data else []
+        # Parameters share the same keys as NASA returns them, otherwise every hour of any parameter is kept
+        # and the parameters without it get NaN
+        if any(list(values.keys()) != keys for values in data.values()):
+            keys = sorted(set().union(*data.values()))
+        columns = {'Key': np.array(keys, dtype=np.int64)}
+        for name, values in data.items():
+            if list(values.keys()) != keys:
+                values = {key: values.get(key, np.nan) for key in keys}
+            columns[name] = np.fromiter(values.values(), dtype=np.float32, count=len(keys))
+        pd.DataFrame(columns).to_parquet(file_path, compression=self.compression, index=False)
+
+    def read_raw_frame(self, file_path):
+        return pd.read_parquet(file_path, memory_map=True)
+
+    def read_raw(self, file_path):
+        frame = self.read_raw_frame(file_path)
+        keys = frame['Key'].astype(str).tolist()
+        return {name: dict(zip(keys, frame[name].astype(float).tolist()))
+                for name in frame.columns if name != 'Key'}
+
+    def write_frame(self, df, file_path, float32=True):
+        # Measurements do not need more than float32, accumulated totals can opt out
+        if float32:
+            df = df.astype({column: np.float32 for column in df.columns if pd.api.types.is_float_dtype(df[column])})
+        df.to_parquet(file_path, compression=self.compression, index=False)
+
+    def read_frame(self, file_path):
+        return pd.read_parquet(file_path, memory_map=True)
+
+
+BACKENDS = {'json': JsonStorage(), 'parquet': ParquetStorage()}
+
+
+def get_backend(storage_format=None):
+    """
+    :param storage_format: 'json' or 'parquet', defaults to configured_format()
+    :return: Storage backend instance
+    """
+    storage_format = storage_format or configured_format()
+    if storage_format not in BACKENDS:
+        raise ValueError(f"Unknown storage format: {storage_format}")
+    return BACKENDS[storage_format]
+
+
+def backend_for_path(file_path):
+    """
+    Picks the backend matching a file's extension.
+    """
+    for backend in BACKENDS.values():
+        if file_path.endswith(backend.extension):
+            return backend
+    raise ValueError(f"No storage backend for file: {file_path}")
+
+
+def raw_data_path(latitude, longitude, start_date, end_date, storage_format=None, data_folder=None):
+    filename = f"solar_data_lat_{latitude}_long_{longitude}_{start_date}_to_{end_date}"
+    return os.path.join(data_folder or DATA_FOLDER, filename + get_backend(storage_format).extension)
+
+
+def cleaned_data_path(latitude, longitude, start_date, end_date, storage_format=None, data_folder=None):
+    filename = f"cleaned_solar_data_lat_{latitude}_long_{longitude}_{start_date}_to_{end_date}"
+    return os.path.join(data_folder or DATA_FOLDER, filename + get_backend(storage_format).extension)
+
+
+def series_data_path(latitude, longitude, storage_format=None, data_folder=None):
+    # A location has a single series file, independent of any date range, that grows as new hours are fetched
+    filename = f"solar_series_lat_{latitude}_long_{longitude}"
+    return os.path.join(data_folder or DATA_FOLDER, 'series', filename + get_backend(storage_format).extension)
+
+
+def _existing_path(path_function, *args, data_folder=None):
+    # Prefer the configured format, then any other format a file may still be stored in
+    preferred = configured_format()
+    formats = [preferred] + [name for name in BACKENDS if name != preferred]
+    for storage_format in formats:
+        file_path = path_function(*args, storage_format=storage_format, data_folder=data_folder)
+        if os.path.exists(file_path):
+            return file_path
+    raise FileNotFoundError(f"No stored data found for {path_function(*args, data_folder=data_folder)}")
+
+
+@timed('save_raw')
+def save_raw(data, latitude, longitude, start_date, end_date, storage_format=None, data_folder=None):
+    """
+    Saves raw NASA data (dictionary of parameter -> {'YYYYMMDDHH': value}).
+    :return: Path of the written file
+    """
+    os.makedirs(data_folder or DATA_FOLDER, exist_ok=True)
+    file_path = raw_data_path(latitude, longitude, start_date, end_date, storage_format, data_folder)
+    get_backend(storage_format).write_raw(data, file_path)
+    count('bytes_written', file_size(file_path))
+    return file_path
+
+
+@timed('load_raw')
+def load_raw(latitude, longitude, start_date, end_date, data_folder=None):
+    """
+    Loads raw NASA data in the dictionary shape returned by fetch_solar_data, whatever format it is stored in.
+    """
+    file_path = _existing_path(raw_data_path, latitude, longitude, start_date, end_date, data_folder=data_folder)
+    count('bytes_read', file_size(file_path))
+    return backend_for_path(file_path).read_raw(file_path)
+
+
+@timed('save_cleaned')
+def save_cleaned(df, latitude, longitude, start_date, end_date, storage_format=None, data_folder=None):
+    """
+    Saves a cleaned DataFrame.
+    :return: Path of the written file
+    """
+    os.makedirs(data_folder or DATA_FOLDER, exist_ok=True)
+    file_path = cleaned_data_path(latitude, longitude, start_date, end_date, storage_format, data_folder)
+    get_backend(storage_format).write_frame(df, file_path)
+    count('bytes_written', file_size(file_path))
+    return file_path
+
+
+@timed('load_cleaned')
+def load_cleaned(latitude, longitude, start_date, end_date, data_folder=None):
+    """
+    Loads a cleaned DataFrame, whatever format it is stored in.
+    """
+    file_path = _existing_path(cleaned_data_path, latitude, longitude, start_date, end_date, data_folder=data_folder)
+    count('bytes_read', file_size(file_path))
+    return backend_for_path(file_path).read_frame(file_path)
+
+
+def cleaned_exists(latitude, longitude, start_date, end_date, data_folder=None):
+    try:
+        _existing_path(cleaned_data_path, latitude, longitude, start_date, end_date, data_folder=data_folder)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+@timed('save_series')
+def save_series(data, latitude, longitude, storage_format=None, data_folder=None):
+    """
+    Saves the growing series of a location (dictionary of parameter -> {'YYYYMMDDHH': value}). The file is
+    written next to the previous one and swapped in, so an interrupted run never leaves a truncated series.
+    :return: Path of the written file
+    """
+    file_path = series_data_path(latitude, longitude, storage_format, data_folder)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    get_backend(storage_format).write_raw(data, tmp_path)
+    os.replace(tmp_path, file_path)
+    count('bytes_written', file_size(file_path))
+    return file_path
+
+
+@timed('load_series')
+def load_series(latitude, longitude, data_folder=None):
+    """
+    Loads the series of a location, whatever format it is stored in.
+    :return: Dictionary {parameter: {'YYYYMMDDHH': value}}, empty if nothing is stored yet
+    """
+    try:
+        file_path = _existing_path(series_data_path, latitude, longitude, data_folder=data_folder)
+    except FileNotFoundError:
+        return {}
+    count('bytes_read', file_size(file_path))
+    return backend_for_path(file_path).read_raw(file_path)
+
+
+def list_cleaned(start_date, end_date, data_folder=None):
+    """
+    Lists the cleaned data files of a date range. When a location is stored in several formats
+    the configured one wins.
+    :return: List of (latitude, longitude, file_path) tuples
+    """
+    data_folder = data_folder or DATA_FOLDER
+    suffixes = {backend.extension: name for name, backend in BACKENDS.items()}
+    preferred = configured_format()
+    found = {}
+    for file in os.listdir(data_folder):
+        stem, extension = os.path.splitext(file)
+        if not file.startswith("cleaned_solar_data") or extension not in suffixes:
+            continue
+        if not stem.endswith(f"_{start_date}_to_{end_date}"):
+            continue
+        parts = stem.split("_")
+        location = (float(parts[4]), float(parts[6]))
+        if location not in found or suffixes[extension] == preferred:
+            found[location] = os.path.join(data_folder, file)
+
+    return [(lat, lon, file_path) for (lat, lon), file_path in found.items()]
+
+
+def migrate_json_files(data_folder=None, storage_format='parquet', remove_json=False):
+    """
+    One-shot migration of the raw, series and cleaned JSON files of the data folder to another format.
+    :param remove_json: Delete each JSON file once its converted copy is written
+    :return: Number of migrated files
+    """
+    data_folder = data_folder or DATA_FOLDER
+    target = get_backend(storage_format)
+    source = BACKENDS['json']
+    migrated = 0
+
+    series_folder = os.path.join(data_folder, 'series')
+    files = [os.path.join(data_folder, file) for file in sorted(os.listdir(data_folder))]
+    if os.path.isdir(series_folder):
+        files += [os.path.join(series_folder, file) for file in sorted(os.listdir(series_folder))]
+
+    for source_path in files:
+        file = os.path.basename(source_path)
+        if not file.endswith('.json'):
+            continue
+        target_path = source_path[:-len('.json')] + target.extension
+        if file.startswith("solar_data_lat_") or file.startswith("solar_series_lat_"):
+            target.write_raw(source.read_raw(source_path), target_path)
+        elif file.startswith("cleaned_solar_data"):
+            target.write_frame(source.read_frame(source_path), target_path)
+        else:
+            continue
+
+        migrated += 1
+        if remove_json:
+            os.remove(source_path)
+        print(f"Migrated {file} -> {os.path.basename(target_path)}")
+
+    print(f"{migrated} file(s) migrated to {storage_format}")
+    return migrated
+
+
+if __name__ == "__main__":
+    try:
+        migrate_json_files()
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
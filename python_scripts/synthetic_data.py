@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_PARAMETERS = ['ALLSKY_SFC_SW_DWN', 'T2M', 'SZA']
+
+
+def hourly_keys(start_date, hours):
+    """
+    Builds NASA hourly keys ('YYYYMMDDHH') starting at start_date.
+    :param start_date: First day in 'YYYYMMDD' format
+    :param hours: Number of hourly keys
+    :return: List of keys
+    """
+    index = pd.date_range(pd.Timestamp(start_date), periods=hours, freq='h')
+    return index.strftime('%Y%m%d%H').tolist()
+
+
+def generate_payload(years=1, parameters=None, start_date='20000101', gap_fraction=0.01, seed=0, latitude=50.0,
+                     gap_length=1):
+    """
+    Generates a dictionary shaped like the 'parameter' section of a NASA POWER hourly point response.
+    Irradiance follows a daily cycle, temperature a seasonal one, and a fraction of the hours is set to -999.
+    :param years: Number of years of hourly data
+    :param parameters: NASA parameter names, defaults to ALLSKY_SFC_SW_DWN, T2M and SZA. Other names get noise.
+    :param gap_fraction: Share of the values replaced by the -999 missing marker
+    :param latitude: Latitude of the point, sets the hemisphere of the seasons and scales the irradiance
+    :param gap_length: Length in hours of each run of missing values, 1 scatters single missing hours
+    :return: Dictionary {parameter: {'YYYYMMDDHH': value}}
+    """
+    parameters = parameters or DEFAULT_PARAMETERS
+    rng = np.random.default_rng(seed)
+    hours = int(round(years * 365.25 * 24))
+    keys = hourly_keys(start_date, hours)
+
+    t = np.arange(hours)
+    hour_of_day = t % 24
+    day_of_year = (t // 24) % 365
+    daylight = np.clip(np.sin((hour_of_day - 6) / 12 * np.pi), 0, None)
+    # 1 at the local summer solstice, 0 at the winter one
+    season = 0.5 + 0.5 * np.cos(2 * np.pi * (day_of_year - 172) / 365)
+    if latitude < 0:
+        season = 1 - season
+    sun = np.cos(np.radians(min(abs(latitude), 80.0)))
+
+    payload = {}
+    for name in parameters:
+        if name == 'ALLSKY_SFC_SW_DWN':
+            values = 1000 * sun * daylight * (0.3 + 0.7 * season) * rng.uniform(0.4, 1.0, hours)
+        elif name == 'T2M':
+            values = 30 * sun - 15 + 14 * season + 4 * daylight + rng.normal(0, 1.5, hours)
+        elif name == 'SZA':
+            values = 90 - 60 * daylight * (0.5 + 0.5 * season)
+        else:
+            values = rng.normal(0, 1, hours)
+        values = np.round(values, 2)
+        values[_gap_mask(rng, hours, gap_fraction, gap_length)] = -999
+        payload[name] = dict(zip(keys, values.tolist()))
+
+    return payload
+
+
+def _gap_mask(rng, hours, gap_fraction, gap_length):
+    starts = rng.random(hours) < gap_fraction / gap_length
+    if gap_length == 1:
+        return starts
+    # Every start hour opens a run of gap_length missing hours
+    return np.convolve(starts, np.ones(gap_length, dtype=bool), mode='full')[:hours] > 0
+
+
+def generate_response(latitude, longitude, start_date, end_date, parameters=None, gap_fraction=0.01, seed=None):
+    """
+    Generates a full NASA POWER hourly point response (GeoJSON feature) for a date range,
+    as fetch_solar_data receives it.
+    :param seed: Random seed, derived from the location when None so the same point always gets the same data
+    """
+    if seed is None:
+        seed = abs(hash((round(latitude, 6), round(longitude, 6)))) % (2 ** 32)
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    payload = generate_payload(days / 365.25, parameters, start_date, gap_fraction, seed, latitude)
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [longitude, latitude, 0.0]},
+        'properties': {'parameter': payload},
+        'header': {'fill_value': -999.0, 'start': start_date, 'end': end_date},
+    }
+
+
+def generate_grid(sites, years=1, parameters=None, gap_fraction=0.01, latitude=50.0, longitude=0.0,
+                  interval=0.5, start_date='20000101', gap_length=1):
+    """
+    Generates payloads for a square-ish grid of sites starting at (latitude, longitude).
+    :param sites: Number of grid cells
+    :return: Dictionary {(latitude, longitude): payload}
+    """
+    columns = int(np.ceil(np.sqrt(sites)))
+    grid = {}
+    for site in range(sites):
+        lat = round(latitude + (site // columns) * interval, 6)
+        lon = round(longitude + (site % columns) * interval, 6)
+        grid[(lat, lon)] = generate_payload(years, parameters, start_date, gap_fraction, site, lat, gap_length)
+    return grid
+
+
+def write_cleaned_grid(grid, start_date, end_date, data_folder, clean=None):
+    """
+    Cleans the payloads of generate_grid and saves them as cleaned data files of a date range,
+    so loaders such as load_cleaned_solar_data can be run on them.
+    :param clean: Cleaning function, defaults to data_cleaner.clean_solar_data_all
+    :return: Number of written files
+    """
+    from data_cleaner import clean_solar_data_all
+    from storage import save_cleaned
+    clean = clean or clean_solar_data_all
+    for (lat, lon), payload in grid.items():
+        save_cleaned(clean(payload), lat, lon, start_date, end_date, data_folder=data_folder)
+    return len(grid)
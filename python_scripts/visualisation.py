@@ -1,21 +1,77 @@
+import matplotlib
 import matplotlib.pyplot as plt
 import os
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from storage import load_cleaned
+from rollups import RollupStore
 from model import assign_season, feature_engineering, train_and_evaluate_by_season
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 pd.set_option('display.max_columns', None)
 season_mapping = {1: "Winter", 2: "Spring", 3: "Summer", 4: "Fall"}
+PLOTS_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'plots')
+# Scatter plots above this many points are randomly downsampled, the regression metrics still use every row
+MAX_SCATTER_POINTS = 20000
 
-def plot_actual_by_season(df, results):
+# Figure reused by every plot rendered in a headless worker process
+_figure = None
+
+
+def downsample(x, y, max_points=MAX_SCATTER_POINTS, seed=0):
+    """
+    Picks a random subset of at most max_points (x, y) pairs, keeping their order.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    keep = np.sort(np.random.default_rng(seed).choice(len(x), size=max_points, replace=False))
+    return x[keep], y[keep]
+
+
+def draw_season_scatter(ax, temperature, irradiance, season, r2, mae, mse, intercept, coefficients,
+                        max_points=MAX_SCATTER_POINTS, total_points=None, location=None):
+    """
+    Draws the actual solar irradiance vs temperature of one season with the regression equation and metrics.
+    :param total_points: Number of rows the points were sampled from when they were downsampled beforehand
+    :param location: Optional (latitude, longitude) shown in the title
+    """
+    x, y = downsample(temperature, irradiance, max_points)
+    total_points = total_points or len(temperature)
+    label = "Data Points" if len(x) == total_points else f"Data Points ({len(x)} of {total_points})"
+    ax.scatter(x, y, alpha=0.5, label=label, rasterized=True)
+
+    ax.set_xlabel('Temperature')
+    ax.set_ylabel('Solar Irradiance (kW-hr/m^2)')
+    site = f" at ({location[0]}, {location[1]})" if location is not None else ""
+    ax.set_title(f'Actual Solar Irradiance ({season_mapping.get(season)}){site} with the predicted linear regression equation')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+    ax.grid(True)
+
+    textstr = f"R² = {r2:.4f}\nMAE = {mae:.4f}\nMSE = {mse:.4f} \ny = {coefficients[0]:.4f} * Temperature + {coefficients[1]:.4f} * Solar Zenith Angle + {intercept:.4f}"
+    ax.text(0.05, 0.95, textstr, transform=ax.transAxes, fontsize=12, verticalalignment='top', bbox=dict(facecolor='white', alpha=0.5))
+
+    # Set y-axis (solar irradiance) to start at 0
+    ax.set_ylim(bottom=0)
+
+
+def plot_actual_by_season(df, results, save_folder=None, max_points=MAX_SCATTER_POINTS):
     """
        Plots the actual vs predicted solar irradiance values over time, grouped by season.
        Skips invalid results.
+       :param save_folder: Save each plot as plot_{timestamp}_{i}.png in this folder instead of showing it
+       :param max_points: Scatter points drawn per plot, None draws every row
+       :return: List of the saved file paths
     """
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
     seasons = df['Season_Encoded'].unique()
+    timestamp = datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+    saved = []
 
-    for season in seasons:
+    for i, season in enumerate(seasons):
         season_df = df[df['Season_Encoded'] == season]
 
         if not season_df.empty:
@@ -40,32 +96,105 @@ def plot_actual_by_season(df, results):
             coefficients = model.coef_
 
             # Plot the actual vs predicted values
-            plt.figure(figsize=(12, 6))
+            figure, ax = plt.subplots(figsize=(12, 6))
             # Scatter plot for actual solar irradiance (y_test) vs Temperature from X_test
-            plt.scatter(season_df['Temperature'], season_df['Solar_Irradiance'], alpha=0.5, label = "Data Points")
+            draw_season_scatter(ax, season_df['Temperature'], season_df['Solar_Irradiance'], season,
+                                r2, mae, mse, intercept, coefficients, max_points)
+
+            if save_folder is None:
+                plt.show()
+            else:
+                os.makedirs(save_folder, exist_ok=True)
+                file_path = os.path.join(save_folder, f"plot_{timestamp}_{i}.png")
+                figure.savefig(file_path)
+                plt.close(figure)
+                saved.append(file_path)
+
+    return saved
+
+
+def _init_headless_worker():
+    # Workers never open a window, Agg renders straight to image buffers
+    matplotlib.use('Agg')
+
 
-            plt.xlabel('Temperature')
-            plt.ylabel('Solar Irradiance (kW-hr/m^2)')
-            plt.title(f'Actual Solar Irradiance ({season_mapping.get(season)}) with the predicted linear regression equation')
-            plt.xticks(rotation=45)
-            plt.legend()
-            plt.grid(True)
+def _render_site(task):
+    """
+    Renders the season plots of one site on a figure that is created once per worker process and
+    cleared between plots, which is much cheaper than building a new figure every time.
+    """
+    global _figure
+    latitude, longitude, seasons, output_folder, timestamp, dpi = task
+    if _figure is None:
+        _figure = plt.figure(figsize=(12, 6))
+
+    saved = []
+    for season, temperature, irradiance, n_points, row in seasons:
+        _figure.clf()
+        ax = _figure.add_subplot()
+        draw_season_scatter(ax, temperature, irradiance, season, row['R2'], row['MAE'], row['MSE'],
+                            row['Intercept'], (row['Coef_Temperature'], row['Coef_Solar_zenith_angle']),
+                            max_points=None, total_points=n_points, location=(latitude, longitude))
+        file_path = os.path.join(output_folder,
+                                 f"plot_{timestamp}_lat_{latitude}_long_{longitude}_{season}.png")
+        _figure.savefig(file_path, dpi=dpi)
+        saved.append(file_path)
+    return saved
+
+
+def render_site_season_plots(df, results, output_folder=None, max_workers=None, max_points=MAX_SCATTER_POINTS,
+                             dpi=100, seed=0):
+    """
+    Renders the actual solar irradiance plot of every (site, season) to PNG files without a display,
+    spreading the sites over a process pool.
+    :param df: Multi-site DataFrame with Latitude, Longitude, Season_Encoded, Temperature and Solar_Irradiance
+    :param results: Results table as returned by train_by_site_and_season or ModelRegistry.to_results
+    :param output_folder: Folder of the PNG files, defaults to plots/
+    :param max_points: Scatter points drawn per plot, the points are downsampled before being sent to a worker
+    :return: List of the saved file paths
+    """
+    output_folder = output_folder or PLOTS_FOLDER
+    os.makedirs(output_folder, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+    models = {(row['Latitude'], row['Longitude'], int(row['Season_Encoded'])): row
+              for row in results.to_dict('records')}
+
+    tasks = []
+    for (latitude, longitude), site_df in df.groupby(['Latitude', 'Longitude'], sort=True):
+        seasons = []
+        for season, season_df in site_df.groupby('Season_Encoded', sort=True):
+            row = models.get((latitude, longitude, int(season)))
+            if row is None:
+                print(f"Skipping ({latitude}, {longitude}) Season {season_mapping.get(season)}: No valid model available.")
+                continue
+            temperature, irradiance = downsample(season_df['Temperature'].to_numpy(),
+                                                 season_df['Solar_Irradiance'].to_numpy(), max_points, seed)
+            seasons.append((int(season), temperature, irradiance, len(season_df), row))
+        if seasons:
+            tasks.append((latitude, longitude, seasons, output_folder, timestamp, dpi))
 
-            textstr = f"R² = {r2:.4f}\nMAE = {mae:.4f}\nMSE = {mse:.4f} \ny = {coefficients[0]:.4f} * Temperature + {coefficients[1]:.4f} * Solar Zenith Angle + {intercept:.4f}"
-            plt.text(0.05, 0.95, textstr, transform=plt.gca().transAxes, fontsize=12, verticalalignment='top', bbox=dict(facecolor='white', alpha=0.5))
+    saved = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_headless_worker) as executor:
+        for i, files in enumerate(executor.map(_render_site, tasks)):
+            saved.extend(files)
+            print(f"Rendered site {i + 1}/{len(tasks)}")
 
-            # Set y-axis (solar irradiance) to start at 0
-            plt.ylim(bottom=0)
+    print(f"{len(saved)} plot(s) saved to {output_folder}")
+    return saved
 
-            plt.show()
 
-def plot_avg_irradiance_by_season(df):
+def plot_avg_irradiance_by_season(df=None, rollups=None, latitude=None, longitude=None):
     """
     Plots a bar chart of average solar irradiance for each season.
+    When a RollupStore is given the averages are read from its precomputed seasonal rollup instead of
+    grouping the hourly rows.
     """
     # Group by season and calculate average solar irradiance
     # to note that this is only for times when there is solar irradiance and not total energy which could be misleading
-    avg_irradiance = df.groupby('Season_Encoded')['Solar_Irradiance'].mean()
+    if rollups is not None:
+        avg_irradiance = rollups.season_average(latitude, longitude, daylight_only=True)
+    else:
+        avg_irradiance = df.groupby('Season_Encoded')['Solar_Irradiance'].mean()
 
     plt.figure(figsize=(10, 6))
     avg_irradiance.plot(kind='bar', color='skyblue')
@@ -87,10 +216,8 @@ if __name__ == "__main__":
         # Scatter plot of solar irradiance vs temperature
 
         start_date , end_date = '20230101', '20240101'
-        data_folder = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'data')
-        filename = f"cleaned_solar_data_{start_date}_to_{end_date}.json"
-        file_path = os.path.join(data_folder, filename)
-        cleaned_data = pd.read_json(file_path)
+        latitude, longitude = 51.54501, -0.00564
+        cleaned_data = load_cleaned(latitude, longitude, start_date, end_date)
 
         df_1 = assign_season(cleaned_data)
         cleaned_df = feature_engineering(df_1)
@@ -98,6 +225,9 @@ if __name__ == "__main__":
 
         plot_actual_by_season(cleaned_df, results)
 
-        plot_avg_irradiance_by_season(cleaned_df)
+        rollups = RollupStore()
+        rollups.update(cleaned_data, latitude, longitude)
+        rollups.save()
+        plot_avg_irradiance_by_season(rollups=rollups, latitude=latitude, longitude=longitude)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts import each other as top-level modules, as when they are run from python_scripts
+SCRIPTS_FOLDER = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'python_scripts')
+sys.path.insert(0, SCRIPTS_FOLDER)
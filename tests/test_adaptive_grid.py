@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from adaptive_grid import DeduplicatingSink, frame_fingerprint, save_aliases, load_aliases, expand_aliases, \
+    adaptive_download
+
+
+def cell_frame(values):
+    return pd.DataFrame({'DateTime': pd.date_range('2023-01-01', periods=len(values), freq='h'),
+                         'Solar_Irradiance': np.asarray(values, dtype=float)})
+
+
+def test_fingerprint_depends_on_row_order():
+    frame = cell_frame([1, 2, 3, 4])
+    swapped = frame.assign(Solar_Irradiance=[2.0, 1.0, 3.0, 4.0])
+    assert frame_fingerprint(frame) == frame_fingerprint(cell_frame([1, 2, 3, 4]))
+    assert frame_fingerprint(frame) != frame_fingerprint(swapped)
+    assert frame_fingerprint(frame) != frame_fingerprint(frame.rename(columns={'Solar_Irradiance': 'Temperature'}))
+
+
+def test_only_identical_frames_are_aliased(monkeypatch):
+    persisted = []
+    sink = DeduplicatingSink(lambda lat, lon, df: persisted.append((lat, lon)))
+    sink(50.0, 0.0, cell_frame([1, 2, 3, 4]))
+    sink(50.5, 0.0, cell_frame([1, 2, 3, 4]))
+    # Same values in another order used to get the same fingerprint
+    sink(51.0, 0.0, cell_frame([4, 3, 2, 1]))
+    assert persisted == [(50.0, 0.0), (51.0, 0.0)]
+    assert sink.aliases == {(50.5, 0.0): (50.0, 0.0)}
+
+    # Frames with the same fingerprint are still compared value by value
+    monkeypatch.setattr('adaptive_grid.frame_fingerprint', lambda df: 'collision')
+    sink = DeduplicatingSink(lambda lat, lon, df: persisted.append((lat, lon)))
+    sink(50.0, 1.0, cell_frame([1, 2]))
+    sink(50.5, 1.0, cell_frame([5, 6]))
+    sink(51.0, 1.0, cell_frame([5, 6]))
+    assert persisted[-2:] == [(50.0, 1.0), (50.5, 1.0)]
+    assert sink.aliases == {(51.0, 1.0): (50.5, 1.0)}
+
+
+def test_saved_aliases_are_merged(tmp_path):
+    folder = str(tmp_path)
+    save_aliases({(50.5, 0.0): (50.0, 0.0), (51.0, 0.0): (50.0, 0.0)}, '20230101', '20230102', folder)
+    save_aliases({(52.0, 0.0): (51.5, 0.0)}, '20230101', '20230102', folder, stored=[(51.0, 0.0)])
+    assert load_aliases('20230101', '20230102', folder) == {(50.5, 0.0): (50.0, 0.0), (52.0, 0.0): (51.5, 0.0)}
+
+
+def test_aliases_are_expanded():
+    df = pd.concat([cell_frame([1, 2]).assign(Latitude=50.0, Longitude=0.0),
+                    cell_frame([np.nan, np.nan]).assign(Latitude=50.5, Longitude=0.0)], ignore_index=True)
+    expanded = expand_aliases(df, {(50.5, 0.0): (50.0, 0.0), (51.0, 0.0): (50.0, 0.0)})
+    assert len(expanded) == 6
+    assert expanded[expanded['Latitude'] == 50.5]['Solar_Irradiance'].tolist() == [1, 2]
+
+
+def test_uniform_areas_are_stored_once(tmp_path):
+    cells = [(50.0 + 0.25 * i, 0.25 * j) for i in range(5) for j in range(5)]
+    fetched = []
+    stored = []
+
+    def run(batch, sink):
+        for lat, lon in batch:
+            fetched.append((lat, lon))
+            # Two identical halves split at latitude 50.5
+            sink(lat, lon, cell_frame([1, 2, 3] if lat < 50.5 else [7, 8, 9]))
+
+    counts = adaptive_download(cells, '20230101', '20230102', lambda lat, lon, df: stored.append((lat, lon)), run,
+                               interval=0.25, coarse_interval=1.0, data_folder=str(tmp_path))
+    assert counts['fetched'] == len(fetched) < len(cells)
+    # One copy of each half is stored, every other cell points at it
+    assert len(stored) == 2 and counts['aliases'] == len(cells) - 2
+    aliases = load_aliases('20230101', '20230102', str(tmp_path))
+    assert all((source[0] < 50.5) == (target[0] < 50.5) for target, source in aliases.items())
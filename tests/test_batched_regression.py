@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from batched_regression import fit_grouped_least_squares, grouped_test_mask, grouped_sufficient_statistics, \
+    solve_normal_equations, design_matrix, FEATURES, TARGET, GROUP_COLUMNS
+from model import assign_season
+
+
+def multi_site_frame(sites=3, hours=24 * 200, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for site in range(sites):
+        temperature = rng.normal(10 + site, 5, hours)
+        zenith = rng.uniform(20, 90, hours)
+        irradiance = 50 + 3 * temperature - 2 * zenith + rng.normal(0, 5, hours)
+        frames.append(pd.DataFrame({
+            'DateTime': pd.date_range('2023-01-01', periods=hours, freq='h'),
+            'Latitude': 50.0 + site, 'Longitude': 0.0,
+            'Temperature': temperature, 'Solar_zenith_angle': zenith, 'Solar_Irradiance': irradiance,
+        }))
+    return assign_season(pd.concat(frames, ignore_index=True))
+
+
+def test_split_is_exact_per_group():
+    codes = np.repeat(np.arange(4), [10, 3, 7, 1])
+    np.random.default_rng(0).shuffle(codes)
+    test = grouped_test_mask(codes, 4, test_size=0.2, random_state=4)
+    assert np.bincount(codes[test], minlength=4).tolist() == [2, 1, 2, 1]
+    assert np.array_equal(test, grouped_test_mask(codes, 4, test_size=0.2, random_state=4))
+
+
+def test_matches_sklearn():
+    linear_model = pytest.importorskip('sklearn.linear_model')
+    metrics = pytest.importorskip('sklearn.metrics')
+    df = multi_site_frame()
+    results = fit_grouped_least_squares(df)
+    assert len(results) == df.groupby(GROUP_COLUMNS).ngroups
+
+    # Same rows and split as fit_grouped_least_squares
+    grouper = df.groupby(GROUP_COLUMNS, sort=True)
+    test = grouped_test_mask(grouper.ngroup().to_numpy(), grouper.ngroups)
+    for (latitude, longitude, season), rows in df.assign(test=test).groupby(GROUP_COLUMNS):
+        train_rows, test_rows = rows[~rows['test']], rows[rows['test']]
+        model = linear_model.LinearRegression().fit(train_rows[FEATURES], train_rows[TARGET])
+        predicted = model.predict(test_rows[FEATURES])
+        result = results[(results['Latitude'] == latitude) & (results['Season_Encoded'] == season)].iloc[0]
+        np.testing.assert_allclose([result['Intercept'], result['Coef_Temperature'],
+                                    result['Coef_Solar_zenith_angle']],
+                                   [model.intercept_, *model.coef_], rtol=1e-6)
+        np.testing.assert_allclose(result['R2'], metrics.r2_score(test_rows[TARGET], predicted), rtol=1e-6)
+        np.testing.assert_allclose(result['MAE'], metrics.mean_absolute_error(test_rows[TARGET], predicted),
+                                   rtol=1e-6)
+        assert result['N_train'] == len(train_rows) and result['N_test'] == len(test_rows)
+
+
+def test_only_singular_groups_use_the_pseudo_inverse():
+    rng = np.random.default_rng(1)
+    x = np.column_stack([rng.normal(10, 5, 300), rng.uniform(20, 90, 300)])
+    codes = np.repeat([0, 1, 2], 100)
+    # Group 1 has a constant temperature, its system is singular
+    x[codes == 1, 0] = 12.0
+    y = 50 + 3 * x[:, 0] - 2 * x[:, 1]
+    xtx, xty, _, _ = grouped_sufficient_statistics(codes, x, y, 3)
+    coefficients = solve_normal_equations(xtx, xty)
+    np.testing.assert_allclose(coefficients[[0, 2]], [[50, 3, -2]] * 2, rtol=1e-9)
+    # Any least-squares solution reproduces the singular group's targets
+    np.testing.assert_allclose(design_matrix(x[codes == 1]) @ coefficients[1], y[codes == 1], rtol=1e-9)
+
+
+def test_large_offsets_stay_accurate():
+    rng = np.random.default_rng(2)
+    df = multi_site_frame(sites=1)
+    df['Temperature'] = 1e5 + rng.normal(0, 1, len(df))
+    df['Solar_zenith_angle'] = -3e4 + rng.normal(0, 0.5, len(df))
+    df['Solar_Irradiance'] = 7 + 0.5 * df['Temperature'] + 4 * df['Solar_zenith_angle']
+    results = fit_grouped_least_squares(df)
+    np.testing.assert_allclose(results[['Coef_Temperature', 'Coef_Solar_zenith_angle']], [[0.5, 4]] * len(results),
+                               rtol=1e-7)
+    np.testing.assert_allclose(results['Intercept'], 7, rtol=1e-4)
@@ -0,0 +1,26 @@
+import inspect
+import pandas as pd
+from benchmarks import benchmark_calendar_features, time_function, save_baseline, compare_with_baseline
+
+
+def test_calendar_benchmark_defaults_stay_small():
+    assert inspect.signature(benchmark_calendar_features).parameters['rows'].default <= 5_000_000
+    result = benchmark_calendar_features(rows=20_000, sites=10, reference_rows=50_000)
+    assert result.loc[0, 'rows'] == 20_000 and result.loc[0, 'reference_rows'] == 20_000
+
+
+def test_time_function_returns_the_result():
+    seconds, result = time_function(sum, [1, 2, 3], repeat=2)
+    assert result == 6 and seconds >= 0
+
+
+def test_regressions_are_flagged_against_the_baseline(tmp_path):
+    baseline = pd.DataFrame([{'benchmark': 'a', 'seconds': 1.0, 'peak_mb': 10.0, 'rows': 5, 'years': 1, 'sites': 25},
+                             {'benchmark': 'b', 'seconds': 1.0, 'peak_mb': 10.0, 'rows': 5, 'years': 1, 'sites': 25}])
+    path = save_baseline(baseline, str(tmp_path / 'baseline.json'))
+
+    results = baseline.assign(seconds=[1.1, 2.0])
+    comparison = compare_with_baseline(results, path)
+    assert comparison['Regression'].tolist() == [False, True]
+    # Other data sizes have nothing to compare with
+    assert not compare_with_baseline(results.assign(sites=50), path)['Regression'].any()
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from conftest import SCRIPTS_FOLDER
+
+HEAVY_MODULES = ('sklearn', 'matplotlib', 'plotly')
+
+
+def run_python(*args):
+    return subprocess.run([sys.executable, *args], cwd=SCRIPTS_FOLDER, capture_output=True, text=True, timeout=60)
+
+
+def test_import_does_not_load_heavy_modules():
+    check = (f"import sys, cli, solar_irradiance_map; "
+             f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    result = run_python('-c', check)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+
+def test_help_exits_cleanly():
+    result = run_python('cli.py', '--help')
+    assert result.returncode == 0, result.stderr
+    assert 'fetch' in result.stdout
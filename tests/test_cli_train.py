@@ -0,0 +1,41 @@
+import pytest
+import cli
+import online_model
+import storage
+from online_model import OnlineModels
+from synthetic_data import generate_grid, write_cleaned_grid
+
+START, END = '20230101', '20230110'
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DATA_FOLDER', str(tmp_path / 'data'))
+    monkeypatch.setattr(online_model, 'MODELS_FOLDER', str(tmp_path / 'models'))
+    return tmp_path
+
+
+def write_site(parameters, data_folder):
+    grid = generate_grid(1, years=10 / 365.25, parameters=parameters, start_date=START)
+    write_cleaned_grid(grid, START, END, data_folder)
+    return next(iter(grid))
+
+
+def test_training_without_temperature_is_refused(folders, capsys):
+    write_site(['ALLSKY_SFC_SW_DWN'], str(folders / 'data'))
+    assert cli.main(['train', '--start', START, '--end', END]) == 1
+    assert '--all-parameters' in capsys.readouterr().out
+
+
+def test_saved_half_life_is_kept(folders, capsys):
+    latitude, longitude = write_site(None, str(folders / 'data'))
+    site = ['train', '--online', '--latitude', str(latitude), '--longitude', str(longitude),
+            '--start', START, '--end', END]
+    assert cli.main(site + ['--half-life', '24']) == 0
+    assert OnlineModels.load().half_life_hours == 24
+
+    # The saved half-life is used when none is given, a different one is refused
+    assert cli.main(site) == 0
+    assert cli.main(site + ['--half-life', '48']) == 1
+    assert 'half-life of 24.0 hours' in capsys.readouterr().out
+    assert OnlineModels.load().half_life_hours == 24
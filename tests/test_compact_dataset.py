@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from compact_dataset import CompactDataset
+from storage import list_cleaned, load_cleaned, backend_for_path
+from synthetic_data import generate_grid, write_cleaned_grid
+
+
+def long_frame():
+    times = pd.date_range('2023-01-01', periods=48, freq='h')
+    frames = []
+    for site, (lat, lon) in enumerate([(50.0, 0.0), (50.0, 0.5), (50.5, 0.0)]):
+        frames.append(pd.DataFrame({'DateTime': times, 'Solar_Irradiance': np.arange(48.0) + 100 * site,
+                                    'Temperature': np.full(48, float(site)), 'Latitude': lat, 'Longitude': lon}))
+    return pd.concat(frames, ignore_index=True).drop(index=[5, 60]).reset_index(drop=True)
+
+
+def test_round_trip_through_the_long_frame():
+    df = long_frame()
+    dataset = CompactDataset.from_frame(df)
+    assert len(dataset) == 3 and dataset.n_hours == 48
+    pd.testing.assert_frame_equal(dataset.to_frame(), df, check_dtype=False)
+    assert dataset.nbytes < df.memory_usage(index=False).sum()
+
+
+def test_lookups_and_views():
+    dataset = CompactDataset.from_frame(long_frame())
+    site = dataset.site(50.0, 0.5)
+    assert site.iloc[3] == 103 and np.isnan(site.iloc[12])
+    assert dataset.at('2023-01-01 02:00').tolist() == [2, 102, 202]
+    with pytest.raises(KeyError):
+        dataset.site_id(10.0, 0.0)
+
+    window = dataset.window('2023-01-01 10:00', '2023-01-01 12:00')
+    assert window.n_hours == 3 and window.site(50.5, 0.0).tolist() == [210, 211, 212]
+    assert np.shares_memory(window.values['Solar_Irradiance'], dataset.values['Solar_Irradiance'])
+
+    selected = dataset.select([2, 0])
+    assert selected.sites['Latitude'].tolist() == [50.5, 50.0] and selected.at('2023-01-01 01:00').tolist() == [201, 1]
+
+
+def test_aliases_add_sites():
+    dataset = CompactDataset.from_frame(long_frame())
+    aliased = dataset.with_aliases({(51.0, 0.0): (50.5, 0.0), (50.0, 0.0): (50.5, 0.0), (52.0, 0.0): (9.0, 9.0)})
+    assert len(aliased) == 4
+    np.testing.assert_array_equal(aliased.site(51.0, 0.0), aliased.site(50.5, 0.0))
+
+
+def test_cells_are_read_one_file_at_a_time(tmp_path):
+    grid = generate_grid(4, years=3 / 365.25, gap_fraction=0.0, start_date='20230101')
+    write_cleaned_grid(grid, '20230101', '20230103', str(tmp_path))
+    cells = list_cleaned('20230101', '20230103', str(tmp_path))
+    dataset = CompactDataset.from_cells(cells, lambda path: backend_for_path(path).read_frame(path),
+                                        '20230101', '20230102')
+    assert dataset.n_hours == 48
+    lat, lon, _ = cells[1]
+    expected = load_cleaned(lat, lon, '20230101', '20230103', str(tmp_path)).set_index('DateTime')
+    np.testing.assert_allclose(dataset.site(lat, lon), expected['Solar_Irradiance'].iloc[:48], rtol=1e-6)
+
+    path = dataset.save(str(tmp_path / 'dataset.npz'))
+    loaded = CompactDataset.load(path)
+    pd.testing.assert_frame_equal(loaded.to_frame(), dataset.to_frame())
@@ -0,0 +1,103 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from cube_store import CubeStore
+
+LATITUDES = [50.0, 50.5, 51.0]
+LONGITUDES = [0.0, 0.5, 1.0, 1.5, 2.0]
+
+
+def cell_frame(offset):
+    times = pd.date_range('2023-01-01', '2023-01-03 23:00', freq='h')
+    return pd.DataFrame({'DateTime': times, 'Solar_Irradiance': np.arange(len(times), dtype=float) + offset})
+
+
+def small_store(path):
+    # Tiles of 2x2 cells and day-long chunks, so a 3x5 grid over 3 days spans several chunks in every direction
+    return CubeStore.create(str(path), '20230101', '20230103', LATITUDES, LONGITUDES, time_chunk=24, tile_size=2)
+
+
+def test_cells_round_trip_across_chunks(tmp_path):
+    cube = small_store(tmp_path)
+    cube.write_cell(51.0, 2.0, cell_frame(1000))
+    cube.write_cell(50.5, 1.0, cell_frame(0))
+    cube.flush()
+
+    cube = CubeStore(str(tmp_path))
+    assert cube.has_cell(51.0, 2.0) and cube.has_cell(50.5, 1.0)
+    assert not cube.has_cell(50.0, 0.0) and not cube.has_cell(40.0, 0.0)
+
+    series = cube.read_cell(51.0, 2.0)
+    assert np.array_equal(series.to_numpy(), cell_frame(1000)['Solar_Irradiance'].to_numpy())
+    window = cube.read_cell(50.5, 1.0, start='2023-01-01 20:00', end='2023-01-02 03:00')
+    assert window.index[0] == pd.Timestamp('2023-01-01 20:00') and list(window) == list(range(20, 28))
+    assert cube.read_cell(50.0, 0.0).isna().all()
+
+    grid = cube.read_time('2023-01-02 05:00')
+    assert grid[2, 4] == 1029 and grid[1, 2] == 29
+    assert np.isnan(grid).sum() == grid.size - 2
+
+
+def test_read_frame_matches_written_cells(tmp_path):
+    cube = small_store(tmp_path)
+    cube.write_cell(51.0, 2.0, cell_frame(1000))
+    cube.write_cell(50.5, 1.0, cell_frame(0))
+
+    frame = cube.read_frame('2023-01-01 22:00', '2023-01-02 01:00')
+    assert len(frame) == 8
+    assert list(frame.columns) == ['DateTime', 'Latitude', 'Longitude', 'Solar_Irradiance']
+    cell = frame[(frame['Latitude'] == 51.0) & (frame['Longitude'] == 2.0)]
+    assert list(cell['Solar_Irradiance']) == [1022, 1023, 1024, 1025]
+
+
+def test_chunks_are_created_on_first_write(tmp_path):
+    cube = small_store(tmp_path)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('Solar_Irradiance')]
+    cube.write_cell(50.0, 0.0, cell_frame(0))
+    chunks = sorted(name for name in os.listdir(tmp_path) if name.startswith('Solar_Irradiance'))
+    # One tile, three days
+    assert chunks == [f"Solar_Irradiance_{day:05d}_0000_0000.npy" for day in range(3)]
+    assert np.load(os.path.join(tmp_path, chunks[0])).shape == (2, 2, 24)
+
+
+def test_read_only_store_is_not_written(tmp_path):
+    cube = small_store(tmp_path)
+    cube.write_cell(50.5, 1.0, cell_frame(0))
+    cube.flush()
+    os.remove(os.path.join(tmp_path, 'written.npy'))
+    before = sorted(os.listdir(tmp_path))
+
+    cube = CubeStore(str(tmp_path))
+    assert cube.has_cell(50.5, 1.0) and not cube.has_cell(51.0, 2.0)
+    assert sorted(os.listdir(tmp_path)) == before
+
+    with pytest.raises(ValueError):
+        cube.add_variables(['Temperature'])
+
+
+def test_added_variables_read_as_nan(tmp_path):
+    cube = small_store(tmp_path)
+    cube.write_cell(50.5, 1.0, cell_frame(0))
+    assert cube.add_variables(['Solar_Irradiance', 'Temperature']) == ['Temperature']
+
+    cube = CubeStore(str(tmp_path), 'r+')
+    assert cube.variables == ['Solar_Irradiance', 'Temperature']
+    assert cube.read_cell(50.5, 1.0, 'Temperature').isna().all()
+    frame = cell_frame(0).assign(Temperature=5.0)
+    cube.write_cell(51.0, 0.0, frame)
+    assert (cube.read_cell(51.0, 0.0, 'Temperature') == 5.0).all()
+
+
+def test_off_grid_and_former_layout(tmp_path):
+    cube = small_store(tmp_path)
+    assert cube.off_grid([(50.0, 0.0), (49.0, 0.0), (51.0, 3.0)]) == [(49.0, 0.0), (51.0, 3.0)]
+
+    with open(os.path.join(tmp_path, 'meta.json'), 'r') as file:
+        meta = json.load(file)
+    del meta['tile_size']
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+    with pytest.raises(ValueError, match='remove it'):
+        CubeStore(str(tmp_path))
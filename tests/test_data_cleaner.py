@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from data_cleaner import clean_solar_data, clean_solar_data_fast
+from synthetic_data import generate_payload
+
+
+def test_fast_cleaner_matches_reference():
+    data = generate_payload(years=0.1, gap_fraction=0.05, seed=1)
+    expected = clean_solar_data(data)
+    result = clean_solar_data_fast(data)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    assert result['Solar_Irradiance'].isna().any()
+
+
+def test_fast_cleaner_realigns_missing_hours():
+    data = generate_payload(years=0.01, gap_fraction=0.0, seed=2)
+    first_key = next(iter(data['T2M']))
+    del data['T2M'][first_key]
+    result = clean_solar_data_fast(data)
+    assert len(result) == len(data['ALLSKY_SFC_SW_DWN'])
+    assert np.isnan(result['Temperature'].iloc[0])
+
+
+def test_empty_input_keeps_the_columns():
+    assert clean_solar_data_fast({}).columns.tolist() == ['DateTime', 'Solar_Irradiance', 'Temperature',
+                                                          'Solar_zenith_angle']
+    result = clean_solar_data_fast({}, parameters=['ALLSKY_SFC_SW_DWN'])
+    assert result.empty and result.columns.tolist() == ['DateTime', 'Solar_Irradiance']
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from features import months, season_codes, calendar_features, add_calendar_features
+
+
+def test_months_and_seasons_match_pandas():
+    datetimes = pd.date_range('2023-01-01', '2024-12-31 23:00', freq='7h')
+    assert np.array_equal(months(datetimes), datetimes.month)
+
+    expected = datetimes.month.map({12: 1, 1: 1, 2: 1, 3: 2, 4: 2, 5: 2, 6: 3, 7: 3, 8: 3, 9: 4, 10: 4, 11: 4})
+    assert np.array_equal(season_codes(datetimes), expected)
+    # South of the equator the seasons are six months apart
+    southern = season_codes(datetimes, np.full(len(datetimes), -33.0))
+    assert np.array_equal(southern, (expected.to_numpy() + 1) % 4 + 1)
+
+
+def test_calendar_features_match_pandas():
+    datetimes = pd.date_range('2024-01-01', '2024-12-31 23:00', freq='5h')
+    features = calendar_features(datetimes)
+    assert np.array_equal(features['Hour'], datetimes.hour)
+    assert np.array_equal(features['Day_of_year'], datetimes.dayofyear)
+    np.testing.assert_allclose(features['Hour_sin'], np.sin(2 * np.pi * datetimes.hour / 24), atol=1e-6)
+    np.testing.assert_allclose(features['Day_of_year_cos'], np.cos(2 * np.pi * datetimes.dayofyear / 365.25),
+                               atol=1e-6)
+    assert 'Hour_sin' not in calendar_features(datetimes, cyclic=False)
+
+
+def test_features_are_added_to_frames_and_column_stores():
+    datetimes = pd.to_datetime(['2023-07-01 10:00', '2023-07-01 11:00'])
+    df = add_calendar_features(pd.DataFrame({'DateTime': datetimes, 'Latitude': [51.0, -33.0]}))
+    assert df['Season_Encoded'].tolist() == [3, 1]
+    df = add_calendar_features(pd.DataFrame({'DateTime': datetimes, 'Latitude': [51.0, -33.0]}),
+                               hemisphere_aware=False)
+    assert df['Season_Encoded'].tolist() == [3, 3]
+
+    columns = add_calendar_features({'DateTime': datetimes.to_numpy()}, cyclic=False)
+    assert columns['Hour'].tolist() == [10, 11] and columns['Month'].tolist() == [7, 7]
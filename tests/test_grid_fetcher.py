@@ -0,0 +1,54 @@
+import pytest
+import grid_fetcher
+from data_scraper_nasa import FetchError
+from grid_fetcher import build_grid, fetch_grid, fetch_with_retry
+from power_simulator import PowerSimulator
+
+
+def failing_fetch(errors, result):
+    # Raises the given errors one call after the other, then returns result
+    calls = []
+
+    def fetch(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fetch, calls
+
+
+def test_build_grid_covers_the_area():
+    cells = build_grid(51.0, 0.0, 0.5, 0.25, 0.25)
+    assert len(cells) == 5 * 3
+    assert cells[0] == (50.5, -0.25) and cells[-1] == (51.5, 0.25)
+
+
+def test_throttling_does_not_use_up_retries(monkeypatch):
+    delays = []
+    fetch, calls = failing_fetch([FetchError(429, '2')] * 8, {'ok': {}})
+    monkeypatch.setattr(grid_fetcher, 'fetch_solar_data', fetch)
+    monkeypatch.setattr(grid_fetcher.time, 'sleep', delays.append)
+
+    assert fetch_with_retry(None, 51.5, 0.0, '20230101', '20230102', max_retries=2) == {'ok': {}}
+    assert len(calls) == 9
+    # Retry-After is a minimum, the jitter on top keeps throttled workers from coming back together
+    assert all(2.0 <= delay <= 4.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_server_errors_are_bounded(monkeypatch):
+    fetch, calls = failing_fetch([FetchError(500)] * 5, {})
+    monkeypatch.setattr(grid_fetcher, 'fetch_solar_data', fetch)
+    monkeypatch.setattr(grid_fetcher.time, 'sleep', lambda delay: None)
+
+    with pytest.raises(FetchError):
+        fetch_with_retry(None, 51.5, 0.0, '20230101', '20230102', max_retries=2)
+    assert len(calls) == 3
+
+
+def test_fetch_grid_against_simulator():
+    cells = build_grid(51.5, 0.0, 0.1, 0.1, 0.1)
+    with PowerSimulator(seed=0) as simulator:
+        results = list(fetch_grid(cells, '20230101', '20230102', max_workers=4, base_url=simulator.base_url))
+    assert sorted((lat, lon) for lat, lon, _, _ in results) == sorted(cells)
+    assert all(error is None and len(data['ALLSKY_SFC_SW_DWN']) == 48 for _, _, data, error in results)
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pandas as pd
+from heatmap_frames import aggregate_frames, load_or_build_frames, frames_cache_path, remove_stale_frames
+
+
+def long_frame():
+    times = pd.date_range('2023-01-01', periods=48, freq='h')
+    cells = [(51.0, 0.0), (51.0, 0.5), (51.5, 0.0)]
+    return pd.DataFrame({
+        'DateTime': np.repeat(times, len(cells)),
+        'Latitude': [lat for lat, _ in cells] * len(times),
+        'Longitude': [lon for _, lon in cells] * len(times),
+        'Solar_Irradiance': np.arange(len(times) * len(cells), dtype=float),
+    })
+
+
+def test_frames_hold_one_grid_per_timestamp():
+    data = long_frame()
+    frames = aggregate_frames(data)
+    assert frames['grid'].shape == (48, 2, 2)
+    assert frames['grid'][1, 1, 0] == 5 and np.isnan(frames['grid'][:, 1, 1]).all()
+
+    daily = aggregate_frames(data, 'D')
+    assert daily['grid'].shape == (2, 2, 2)
+    first_day = data[(data['DateTime'] < '2023-01-02') & (data['Latitude'] == 51.0) & (data['Longitude'] == 0.5)]
+    assert daily['grid'][0, 0, 1] == first_day['Solar_Irradiance'].mean()
+
+
+def test_frames_are_cached_per_version(tmp_path):
+    calls = []
+
+    def load_data():
+        calls.append(1)
+        return long_frame()
+
+    first = load_or_build_frames(load_data, '20230101_to_20230102_aaaa', 'D', str(tmp_path))
+    cached = load_or_build_frames(load_data, '20230101_to_20230102_aaaa', 'D', str(tmp_path))
+    assert len(calls) == 1 and np.array_equal(first['grid'], cached['grid'], equal_nan=True)
+    load_or_build_frames(load_data, '20230101_to_20230102_aaaa', 'D', str(tmp_path), refresh=True)
+    assert len(calls) == 2
+
+
+def test_stale_versions_are_removed(tmp_path):
+    cache = str(tmp_path)
+    load_or_build_frames(long_frame, '20230101_to_20230102_aaaa', None, cache)
+    load_or_build_frames(long_frame, '20230101_to_20230102_aaaa', 'D', cache)
+    load_or_build_frames(long_frame, '20230101_to_20230131_cccc', 'D', cache)
+    # Files that are not frames are left alone
+    os.makedirs(os.path.join(cache, 'responses'))
+
+    load_or_build_frames(long_frame, '20230101_to_20230102_bbbb', 'W', cache)
+    assert sorted(os.listdir(cache)) == sorted([
+        os.path.basename(frames_cache_path('20230101_to_20230102_bbbb', 'W')),
+        os.path.basename(frames_cache_path('20230101_to_20230131_cccc', 'D')),
+        'responses'])
+    assert remove_stale_frames('20230101_to_20230102_bbbb', cache) == 0
@@ -0,0 +1,59 @@
+import math
+from incremental_fetch import missing_ranges, update_series
+from power_simulator import PowerSimulator
+from storage import ParquetStorage
+from synthetic_data import generate_payload
+
+PARAMETERS = 'ALLSKY_SFC_SW_DWN,T2M'
+
+
+def stored_series(start_date='20230101', days=10):
+    return generate_payload(years=days / 365.25, parameters=PARAMETERS.split(','), start_date=start_date,
+                            gap_fraction=0.0, seed=0)
+
+
+def test_nothing_stored_is_one_range():
+    assert missing_ranges({}, '20230101', '20230110', PARAMETERS) == [('20230101', '20230110')]
+
+
+def test_only_the_missing_days_are_requested():
+    series = stored_series()
+    del series['T2M']['2023010312']
+    assert missing_ranges(series, '20221230', '20230112', PARAMETERS) == [
+        ('20221230', '20221231'), ('20230103', '20230103'), ('20230111', '20230112')]
+
+
+def test_old_gaps_are_not_requested_again():
+    series = stored_series()
+    series['ALLSKY_SFC_SW_DWN']['2023010105'] = -999
+    series['ALLSKY_SFC_SW_DWN']['2023010905'] = -999
+    assert missing_ranges(series, '20230101', '20230110', PARAMETERS, refetch_days=3) == [('20230109', '20230109')]
+    assert missing_ranges(series, '20230101', '20230110', PARAMETERS, refetch_days=None) == [
+        ('20230101', '20230101'), ('20230109', '20230109')]
+
+
+def test_ranges_are_split_into_chunks():
+    assert missing_ranges({}, '20230101', '20230110', PARAMETERS, max_chunk_days=4) == [
+        ('20230101', '20230104'), ('20230105', '20230108'), ('20230109', '20230110')]
+
+
+def test_parquet_keeps_hours_of_every_parameter(tmp_path):
+    path = str(tmp_path / 'series.parquet')
+    ParquetStorage().write_raw({'A': {'2023010100': 1.0}, 'B': {'2023010100': 2.0, '2023010101': 3.0}}, path)
+    data = ParquetStorage().read_raw(path)
+    assert data['B'] == {'2023010100': 2.0, '2023010101': 3.0}
+    assert math.isnan(data['A']['2023010101'])
+
+
+def test_update_series_only_fetches_new_days(tmp_path):
+    with PowerSimulator(gap_fraction=0.0) as simulator:
+        window, requests_made = update_series(51.5, 0.0, '20230101', '20230105', base_url=simulator.base_url,
+                                              data_folder=str(tmp_path))
+        assert requests_made == 1 and len(window['ALLSKY_SFC_SW_DWN']) == 5 * 24
+        _, requests_made = update_series(51.5, 0.0, '20230101', '20230105', base_url=simulator.base_url,
+                                         data_folder=str(tmp_path))
+        assert requests_made == 0
+        window, requests_made = update_series(51.5, 0.0, '20230103', '20230108', base_url=simulator.base_url,
+                                              data_folder=str(tmp_path))
+        assert requests_made == 1 and len(window['T2M']) == 6 * 24
+        assert simulator.stats()['requests'] == 2
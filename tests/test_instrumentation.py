@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+import pandas as pd
+from instrumentation import Metrics, timed
+
+
+def test_stages_and_counters_are_recorded():
+    metrics = Metrics(buckets=(0.01, 1.0))
+
+    @timed('clean', rows_counter='rows_cleaned', metrics=metrics)
+    def clean(rows):
+        return pd.DataFrame({'value': range(rows)})
+
+    clean(3)
+    clean(4)
+    with metrics.stage('sleep'):
+        time.sleep(0.02)
+    metrics.increment('requests', 2)
+
+    data = json.loads(metrics.to_json())
+    assert data['counters']['rows_cleaned'] == 7 and data['counters']['requests'] == 2
+    assert data['stages']['clean']['count'] == 2
+    # Buckets are cumulative
+    assert data['stages']['sleep']['buckets'] == {'0.01': 0, '1.0': 1}
+
+    text = metrics.to_prometheus()
+    assert 'solar_stage_duration_seconds_bucket{stage="sleep",le="+Inf"} 1' in text
+    assert 'solar_rows_cleaned_total 7' in text
+
+
+def test_concurrent_observations_are_not_lost():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(500):
+            with metrics.stage('fetch'):
+                pass
+            metrics.increment('requests')
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.to_dict()['stages']['fetch']['count'] == 4000
+    assert metrics.to_dict()['counters']['requests'] == 4000
+
+
+def test_only_slow_leaf_stages_are_profiled(tmp_path):
+    metrics = Metrics()
+    metrics.enable_profiling(0.01, str(tmp_path))
+    with metrics.stage('outer'):
+        with metrics.stage('slow'):
+            time.sleep(0.02)
+        with metrics.stage('fast'):
+            pass
+
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1 and profiles[0].startswith('slow_')
+    assert metrics.to_dict()['stages'].keys() == {'outer', 'slow', 'fast'}
+
+
+def test_samples_are_kept_only_while_collecting():
+    metrics = Metrics()
+    metrics.observe('fetch', 0.5)
+    metrics.collect_samples('fetch')
+    metrics.observe('fetch', 0.1)
+    metrics.observe('fetch', 0.3)
+    metrics.observe('clean', 1.0)
+    assert metrics.samples('fetch') == [0.1, 0.3] and metrics.samples('clean') == []
+    metrics.collect_samples()
+    metrics.observe('fetch', 0.2)
+    assert metrics.samples('fetch') == [] and metrics.to_dict()['stages']['fetch']['count'] == 4
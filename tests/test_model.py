@@ -0,0 +1,53 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from model import assign_season, feature_engineering, train_by_site_and_season, _fit_site, MIN_ROWS_PER_MODEL
+
+pytest.importorskip('sklearn')
+
+
+def site_frame(hours, latitude=51.0, start='2023-06-01', seed=0):
+    rng = np.random.default_rng(seed)
+    temperature = rng.normal(15, 5, hours)
+    zenith = rng.uniform(20, 80, hours)
+    return pd.DataFrame({
+        'DateTime': pd.date_range(start, periods=hours, freq='h'),
+        'Latitude': latitude, 'Longitude': 0.0,
+        'Temperature': temperature, 'Solar_zenith_angle': zenith,
+        'Solar_Irradiance': 100 + 4 * temperature - 3 * zenith + rng.normal(0, 2, hours),
+    })
+
+
+def test_seasons_follow_the_hemisphere():
+    df = assign_season(pd.DataFrame({'DateTime': pd.to_datetime(['2023-01-15', '2023-07-15', '2023-07-15']),
+                                     'Latitude': [51.0, 51.0, -33.0]}))
+    assert df['Season_Encoded'].tolist() == [1, 3, 1]
+
+
+def test_feature_engineering_drops_missing_and_zero_irradiance():
+    df = assign_season(site_frame(4))
+    df.loc[0, 'Solar_Irradiance'] = 0.0
+    df.loc[1, 'Temperature'] = np.nan
+    assert len(feature_engineering(df)) == 2
+
+
+def test_small_sites_are_skipped_without_warnings():
+    df = assign_season(site_frame(MIN_ROWS_PER_MODEL - 1))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert _fit_site(((51.0, 0.0), df)) == []
+
+    rows = _fit_site(((51.0, 0.0), assign_season(site_frame(MIN_ROWS_PER_MODEL))))
+    assert len(rows) == 1 and rows[0]['N_test'] >= 2 and np.isfinite(rows[0]['R2'])
+
+
+def test_one_model_per_site_and_season():
+    df = pd.concat([site_frame(24 * 40, 51.0, '2023-08-22'), site_frame(24 * 40, 52.0, '2023-08-22', seed=1)],
+                   ignore_index=True)
+    results = train_by_site_and_season(df, max_workers=2)
+    # 10 days of summer and 30 days of fall at both sites
+    assert sorted(zip(results['Latitude'], results['Season_Encoded'])) == [(51.0, 3), (51.0, 4), (52.0, 3), (52.0, 4)]
+    assert np.allclose(results['Coef_Temperature'], 4, atol=0.2)
+    assert np.allclose(results['Coef_Solar_zenith_angle'], -3, atol=0.2)
+    assert (results['N_train'] + results['N_test'] == [24 * 10, 24 * 30] * 2).all()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from model import RESULT_COLUMNS
+from model_registry import ModelRegistry, registry_path
+
+
+def results_table():
+    rows = []
+    for latitude, longitude in [(51.0, 0.0), (51.0, 1.0), (-33.0, 151.0)]:
+        for season in (1, 3):
+            rows.append({'Latitude': latitude, 'Longitude': longitude, 'Season_Encoded': season,
+                         'Intercept': 100 * season + latitude, 'Coef_Temperature': 2.0, 'Coef_Solar_zenith_angle': -1.0,
+                         'R2': 0.9, 'MAE': 1.0, 'MSE': 2.0, 'N_train': 80, 'N_test': 20})
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    registry = ModelRegistry.from_results(results_table(), '20230101_to_20231231')
+    path = registry.save(str(tmp_path))
+    assert path == registry_path('20230101_to_20231231', str(tmp_path))
+
+    loaded = ModelRegistry.load('20230101_to_20231231', str(tmp_path))
+    assert loaded.version == '20230101_to_20231231'
+    expected = results_table().sort_values(['Latitude', 'Longitude', 'Season_Encoded']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded.to_results(), expected, check_dtype=False)
+
+
+def test_nearest_site_lookup():
+    registry = ModelRegistry.from_results(results_table(), 'v')
+    assert registry.nearest_site(51.0, 1.0) == registry.nearest_sites([51.0], [1.0])[0]
+    sites = registry.nearest_sites([51.2, 50.9, -30.0], [0.1, 0.8, 150.0])
+    assert [(registry.latitudes[i], registry.longitudes[i]) for i in sites] == [(51.0, 0.0), (51.0, 1.0),
+                                                                                 (-33.0, 151.0)]
+
+
+def test_predictions_use_the_season_of_the_hemisphere():
+    registry = ModelRegistry.from_results(results_table(), 'v')
+    # January is winter (1) in London and summer (3) in Sydney
+    assert registry.predict(51.0, 0.0, pd.Timestamp('2024-01-15 12:00'), 10.0, 60.0) == 100 + 51 + 20 - 60
+    assert registry.predict(-33.0, 151.0, pd.Timestamp('2024-01-15 12:00'), 10.0, 60.0) == 300 - 33 + 20 - 60
+    # No spring model was trained
+    assert np.isnan(registry.predict(51.0, 0.0, pd.Timestamp('2024-04-15 12:00'), 10.0, 60.0))
+
+
+def test_batch_predictions_match_single_ones():
+    registry = ModelRegistry.from_results(results_table(), 'v')
+    latitudes = np.array([51.0, 51.1, -33.0, 50.8])
+    longitudes = np.array([0.0, 0.9, 151.0, 0.2])
+    datetimes = pd.to_datetime(['2024-01-15 12:00', '2024-07-01 09:00', '2024-07-01 09:00', '2024-12-01 13:00'])
+    temperatures = np.array([5.0, 20.0, 12.0, 3.0])
+
+    batch = registry.predict_batch(latitudes, longitudes, datetimes.to_numpy(), temperatures)
+    single = [registry.predict(lat, lon, when, temperature)
+              for lat, lon, when, temperature in zip(latitudes, longitudes, datetimes, temperatures)]
+    np.testing.assert_allclose(batch, single, rtol=1e-6)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from online_model import OnlineModels
+from batched_regression import design_matrix, FEATURES, TARGET, GROUP_COLUMNS
+from model import assign_season
+
+
+def multi_site_frame(sites=3, hours=24 * 120, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for site in range(sites):
+        temperature = rng.normal(10 + site, 5, hours)
+        zenith = rng.uniform(20, 90, hours)
+        irradiance = 50 + 3 * temperature - 2 * zenith + rng.normal(0, 5, hours)
+        frames.append(pd.DataFrame({
+            'DateTime': pd.date_range('2023-01-01', periods=hours, freq='h'),
+            'Latitude': 50.0 + site, 'Longitude': 0.0,
+            'Temperature': temperature, 'Solar_zenith_angle': zenith, 'Solar_Irradiance': irradiance,
+        }))
+    return assign_season(pd.concat(frames, ignore_index=True))
+
+
+def batch_fit(df):
+    coefficients = {}
+    for key, group in df.groupby(GROUP_COLUMNS):
+        x = design_matrix(group[FEATURES].to_numpy())
+        coefficients[key] = np.linalg.lstsq(x, group[TARGET].to_numpy(), rcond=None)[0]
+    return coefficients
+
+
+def test_daily_updates_match_a_batch_fit():
+    df = multi_site_frame()
+    models = OnlineModels()
+    # Overlapping two-day windows: the repeated day must not be counted twice
+    days = df['DateTime'].dt.floor('D')
+    for day in days.unique():
+        models.update(df[(days >= day - pd.Timedelta(days=1)) & (days <= day)])
+
+    results = models.results().set_index(GROUP_COLUMNS)
+    expected = batch_fit(df)
+    assert len(results) == len(expected)
+    for key, coefficients in expected.items():
+        row = results.loc[key]
+        np.testing.assert_allclose(row[['Intercept', 'Coef_Temperature', 'Coef_Solar_zenith_angle']].to_numpy(
+            dtype=float), coefficients, rtol=1e-8)
+        assert row['N_train'] == ((df[GROUP_COLUMNS] == key).all(axis=1)).sum()
+
+
+def test_untouched_groups_are_left_alone():
+    df = multi_site_frame()
+    models = OnlineModels()
+    models.update(df[df['DateTime'] < '2023-02-01'])
+    before = {state: getattr(models, state).copy() for state in OnlineModels.STATE}
+
+    # A later batch for one site only changes that site's winter group
+    site = df[(df['Latitude'] == 51.0) & (df['DateTime'] >= '2023-02-01') & (df['DateTime'] < '2023-02-02')]
+    assert models.update(site) == 24
+    changed = np.flatnonzero(models.n_seen != before['n_seen'])
+    assert models.keys.iloc[changed][GROUP_COLUMNS].values.tolist() == [[51.0, 0.0, site['Season_Encoded'].iloc[0]]]
+    unchanged = np.setdiff1d(np.arange(len(models)), changed)
+    for state in OnlineModels.STATE:
+        np.testing.assert_array_equal(getattr(models, state)[unchanged], before[state][unchanged])
+    assert models.update(site) == 0
+
+
+def test_save_and_load(tmp_path):
+    df = multi_site_frame(sites=2, hours=24 * 30)
+    models = OnlineModels(half_life_hours=24 * 7, name='test')
+    models.update(df[df['DateTime'] < '2023-01-20'])
+    models.save(str(tmp_path))
+
+    loaded = OnlineModels.load('test', str(tmp_path))
+    assert loaded.half_life_hours == 24 * 7 and len(loaded) == len(models)
+    rest = df[df['DateTime'] >= '2023-01-20']
+    models.update(rest)
+    loaded.update(rest)
+    pd.testing.assert_frame_equal(loaded.results(), models.results())
+    assert OnlineModels.load('missing', str(tmp_path)).half_life_hours is None
@@ -0,0 +1,70 @@
+import threading
+import time
+from cube_store import CubeStore
+from data_cleaner import clean_solar_data_map
+from pipeline import stream_cleaned, run_pipeline, file_sink, cube_sink
+from power_simulator import PowerSimulator
+from storage import list_cleaned, load_cleaned
+
+CELLS = [(51.0, 0.0), (51.0, 0.5), (51.5, 0.0), (51.5, 0.5)]
+
+
+def test_stream_yields_cleaned_cells():
+    with PowerSimulator(latency=0.0, gap_fraction=0.0, seed=0) as simulator:
+        cells = list(stream_cleaned(CELLS, '20230101', '20230103', max_workers=2, base_url=simulator.base_url))
+    assert sorted((lat, lon) for lat, lon, _ in cells) == CELLS
+    for _, _, df in cells:
+        assert len(df) == 72 and 'Solar_Irradiance' in df.columns
+
+
+def test_failed_cells_are_skipped_and_counted(tmp_path):
+    def clean(data):
+        raise ValueError('unreadable response')
+
+    with PowerSimulator(latency=0.0, gap_fraction=0.0, seed=0) as simulator:
+        counts = run_pipeline(CELLS, '20230101', '20230103', file_sink('20230101', '20230103', str(tmp_path)),
+                              clean=clean, max_workers=2, base_url=simulator.base_url)
+    assert counts == {'persisted': 0, 'failed': len(CELLS)}
+    assert list_cleaned('20230101', '20230103', str(tmp_path)) == []
+
+
+def test_file_sink_persists_every_cell(tmp_path):
+    with PowerSimulator(latency=0.0, gap_fraction=0.0, seed=0) as simulator:
+        counts = run_pipeline(CELLS, '20230101', '20230103', file_sink('20230101', '20230103', str(tmp_path)),
+                              max_workers=2, base_url=simulator.base_url)
+    assert counts == {'persisted': len(CELLS), 'failed': 0}
+    stored = list_cleaned('20230101', '20230103', str(tmp_path))
+    assert sorted((lat, lon) for lat, lon, _ in stored) == CELLS
+    assert len(load_cleaned(51.5, 0.5, '20230101', '20230103', str(tmp_path))) == 72
+
+
+def test_cube_sink_writes_the_store(tmp_path):
+    cube = CubeStore.create(str(tmp_path), '20230101', '20230103', [51.0, 51.5], [0.0, 0.5])
+    with PowerSimulator(latency=0.0, gap_fraction=0.0, seed=0) as simulator:
+        run_pipeline(CELLS, '20230101', '20230103', cube_sink(cube), max_workers=2, base_url=simulator.base_url)
+    assert all(cube.has_cell(lat, lon) for lat, lon in CELLS)
+    assert cube.read_cell(51.0, 0.5).notna().any()
+
+
+def test_slow_sink_bounds_the_queue(tmp_path):
+    cells = [(51.0, 0.25 * i) for i in range(12)]
+    sunk = []
+    sunk_when_cleaned = []
+    lock = threading.Lock()
+
+    def clean(data):
+        with lock:
+            sunk_when_cleaned.append(len(sunk))
+        return clean_solar_data_map(data)
+
+    def sink(latitude, longitude, df):
+        with lock:
+            sunk.append((latitude, longitude))
+        time.sleep(0.02)
+
+    with PowerSimulator(latency=0.0, gap_fraction=0.0, seed=0) as simulator:
+        counts = run_pipeline(cells, '20230101', '20230102', sink, clean=clean, max_workers=2, queue_size=2,
+                              base_url=simulator.base_url)
+    assert counts['persisted'] == len(cells)
+    # Cleaning never gets further ahead of the sink than the queue, the cell waiting to be queued and its own
+    assert all(cleaned - started <= 2 + 2 for cleaned, started in enumerate(sunk_when_cleaned))
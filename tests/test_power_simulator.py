@@ -0,0 +1,45 @@
+import time
+import requests
+from power_simulator import PowerSimulator
+from load_test import run_load_test
+
+QUERY = {'parameters': 'ALLSKY_SFC_SW_DWN', 'community': 're', 'latitude': 51.5, 'longitude': 0.0,
+         'start': '20230101', 'end': '20230101', 'format': 'JSON'}
+
+
+def timed_get(simulator):
+    started = time.perf_counter()
+    response = requests.get(simulator.base_url, params=QUERY, timeout=10)
+    return response, time.perf_counter() - started
+
+
+def test_points_snap_to_the_nearest_pixel_centre():
+    simulator = PowerSimulator(gap_fraction=0.0)
+    try:
+        assert simulator._snap(50.2, 0.3) == (50.0, 0.0)
+        assert simulator._snap(50.3, 0.4) == (50.5, 0.625)
+        assert simulator._snap(-0.2, -0.3) == (0.0, 0.0)
+    finally:
+        simulator.server.server_close()
+
+
+def test_only_successful_responses_are_delayed():
+    with PowerSimulator(latency=0.3, throttle_rate=1.0, gap_fraction=0.0, seed=0) as simulator:
+        response, elapsed = timed_get(simulator)
+        assert response.status_code == 429 and elapsed < 0.2
+    with PowerSimulator(latency=0.3, error_rate=1.0, gap_fraction=0.0, seed=0) as simulator:
+        response, elapsed = timed_get(simulator)
+        assert response.status_code == 500 and elapsed < 0.2
+    with PowerSimulator(latency=0.3, gap_fraction=0.0, seed=0) as simulator:
+        response, elapsed = timed_get(simulator)
+        assert response.status_code == 200 and elapsed >= 0.3
+
+
+def test_load_test_reports_client_latency():
+    report = run_load_test(51.5, 0.0, '20230101', '20230102', area_lat=0.1, area_long=0.0, interval=0.1,
+                           max_workers=2, latency=0.05, gap_fraction=0.0, seed=0)
+    assert report['persisted'] == report['cells'] == report['requests']
+    # The client waits for the server, and more
+    assert report['server_p50_ms'] >= 50
+    assert report['client_p50_ms'] >= report['server_p50_ms']
+    assert report['client_max_ms'] >= report['client_p99_ms'] >= report['client_p50_ms']
@@ -0,0 +1,71 @@
+import os
+import time
+import response_cache
+from response_cache import ResponseCache
+from data_scraper_nasa import PARAMETERS, PARAMETERS_WITHOUT_SZA
+from synthetic_data import generate_payload
+
+
+def test_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    data = generate_payload(years=0.01, seed=3)
+    key = cache.make_key(51.5, 0.0, '20230101', '20230103')
+    assert cache.get(key) is None
+    cache.put(key, data)
+    assert cache.get(key) == data
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_keys_tell_requests_apart():
+    key = ResponseCache.make_key(51.5, 0.0, '20230101', '20230103')
+    # np.arange noise on the coordinates does not matter, the endpoint and the parameters do
+    assert ResponseCache.make_key(51.500000000001, 0.0, '20230101', '20230103') == key
+    assert ResponseCache.make_key(51.5, 0.0, '20230101', '20230103', base_url='http://127.0.0.1:8000') != key
+    assert ResponseCache.make_key(51.5, 0.0, '20230101', '20230103', parameters=PARAMETERS_WITHOUT_SZA) != key
+    assert ResponseCache.make_key(51.5, 0.0, '20230101', '20230103', parameters=PARAMETERS) == key
+
+
+def test_evicts_least_recently_used(tmp_path):
+    data = generate_payload(years=0.01, seed=4)
+    cache = ResponseCache(str(tmp_path))
+    keys = [cache.make_key(50.0 + i, 0.0, '20230101', '20230103') for i in range(3)]
+    for key in keys:
+        cache.put(key, data)
+    entry_size = cache.stats()['size_bytes'] // 3
+
+    small = ResponseCache(str(tmp_path), max_bytes=2 * entry_size + 1)
+    small.get(keys[0])
+    small.evict()
+    assert small.get(keys[0]) is not None
+    assert small.get(keys[1]) is None
+
+
+def test_expired_entries_are_deleted_when_read(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age_days=1)
+    key = cache.make_key(51.5, 0.0, '20230101', '20230103')
+    cache.put(key, generate_payload(years=0.01, seed=5))
+    path = tmp_path / f"{key}.json"
+    old = time.time() - 2 * 86400
+    os.utime(path, (old, old))
+
+    assert cache.get(key) is None
+    assert not path.exists()
+    assert cache.stats()['size_bytes'] == 0
+
+
+def test_size_is_kept_in_the_index(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    cache.put(cache.make_key(51.5, 0.0, '20230101', '20230103'), generate_payload(years=0.01, seed=6))
+    size = cache.stats()['size_bytes']
+    assert size > 0
+
+    # A new instance takes the size from the index instead of listing the entries
+    def fail(self):
+        raise AssertionError("entries listed")
+    monkeypatch.setattr(ResponseCache, '_entries', fail)
+    assert ResponseCache(str(tmp_path)).stats()['size_bytes'] == size
+
+
+def test_default_folder_is_separate_from_derived_data():
+    import heatmap_frames
+    assert os.path.dirname(response_cache.CACHE_FOLDER) == heatmap_frames.CACHE_FOLDER
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pandas as pd
+from rollups import RollupStore
+from storage import BACKENDS
+
+
+def hourly_frame(start='2023-01-01', days=70, latitude=51.0, seed=0):
+    times = pd.date_range(start, periods=24 * days, freq='h')
+    values = np.clip(np.random.default_rng(seed).normal(100, 80, len(times)), 0, None)
+    return pd.DataFrame({'DateTime': times, 'Solar_Irradiance': values, 'Latitude': latitude, 'Longitude': 0.0})
+
+
+def assert_same_tables(store, expected):
+    for table in ('daily', 'monthly', 'seasonal'):
+        pd.testing.assert_frame_equal(getattr(store, table).reset_index(drop=True),
+                                      getattr(expected, table).reset_index(drop=True), check_dtype=False)
+
+
+def test_late_and_overlapping_rows_match_a_single_update(tmp_path):
+    df = pd.concat([hourly_frame(), hourly_frame(latitude=-33.0, seed=1)], ignore_index=True)
+    expected = RollupStore(folder=str(tmp_path / 'expected'))
+    assert expected.update(df) == len(df)
+
+    store = RollupStore(folder=str(tmp_path / 'store'))
+    late = df['DateTime'].between('2023-01-10 05:00', '2023-02-03 17:00')
+    assert store.update(df[~late]) == (~late).sum()
+    # A late backfill lands in days and months that were already aggregated
+    assert store.update(df[late]) == late.sum()
+    # Overlapping windows do not count any hour twice
+    assert store.update(df.iloc[::3]) == 0
+    assert_same_tables(store, expected)
+
+
+def test_tables_survive_a_reload(tmp_path):
+    store = RollupStore(folder=str(tmp_path))
+    df = hourly_frame()
+    store.update(df.iloc[:500])
+    store.save()
+
+    store = RollupStore(folder=str(tmp_path))
+    assert store.update(df) == len(df) - 500
+    expected = RollupStore(folder=str(tmp_path / 'expected'))
+    expected.update(df)
+    assert_same_tables(store, expected)
+    assert store.season_average(51.0, 0.0).index.tolist() == [1, 2]
+
+
+def test_configured_format_is_loaded_first(tmp_path, monkeypatch):
+    store = RollupStore(folder=str(tmp_path))
+    store.update(hourly_frame(days=3))
+    monkeypatch.setenv('SOLAR_STORAGE_FORMAT', 'json')
+    store.save()
+    monkeypatch.setenv('SOLAR_STORAGE_FORMAT', 'parquet')
+    store.update(hourly_frame(start='2023-01-04', days=1))
+    store.save()
+
+    # Both formats are on disk, the parquet tables hold the newer day
+    assert os.path.exists(os.path.join(tmp_path, 'rollups', 'daily.json'))
+    assert len(RollupStore(folder=str(tmp_path)).daily) == 4
+    monkeypatch.setenv('SOLAR_STORAGE_FORMAT', 'json')
+    assert len(RollupStore(folder=str(tmp_path)).daily) == 3
+
+
+def test_former_watermarks_are_migrated(tmp_path):
+    df = hourly_frame(days=3)
+    store = RollupStore(folder=str(tmp_path))
+    store.update(df.iloc[:36])
+    # Layout of the stores that kept one watermark per site
+    folder = os.path.join(tmp_path, 'rollups')
+    os.makedirs(folder)
+    parquet = BACKENDS['parquet']
+    parquet.write_frame(store.daily.drop(columns='Hours'), os.path.join(folder, 'daily.parquet'), float32=False)
+    parquet.write_frame(pd.DataFrame({'Latitude': [51.0], 'Longitude': [0.0],
+                                      'Last_DateTime': [df['DateTime'].iloc[35]]}),
+                        os.path.join(folder, 'watermarks.parquet'))
+
+    store = RollupStore(folder=str(tmp_path))
+    assert store.update(df) == len(df) - 36
+    assert store.daily['Count'].tolist() == [24, 24, 24]
+    store.save()
+    assert not os.path.exists(os.path.join(folder, 'watermarks.parquet'))
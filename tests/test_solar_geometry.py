@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from solar_geometry import solar_position, solar_zenith_angle, extraterrestrial_irradiance, fill_solar_zenith, \
+    validate_against_nasa
+
+
+def test_solar_noon_zenith():
+    # Summer solstice at solar noon on the Greenwich meridian: zenith = latitude - declination (23.44°)
+    noon = np.datetime64('2023-06-21T12:00')
+    assert solar_zenith_angle(noon, 51.5, 0.0) == pytest.approx(51.5 - 23.44, abs=0.5)
+    assert solar_zenith_angle(noon, 23.44, 0.0) == pytest.approx(0.0, abs=0.5)
+    # Midnight is below the horizon
+    assert solar_zenith_angle(np.datetime64('2023-06-21T00:00'), 51.5, 0.0) > 90
+
+
+def test_local_solar_time_follows_the_longitude():
+    # 12:00 local solar time at 90°E is 06:00 UTC
+    local = solar_zenith_angle(np.datetime64('2023-03-20T12:00'), 10.0, 90.0, 'LST')
+    utc = solar_zenith_angle(np.datetime64('2023-03-20T06:00'), 10.0, 90.0, 'UTC')
+    assert local == pytest.approx(utc)
+    with pytest.raises(ValueError):
+        solar_position(np.datetime64('2023-03-20T12:00'), 10.0, 90.0, 'CET')
+
+
+def test_inputs_broadcast_over_a_grid():
+    times = pd.date_range('2023-01-01', periods=48, freq='h').to_numpy()
+    latitudes = np.array([-30.0, 0.0, 30.0, 60.0])
+    grid = solar_zenith_angle(times[:, None], latitudes[None, :], 5.0)
+    assert grid.shape == (48, 4)
+    np.testing.assert_allclose(grid[:, 2], solar_zenith_angle(times, 30.0, 5.0))
+
+    position = solar_position(times, 30.0, 5.0)
+    assert ((position['azimuth'] >= 0) & (position['azimuth'] < 360)).all()
+
+
+def test_extraterrestrial_irradiance_is_zero_at_night():
+    times = pd.date_range('2023-01-03', periods=24, freq='h').to_numpy()
+    irradiance = extraterrestrial_irradiance(times, 51.5, 0.0)
+    zenith = solar_zenith_angle(times, 51.5, 0.0)
+    assert (irradiance[zenith >= 90] == 0).all() and (irradiance[zenith < 90] > 0).all()
+    # Near perihelion the top of atmosphere irradiance is a few percent above the solar constant
+    assert extraterrestrial_irradiance(np.datetime64('2023-01-03T12:00'), -22.8, 0.0) == pytest.approx(1361 * 1.034,
+                                                                                                        rel=0.01)
+
+
+def test_fill_only_missing_values():
+    df = pd.DataFrame({'DateTime': pd.date_range('2023-05-01', periods=24, freq='h'),
+                       'Solar_zenith_angle': np.full(24, 45.0)})
+    df.loc[3:5, 'Solar_zenith_angle'] = np.nan
+    fill_solar_zenith(df, 51.5, 0.0)
+    assert (df.loc[[0, 1, 2, 6], 'Solar_zenith_angle'] == 45.0).all()
+    computed = solar_zenith_angle(df['DateTime'], 51.5, 0.0, 'LST', 0.5)
+    np.testing.assert_allclose(df.loc[3:5, 'Solar_zenith_angle'], computed[3:6])
+
+    assert validate_against_nasa(fill_solar_zenith(df, 51.5, 0.0, replace=True), 51.5, 0.0) == {
+        'mean_abs_diff': 0.0, 'max_abs_diff': 0.0, 'hours': 24}
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from spatial_index import SpatialIndex, haversine_km, index_path
+from storage import data_version
+from synthetic_data import generate_grid, write_cleaned_grid
+
+START, END = '20230101', '20230102'
+
+
+@pytest.fixture
+def data_folder(tmp_path):
+    write_cleaned_grid(generate_grid(9, years=2 / 365.25, start_date=START), START, END, str(tmp_path))
+    return str(tmp_path)
+
+
+def test_queries(data_folder):
+    index = SpatialIndex.build(START, END, data_folder)
+    assert len(index) == 9
+
+    indices, distances = index.nearest(50.6, 0.4, k=2)
+    assert index.cells(indices)[0][:2] == (50.5, 0.5)
+    assert distances[0] == pytest.approx(haversine_km(50.6, 0.4, 50.5, 0.5)) and distances[0] <= distances[1]
+    assert len(index.within_radius(50.5, 0.5, 60)[0]) == 5
+    assert sorted(index.cells(index.bbox(50.0, 50.5, 0.0, 0.5))) == sorted(
+        index.cells(index.nearest(50.25, 0.25, k=4)[0]))
+
+    # Half way between two cells is their mean
+    series = index.interpolate(50.25, 0.0)
+    frame = index.load_cells(index.bbox(50.0, 50.5, 0.0, 0.0), ['DateTime', 'Solar_Irradiance'])
+    expected = frame.groupby('DateTime')['Solar_Irradiance'].mean()
+    np.testing.assert_allclose(series.to_numpy(), expected.to_numpy(), rtol=1e-5)
+
+
+def test_index_is_rebuilt_only_when_the_indexed_files_change(data_folder):
+    index = SpatialIndex.load_or_build(START, END, data_folder)
+    path = index_path(data_version(START, END), data_folder)
+    saved = os.path.getmtime(path)
+
+    # Unrelated writes to the data folder keep the saved index
+    with open(os.path.join(data_folder, 'notes.txt'), 'w') as file:
+        file.write('unrelated')
+    os.utime(path, (saved - 100, saved - 100))
+    assert len(SpatialIndex.load_or_build(START, END, data_folder)) == len(index)
+    assert os.path.getmtime(path) == saved - 100
+
+    # A removed cell file does not
+    os.remove(index.cells([0])[0][2])
+    assert len(SpatialIndex.load_or_build(START, END, data_folder)) == len(index) - 1
+    assert os.path.getmtime(path) > saved - 100
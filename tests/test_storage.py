@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from storage import save_raw, load_raw, save_cleaned, load_cleaned, save_series, load_series, list_cleaned, \
+    migrate_json_files, raw_data_path, series_data_path
+from synthetic_data import generate_payload
+
+
+def cleaned_frame():
+    return pd.DataFrame({'DateTime': pd.date_range('2023-01-01', periods=48, freq='h'),
+                         'Solar_Irradiance': np.linspace(0, 470, 48)})
+
+
+@pytest.mark.parametrize('storage_format', ['json', 'parquet'])
+def test_round_trips(tmp_path, storage_format):
+    raw = generate_payload(years=0.01, seed=0)
+    save_raw(raw, 51.5, 0.0, '20230101', '20230104', storage_format, str(tmp_path))
+    loaded = load_raw(51.5, 0.0, '20230101', '20230104', str(tmp_path))
+    assert loaded.keys() == raw.keys()
+    assert np.allclose(list(loaded['T2M'].values()), list(raw['T2M'].values()), atol=1e-4)
+
+    save_cleaned(cleaned_frame(), 51.5, 0.0, '20230101', '20230102', storage_format, str(tmp_path))
+    pd.testing.assert_frame_equal(load_cleaned(51.5, 0.0, '20230101', '20230102', str(tmp_path)), cleaned_frame(),
+                                  check_dtype=False, check_index_type=False)
+
+
+def test_format_is_read_when_writing(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOLAR_STORAGE_FORMAT', 'json')
+    save_cleaned(cleaned_frame(), 51.5, 0.0, '20230101', '20230102', data_folder=str(tmp_path))
+    monkeypatch.setenv('SOLAR_STORAGE_FORMAT', 'parquet')
+    save_cleaned(cleaned_frame(), 51.5, 0.0, '20230101', '20230102', data_folder=str(tmp_path))
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == ['.json', '.parquet']
+    # The configured format wins when a cell is stored in both
+    assert list_cleaned('20230101', '20230102', str(tmp_path))[0][2].endswith('.parquet')
+
+
+def test_raw_json_keeps_the_indented_layout(tmp_path):
+    save_raw({'T2M': {'2023010100': 1.5}}, 51.5, 0.0, '20230101', '20230101', 'json', str(tmp_path))
+    with open(raw_data_path(51.5, 0.0, '20230101', '20230101', 'json', str(tmp_path))) as file:
+        assert file.read().startswith('{\n    "T2M"')
+
+
+def test_migration_covers_series(tmp_path):
+    raw = {'T2M': {'2023010100': 1.5, '2023010101': 2.5}}
+    save_raw(raw, 51.5, 0.0, '20230101', '20230101', 'json', str(tmp_path))
+    save_series(raw, 51.5, 0.0, 'json', str(tmp_path))
+    save_cleaned(cleaned_frame(), 51.5, 0.0, '20230101', '20230102', 'json', str(tmp_path))
+
+    assert migrate_json_files(str(tmp_path), remove_json=True) == 3
+    assert not list(tmp_path.rglob('*.json'))
+    assert load_series(51.5, 0.0, str(tmp_path)) == raw
+    assert series_data_path(51.5, 0.0, 'parquet', str(tmp_path)).endswith('.parquet')
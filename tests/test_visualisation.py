@@ -0,0 +1,42 @@
+import os
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+matplotlib.use('Agg')
+from visualisation import downsample, render_site_season_plots  # noqa: E402
+
+
+def test_downsample_keeps_order_and_pairs():
+    x = np.arange(1000)
+    sampled_x, sampled_y = downsample(x, x * 2, max_points=100)
+    assert len(sampled_x) == 100 and (np.diff(sampled_x) > 0).all()
+    assert np.array_equal(sampled_y, sampled_x * 2)
+    assert len(downsample(x, x, max_points=None)[0]) == 1000
+
+
+def test_plots_are_rendered_without_a_display(tmp_path):
+    pytest.importorskip('PIL')
+    rng = np.random.default_rng(0)
+    times = pd.date_range('2023-05-25', periods=24 * 14, freq='h')
+    df = pd.DataFrame({
+        'DateTime': np.tile(times, 2),
+        'Latitude': np.repeat([51.0, 52.0], len(times)),
+        'Longitude': 0.0,
+        'Season_Encoded': np.tile(np.where(times.month == 5, 2, 3), 2),
+        'Temperature': rng.normal(15, 4, 2 * len(times)),
+        'Solar_Irradiance': rng.uniform(0, 500, 2 * len(times)),
+    })
+    # Spring has a model at one site only
+    results = pd.DataFrame([
+        {'Latitude': latitude, 'Longitude': 0.0, 'Season_Encoded': season, 'Intercept': 1.0, 'Coef_Temperature': 2.0,
+         'Coef_Solar_zenith_angle': -1.0, 'R2': 0.5, 'MAE': 1.0, 'MSE': 2.0, 'N_train': 10, 'N_test': 2}
+        for latitude, season in [(51.0, 2), (51.0, 3), (52.0, 3)]])
+
+    saved = render_site_season_plots(df, results, str(tmp_path), max_workers=2, max_points=50)
+    assert sorted('lat_' + os.path.basename(path).partition('_lat_')[2] for path in saved) == [
+        'lat_51.0_long_0.0_2.png', 'lat_51.0_long_0.0_3.png', 'lat_52.0_long_0.0_3.png']
+    from PIL import Image
+    with Image.open(saved[0]) as image:
+        assert image.size == (1200, 600)